@@ -3,8 +3,10 @@ from sqlalchemy.orm import sessionmaker
 from os import getcwd, path
 
 class DataHandler:
-    def __init__(self, db_path='database/configs/flights_master.db'):
+    def __init__(self, db_path='database/configs/flights_master.db', read_only=False):
         self.__connection_string = f'sqlite:///{path.join(getcwd(), db_path)}'
+        if read_only:
+            self.__connection_string = f'sqlite:///file:{path.join(getcwd(), db_path)}?mode=ro&uri=true'
         self.__engine = self.__create_db_engine()
         self.session = None
         
@@ -1,7 +1,6 @@
-from repository.logbook_repo import LbRepo
+from database.repository.report_repo import RpRepo
 
-repo = LbRepo()
+repo = RpRepo()
 
-teste = repo.select()
-
-print (teste)
\ No newline at end of file
+for teste in repo.select_df(chunksize=500):
+    print (teste)
@@ -0,0 +1,22 @@
+from database.configs.base import Base
+from sqlalchemy import Column, Integer, String, Numeric
+
+class Battery(Base):
+    #declarative base
+    __tablename__='battery'
+    
+    uid = Column(Integer, primary_key=True, nullable=False)
+    timestamp = Column(String, unique=True)
+    drone_uid = Column(String)
+    energy_wh = Column(Numeric)
+    consumed_mah = Column(Numeric)
+    avg_curr = Column(Numeric)
+    peak_curr = Column(Numeric)
+    min_volt = Column(Numeric)
+    volt_sag = Column(Numeric)
+    resistance_mohm = Column(Numeric)
+    distance_km = Column(Numeric)
+    wh_per_km = Column(Numeric)
+    
+    def __repr__(self):
+        return f"Total de registros: {self.uid}"
@@ -0,0 +1,18 @@
+from database.configs.base import Base
+from sqlalchemy import Column, Integer, String, Float
+
+class ExifCache(Base):
+    #declarative base
+    __tablename__='exif_cache'
+    
+    path = Column(String, primary_key=True, nullable=False)
+    size = Column(Integer, nullable=False)
+    mtime = Column(Float, nullable=False)
+    iso = Column(Integer)
+    shutter = Column(String)
+    copyright = Column(String)
+    artist = Column(String)
+    last_used = Column(Float, nullable=False)
+    
+    def __repr__(self):
+        return f"{self.path}"
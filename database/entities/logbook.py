@@ -1,4 +1,4 @@
-from configs.base import Base
+from database.configs.base import Base
 from sqlalchemy import Column, Integer, Numeric, String
 
 class Report(Base):
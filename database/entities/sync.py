@@ -0,0 +1,38 @@
+from database.configs.base import Base
+from sqlalchemy import DDL, Column, Integer, String, event
+
+class ChangeLog(Base):
+    #declarative base
+    __tablename__='change_log'
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String, nullable=False)
+    row_uid = Column(Integer, nullable=False)
+    operation = Column(String(1), nullable=False)
+
+    def __repr__(self):
+        return f"Total de registros: {self.seq}"
+
+class SyncState(Base):
+    #declarative base
+    __tablename__='sync_state'
+
+    endpoint = Column(String, primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"{self.endpoint}: {self.last_seq}"
+
+# tables whose changes are tracked for the delta sync
+TRACKED_TABLES = ["report", "motors"]
+
+# triggers are installed (and existing rows seeded) together with the change log
+for table in TRACKED_TABLES:
+    event.listen(ChangeLog.__table__, "after_create", DDL(
+        f"INSERT INTO change_log (table_name, row_uid, operation) SELECT '{table}', uid, 'U' FROM {table} ORDER BY uid"
+    ))
+    for action, row, op in [("INSERT", "NEW", "U"), ("UPDATE", "NEW", "U"), ("DELETE", "OLD", "D")]:
+        event.listen(ChangeLog.__table__, "after_create", DDL(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_{action.lower()}_log AFTER {action} ON {table} "
+            f"BEGIN INSERT INTO change_log (table_name, row_uid, operation) VALUES ('{table}', {row}.uid, '{op}'); END"
+        ))
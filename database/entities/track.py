@@ -0,0 +1,21 @@
+from database.configs.base import Base
+from sqlalchemy import Column, Integer, String, Float, LargeBinary
+
+class Track(Base):
+    #declarative base
+    __tablename__='track'
+    
+    uid = Column(Integer, primary_key=True, nullable=False)
+    timestamp = Column(String, unique=True)
+    drone_uid = Column(String)
+    name = Column(String)
+    style = Column(String)
+    min_lon = Column(Float)
+    min_lat = Column(Float)
+    max_lon = Column(Float)
+    max_lat = Column(Float)
+    points = Column(Integer)
+    coords = Column(LargeBinary)  # float64 (lon, lat) pairs, full resolution
+    
+    def __repr__(self):
+        return f"Total de registros: {self.uid}"
@@ -0,0 +1,301 @@
+import io
+import os
+import json
+import sqlite3
+import threading
+import pandas as pd
+from argparse import ArgumentParser
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from database.repository.report_repo import RpRepo
+from database.repository.motors_repo import MtRepo
+from database.repository.battery_repo import BtRepo
+from sqlalchemy.exc import OperationalError
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class QueryService:
+    def __init__(self, max_entries=256, db_path="database/configs/flights_master.db"):
+        """
+         Initialize the object. It answers dashboard queries from a read-only
+         connection and caches the results until the database changes, so
+         dashboard refreshes never contend with the ingest process.
+
+         @param max_entries - maximum number of cached results
+         @param db_path - sqlite database file watched for changes
+        """
+        self.max_entries = max_entries
+        # data_version is per connection, so the same one is kept open
+        self._version = sqlite3.connect(
+            f"file:{os.path.join(os.getcwd(), db_path)}?mode=ro", uri=True, check_same_thread=False
+        )
+        self._rp_repo = RpRepo(read_only=True)
+        self._mt_repo = MtRepo(read_only=True)
+        self._bt_repo = BtRepo(read_only=True)
+        self._cache = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def generation(self):
+        """
+         Cheap change marker of the database: SQLite's data_version, which
+         changes whenever another connection commits, so inserted flights,
+         re-scored statuses (ruleengine --write) and deletes all count.
+         Callers hold self._lock, as the connection is shared.
+
+         @return int
+        """
+        return self._version.execute("PRAGMA data_version").fetchone()[0]
+
+    def reports(self, drone_uid, start=None, end=None):
+        """
+         Report history of a drone, oldest first.
+
+         @param drone_uid - serial number of the drone
+         @param start - only flights at or after this unix timestamp
+         @param end - only flights before this unix timestamp
+
+         @return pd.DataFrame
+        """
+        df = self._rp_repo.select_df(drone_uid=drone_uid, start=start, end=end)
+        return df.sort_values("timestamp", key=lambda t: t.astype(float), ignore_index=True)
+
+    def status(self, drone_uid):
+        """
+         Latest health status of a drone, with the motors PWM of that flight.
+
+         @param drone_uid - serial number of the drone
+
+         @return pd.DataFrame with a single row (empty if the drone is unknown)
+        """
+        reports = self.reports(drone_uid).tail(1)
+        motors = self._mt_repo.select_df(
+            drone_uid=drone_uid,
+            columns=["timestamp", "m1_avg_pwm", "m2_avg_pwm", "m3_avg_pwm", "m4_avg_pwm"],
+        )
+        return reports.merge(motors, on="timestamp", how="left")
+
+    def battery(self, drone_uid, start=None, end=None):
+        """
+         Battery metrics history of a drone, oldest first, to trend pack health.
+
+         @param drone_uid - serial number of the drone
+         @param start - only flights at or after this unix timestamp
+         @param end - only flights before this unix timestamp
+
+         @return pd.DataFrame (empty until the first flight with battery data)
+        """
+        try:
+            df = self._bt_repo.select_df(drone_uid=drone_uid, start=start, end=end)
+        except OperationalError:
+            # the battery table is created by the first ingest that writes to it
+            return pd.DataFrame()
+        return df.sort_values("timestamp", key=lambda t: t.astype(float), ignore_index=True)
+
+    def fleet(self):
+        """
+         Fleet summary: flights, last flight and latest statuses per drone,
+         plus the number of flights with WARN or FAIL results.
+
+         @return pd.DataFrame with one row per drone
+        """
+        df = self._rp_repo.select_df(
+            columns=["timestamp", "drone_uid", "motor_status", "imu_status", "vcc_status"]
+        )
+        df["timestamp"] = df["timestamp"].astype(float)
+        df = df.sort_values("timestamp", kind="mergesort")
+        statuses = df[["motor_status", "imu_status", "vcc_status"]]
+        df["issues"] = statuses.isin(["WARN", "FAIL"]).any(axis=1)
+
+        grouped = df.groupby("drone_uid")
+        summary = grouped.tail(1).set_index("drone_uid")
+        summary = summary.rename(columns={"timestamp": "last_flight"}).drop(columns="issues")
+        summary["flights"] = grouped.size()
+        summary["flights_with_issues"] = grouped["issues"].sum()
+        return summary.reset_index()
+
+    def query(self, path, params):
+        """
+         Route a request path to its query, through the cache. Every cached
+         result is dropped as soon as the database changes.
+
+         @param path - request path (ex.: "/drones/<uid>/status")
+         @param params - dict of query string values
+
+         @return tuple (body bytes, content type), or None if the path is unknown
+        """
+        fmt = params.get("format", "json")
+        key = (path, tuple(sorted(params.items())))
+        with self._lock:
+            generation = self.generation()
+            if generation != self._generation:
+                self._cache.clear()
+                self._generation = generation
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        parts = [p for p in path.split("/") if p]
+        if parts == ["fleet", "summary"]:
+            df = self.fleet()
+        elif len(parts) == 3 and parts[0] == "drones" and parts[2] == "reports":
+            df = self.reports(parts[1], params.get("start"), params.get("end"))
+        elif len(parts) == 3 and parts[0] == "drones" and parts[2] == "status":
+            df = self.status(parts[1])
+        elif len(parts) == 3 and parts[0] == "drones" and parts[2] == "battery":
+            df = self.battery(parts[1], params.get("start"), params.get("end"))
+        else:
+            return None
+
+        result = self.encode(df, fmt)
+        with self._lock:
+            if generation == self._generation:
+                self._cache[key] = result
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return result
+
+    def encode(self, df, fmt):
+        """
+         Serialize a DataFrame as JSON records or as an Arrow IPC stream.
+
+         @param df - DataFrame to serialize
+         @param fmt - "json" or "arrow" (requires pyarrow)
+
+         @return tuple (body bytes, content type)
+        """
+        if fmt == "arrow":
+            if pa is None:
+                raise ValueError("Arrow output requires pyarrow.")
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            sink = io.BytesIO()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue(), "application/vnd.apache.arrow.stream"
+        if fmt != "json":
+            raise ValueError(f"Unknown format: {fmt}")
+        return df.to_json(orient="records").encode("utf-8"), "application/json"
+
+    def handler(self):
+        """
+         Build the request handler class bound to this service.
+
+         @return BaseHTTPRequestHandler subclass
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                try:
+                    result = service.query(url.path, params)
+                except ValueError as exception:
+                    return self.reply(400, json.dumps({"error": str(exception)}).encode("utf-8"), "application/json")
+                except Exception as exception:
+                    # ex.: the database is locked by the ingest, pyarrow fails
+                    print(f"Query {self.path} failed: {exception!r}")
+                    return self.reply(500, json.dumps({"error": str(exception)}).encode("utf-8"), "application/json")
+                if result is None:
+                    return self.reply(404, b'{"error": "not found"}', "application/json")
+                self.reply(200, *result)
+
+            def reply(self, code, body, content_type):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve(self, host="127.0.0.1", port=8765):
+        """
+         Serve queries until interrupted. Binds to localhost by default.
+
+         @param host - interface to bind
+         @param port - TCP port
+        """
+        with ThreadingHTTPServer((host, port), self.handler()) as server:
+            server.serve_forever()
+
+
+##running when not being imported
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Read-only query service for dashboards.")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to bind")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port")
+    args = parser.parse_args()
+    QueryService().serve(args.host, args.port)
+
+
+############################################################
+## tests
+############################################################
+
+def test_cache_invalidation(path="/tmp/query_service_test.db"):
+    import shutil
+
+    shutil.copy("database/configs/flights_master.db", path)
+    service = QueryService(db_path=path)
+    calls = []
+    service.fleet = lambda: calls.append(1) or pd.DataFrame({"flights": [len(calls)]})
+
+    assert service.query("/fleet/summary", {}) == service.query("/fleet/summary", {})
+    assert len(calls) == 1
+
+    def write(sql):
+        connection = sqlite3.connect(path)
+        connection.execute(sql)
+        connection.commit()
+        connection.close()
+
+    # an in-place update (as ruleengine --write does) leaves MAX(uid) as it is
+    write("UPDATE report SET motor_status = 'WARN' WHERE uid = (SELECT MIN(uid) FROM report)")
+    assert service.query("/fleet/summary", {})[0] == b'[{"flights":2}]'
+    write("DELETE FROM report WHERE uid = (SELECT MAX(uid) FROM report)")
+    service.query("/fleet/summary", {})
+    assert len(calls) == 3
+    service._version.close()
+    os.remove(path)
+
+
+def test_server_errors(path="/tmp/query_service_errors.db"):
+    import shutil
+    import urllib.error
+    import urllib.request
+
+    shutil.copy("database/configs/flights_master.db", path)
+    service = QueryService(db_path=path)
+
+    def locked():
+        raise OperationalError("SELECT", {}, sqlite3.OperationalError("database is locked"))
+
+    service.fleet = locked
+    server = ThreadingHTTPServer(("127.0.0.1", 0), service.handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def get(route):
+        try:
+            with urllib.request.urlopen(url + route, timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read())
+
+    status, body = get("/fleet/summary")
+    assert status == 500 and "database is locked" in body["error"]
+    assert get("/fleet/summary?format=xml")[0] == 500  # the query fails before the format is checked
+    assert get("/nothing/here")[0] == 404
+    server.shutdown()
+    server.server_close()
+    service._version.close()
+    os.remove(path)
@@ -0,0 +1,203 @@
+import queue
+import time
+import atexit
+import threading
+from database.configs.connection import DataHandler
+from database.entities.report import Report
+from database.entities.motors import Motors
+from database.entities.battery import Battery
+from database.entities.track import Track
+from sqlalchemy.dialects.sqlite import insert
+
+
+class BatchWriter:
+    _stop = object()
+
+    def __init__(self, batch_size=50, flush_interval=2.0, db_path="database/configs/flights_master.db"):
+        """
+         Start a background writer. Flight results are put on a queue and a
+         single thread writes them in batched transactions, so the analysis
+         never waits on SQLite commits and only one connection ever holds the
+         write lock.
+
+         @param batch_size - number of flights that triggers a flush
+         @param flush_interval - seconds after which a partial batch is flushed
+         @param db_path - sqlite database file
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.error = None
+        self.failed = []
+        self._queue = queue.Queue()
+        self._db = DataHandler(db_path)
+        with self._db.get_engine().connect() as connection:
+            # readers (dashboards, exports) no longer block on the writer
+            connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+        Battery.metadata.create_all(self._db.get_engine(), tables=[Battery.__table__, Track.__table__])
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name="BatchWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def put(self, report_row, motors_row, battery_row=None, track_row=None):
+        """
+         Queue the results of one flight. Returns immediately.
+
+         @param report_row - dict with the columns of the report table
+         @param motors_row - dict with the columns of the motors table
+         @param battery_row - dict with the columns of the battery table
+         @param track_row - dict with the columns of the track table
+        """
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed.")
+        self._queue.put((report_row, motors_row, battery_row, track_row))
+
+    def _worker(self):
+        """
+         Collect queued flights and flush them when the batch is full, when
+         the flush interval expires or when the writer is closed.
+        """
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item is not BatchWriter._stop:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (
+                item is None or item is BatchWriter._stop or len(batch) >= self.batch_size
+            ):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+            if item is BatchWriter._stop:
+                break
+
+    def _write(self, batch):
+        """
+         Write flights in a single transaction. Rows already in the database
+         (same timestamp) are ignored, as in RpRepo and MtRepo.
+
+         @param batch - list of (report_row, motors_row, battery_row, track_row) tuples
+        """
+        batteries = [battery for report, motors, battery, track in batch if battery is not None]
+        tracks = [track for report, motors, battery, track in batch if track is not None]
+        with self._db as db:
+            try:
+                db.session.execute(
+                    insert(Report.__table__).on_conflict_do_nothing(),
+                    [report for report, motors, battery, track in batch],
+                )
+                db.session.execute(
+                    insert(Motors.__table__).on_conflict_do_nothing(),
+                    [motors for report, motors, battery, track in batch],
+                )
+                if batteries:
+                    db.session.execute(insert(Battery.__table__).on_conflict_do_nothing(), batteries)
+                if tracks:
+                    db.session.execute(insert(Track.__table__).on_conflict_do_nothing(), tracks)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _flush(self, batch):
+        """
+         Write a batch of flights. If the batch fails (ex.: a NULL in a NOT
+         NULL column), each flight is retried in its own transaction, so
+         only the failing flights are lost; they are reported right away and
+         kept in self.failed.
+
+         @param batch - list of (report_row, motors_row, battery_row, track_row) tuples
+        """
+        try:
+            self._write(batch)
+            return
+        except Exception as exception:
+            if len(batch) == 1:
+                self._failed(batch[0], exception)
+                return
+        for flight in batch:
+            try:
+                self._write([flight])
+            except Exception as exception:
+                self._failed(flight, exception)
+
+    def _failed(self, flight, exception):
+        report = flight[0]
+        print(f"Flight {report.get('timestamp')} of {report.get('drone_uid')} not written: {exception}")
+        self.failed.append((flight, exception))
+        self.error = exception
+
+    def close(self):
+        """
+         Flush everything still queued and stop the writer thread. Raises the
+         last database error, if any, so failed writes are not lost silently
+         (the failed flights are in self.failed).
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(BatchWriter._stop)
+            self._thread.join()
+            atexit.unregister(self.close)
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+############################################################
+## tests
+############################################################
+
+def test_bad_row_in_batch(folder="/tmp"):
+    import os
+    import shutil
+    from sqlalchemy import func, select
+
+    path = os.path.join(folder, "batch_writer_test.db")
+    shutil.copy("database/configs/flights_master.db", path)
+    db = DataHandler(path)
+    with db:
+        db.session.execute(Report.__table__.delete())
+        db.session.execute(Motors.__table__.delete())
+        db.session.commit()
+
+    def flight(i, drone_uid="d1"):
+        report = {
+            "timestamp": str(1.7e9 + i), "drone_uid": drone_uid, "motor_status": "OK", "motor_feedback": "",
+            "imu_status": "OK", "imu_feedback": "", "vcc_status": "OK", "vcc_mean": 5.0, "vcc_std": 0.1,
+        }
+        motors = {"timestamp": str(1.7e9 + i), "drone_uid": drone_uid, "m1_avg_pwm": 1500,
+                  "m2_avg_pwm": 1500, "m3_avg_pwm": 1500, "m4_avg_pwm": 1500}
+        return report, motors
+
+    writer = BatchWriter(batch_size=10, db_path=path)
+    for i in range(10):
+        # flight 4 has no drone uid, which the NOT NULL constraint rejects
+        writer.put(*flight(i, None if i == 4 else "d1"))
+    try:
+        writer.close()
+        raise AssertionError("the failed flight was not reported")
+    except Exception as exception:
+        assert "NOT NULL" in str(exception)
+    assert [report["timestamp"] for (report, *rest), error in writer.failed] == [str(1.7e9 + 4)]
+    with db:
+        assert db.session.execute(select(func.count()).select_from(Report.__table__)).scalar() == 9
+        assert db.session.execute(select(func.count()).select_from(Motors.__table__)).scalar() == 9
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
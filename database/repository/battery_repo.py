@@ -0,0 +1,24 @@
+from database.configs.connection import DataHandler
+from database.entities.battery import Battery
+from database.repository.queries import flight_filters, iter_rows, read_frame
+
+class BtRepo:
+    def __init__(self, read_only=False):
+        self.read_only = read_only
+
+    def select(self):
+        with DataHandler() as db:
+            try:
+                data = db.session.query(Battery).all()
+                return data
+            except Exception as exception:
+                db.session.rollback()
+                raise exception
+
+    def iter_select(self, drone_uid=None, start=None, end=None, batch_size=1000):
+        filters = flight_filters(Battery, drone_uid, start, end)
+        return iter_rows(Battery, filters, batch_size, self.read_only)
+
+    def select_df(self, drone_uid=None, start=None, end=None, columns=None, chunksize=None):
+        filters = flight_filters(Battery, drone_uid, start, end)
+        return read_frame(Battery, filters, columns, chunksize, self.read_only)
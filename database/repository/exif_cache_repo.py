@@ -0,0 +1,154 @@
+import time
+from database.configs.connection import DataHandler
+from database.entities.exif_cache import ExifCache
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+# columns of the cache and the EXIF field each one holds
+CACHED_FIELDS = {"iso": "ISO", "shutter": "Shutter", "copyright": "Copyright", "artist": "Artist"}
+
+class ExRepo:
+    chunk = 500  # paths per IN clause, below the SQLite variable limit
+
+    def __init__(self, max_entries=200000, db_path="database/configs/exif_cache.db"):
+        """
+         @param max_entries - entries kept, the least recently used are dropped
+         @param db_path - sqlite database file of the cache. It is not the
+         flights database, whose write lock is held by the BatchWriter thread
+        """
+        self.max_entries = max_entries
+        self._db = DataHandler(db_path)
+        ExifCache.metadata.create_all(self._db.get_engine(), tables=[ExifCache.__table__])
+
+    def lookup(self, files):
+        """
+         Cached EXIF fields of the files whose size and mtime did not change.
+         Entries of changed files are stale and left to be overwritten.
+
+         @param files - list of (path, size, mtime) tuples
+
+         @return dict of path -> dict of EXIF fields
+        """
+        keys = {path: (size, mtime) for path, size, mtime in files}
+        paths = list(keys)
+        hits = {}
+        with self._db as db:
+            try:
+                for i in range(0, len(paths), ExRepo.chunk):
+                    rows = db.session.execute(
+                        select(ExifCache).where(ExifCache.path.in_(paths[i:i + ExRepo.chunk]))
+                    ).scalars()
+                    for row in rows:
+                        if keys[row.path] == (row.size, row.mtime):
+                            hits[row.path] = {field: getattr(row, column) for column, field in CACHED_FIELDS.items()}
+                if hits:
+                    db.session.execute(
+                        update(ExifCache.__table__)
+                        .where(ExifCache.__table__.c.path == bindparam("key"))
+                        .values(last_used=bindparam("used")),
+                        [{"key": path, "used": time.time()} for path in hits],
+                    )
+                db.session.commit()
+            except Exception as exception:
+                db.session.rollback()
+                raise exception
+        return hits
+
+    def store(self, rows):
+        """
+         Insert or replace cache entries, then drop the least recently used
+         entries beyond max_entries.
+
+         @param rows - list of dicts with path, size, mtime and the EXIF fields
+        """
+        if not rows:
+            return
+        now = time.time()
+        values = [
+            {"path": r["path"], "size": r["size"], "mtime": r["mtime"], "last_used": now,
+             **{column: r.get(field) for column, field in CACHED_FIELDS.items()}}
+            for r in rows
+        ]
+        statement = insert(ExifCache.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=["path"],
+            set_={c: statement.excluded[c] for c in ["size", "mtime", "last_used", *CACHED_FIELDS]},
+        )
+        with self._db as db:
+            try:
+                db.session.execute(statement, values)
+                db.session.commit()
+            except Exception as exception:
+                db.session.rollback()
+                raise exception
+        self.cleanup()
+
+    def invalidate(self, paths):
+        """
+         Remove the entries of files (ex.: deleted photos).
+
+         @param paths - list of paths
+        """
+        paths = list(paths)
+        with self._db as db:
+            try:
+                for i in range(0, len(paths), ExRepo.chunk):
+                    db.session.execute(
+                        delete(ExifCache.__table__).where(ExifCache.__table__.c.path.in_(paths[i:i + ExRepo.chunk]))
+                    )
+                db.session.commit()
+            except Exception as exception:
+                db.session.rollback()
+                raise exception
+
+    def invalidate_folder(self, folder, existing):
+        """
+         Remove the entries of a folder whose files no longer exist.
+
+         @param folder - folder path, as stored in the cache
+         @param existing - set of paths of the files still in the folder
+        """
+        prefix = folder.rstrip("/") + "/"
+        with self._db as db:
+            stored = db.session.execute(
+                select(ExifCache.path).where(ExifCache.path.startswith(prefix, autoescape=True))
+            ).scalars().all()
+        gone = [path for path in stored if path not in existing and "/" not in path[len(prefix):]]
+        if gone:
+            self.invalidate(gone)
+
+    def cleanup(self):
+        """
+         Keep the cache under max_entries, dropping the least recently used.
+
+         @return number of entries removed
+        """
+        with self._db as db:
+            try:
+                count = db.session.query(ExifCache).count()
+                if count <= self.max_entries:
+                    return 0
+                oldest = select(ExifCache.path).order_by(ExifCache.last_used).limit(count - self.max_entries)
+                result = db.session.execute(delete(ExifCache.__table__).where(ExifCache.__table__.c.path.in_(oldest)))
+                db.session.commit()
+                return result.rowcount
+            except Exception as exception:
+                db.session.rollback()
+                raise exception
+
+
+############################################################
+## tests
+############################################################
+
+def test_cache_round_trip(path="/tmp/exif_cache_test.db"):
+    import os
+
+    repo = ExRepo(max_entries=2, db_path=path)
+    fields = {"ISO": 200, "Shutter": "1/1600", "Copyright": "a1r2_abc", "Artist": "1234567"}
+    repo.store([{"path": f"/photos/IMG_{i}.JPG", "size": 100, "mtime": float(i), **fields} for i in range(3)])
+    hits = repo.lookup([(f"/photos/IMG_{i}.JPG", 100, float(i)) for i in range(3)])
+    # one entry was dropped to stay under max_entries
+    assert len(hits) == 2 and all(row == fields for row in hits.values())
+    assert repo.lookup([("/photos/IMG_2.JPG", 100, 9.0)]) == {}
+    os.remove(path)
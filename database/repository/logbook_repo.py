@@ -1,5 +1,6 @@
-from configs.connection import DataHandler
-from entities.logbook import Report
+from database.configs.connection import DataHandler
+from database.entities.logbook import Report
+from database.repository.queries import iter_rows, read_frame
 
 class LbRepo:
     def select(self):
@@ -10,6 +11,12 @@ class LbRepo:
             except Exception as exception:
                 db.session.rollback()
                 raise exception
+
+    def iter_select(self, batch_size=1000):
+        return iter_rows(Report, (), batch_size)
+
+    def select_df(self, columns=None, chunksize=None):
+        return read_frame(Report, (), columns, chunksize)
                     
     def insert(self, vbt, vat, aat):
         with DataHandler() as db:
@@ -1,8 +1,12 @@
 from database.configs.connection import DataHandler
 from database.entities.motors import Motors
+from database.repository.queries import flight_filters, iter_rows, read_frame
 from sqlalchemy.exc import IntegrityError
 
 class MtRepo:
+    def __init__(self, read_only=False):
+        self.read_only = read_only
+
     def select(self):
         with DataHandler() as db:
             try:
@@ -11,6 +15,14 @@ class MtRepo:
             except Exception as exception:
                 db.session.rollback()
                 raise exception
+
+    def iter_select(self, drone_uid=None, start=None, end=None, batch_size=1000):
+        filters = flight_filters(Motors, drone_uid, start, end)
+        return iter_rows(Motors, filters, batch_size, self.read_only)
+
+    def select_df(self, drone_uid=None, start=None, end=None, columns=None, chunksize=None):
+        filters = flight_filters(Motors, drone_uid, start, end)
+        return read_frame(Motors, filters, columns, chunksize, self.read_only)
                     
     def insert(self, timestamp, drone_uid, m1_avg_pwm, m2_avg_pwm, m3_avg_pwm, m4_avg_pwm):
         with DataHandler() as db:
@@ -0,0 +1,84 @@
+import pandas as pd
+from database.configs.connection import DataHandler
+from sqlalchemy import Float, cast, select
+
+
+def flight_filters(entity, drone_uid=None, start=None, end=None):
+    """
+     Build the WHERE clauses shared by the flight tables (report, motors).
+     Timestamps are stored as text, so they are compared as numbers.
+
+     @param entity - mapped class with timestamp and drone_uid columns
+     @param drone_uid - only rows of this drone (or list of drones)
+     @param start - only flights at or after this unix timestamp
+     @param end - only flights before this unix timestamp
+
+     @return list of SQLAlchemy clauses
+    """
+    filters = []
+    if drone_uid is not None:
+        if isinstance(drone_uid, (list, tuple, set)):
+            filters.append(entity.drone_uid.in_(list(drone_uid)))
+        else:
+            filters.append(entity.drone_uid == drone_uid)
+    if start is not None:
+        filters.append(cast(entity.timestamp, Float) >= float(start))
+    if end is not None:
+        filters.append(cast(entity.timestamp, Float) < float(end))
+    return filters
+
+
+def iter_rows(entity, filters=(), batch_size=1000, read_only=False):
+    """
+     Iterate over ORM objects with keyset pagination on the primary key.
+     Each page uses its own short session, so no lock or cursor is held
+     between pages and memory stays bounded by batch_size.
+
+     @param entity - mapped class with an integer uid primary key
+     @param filters - clauses from flight_filters
+     @param batch_size - rows fetched per page
+     @param read_only - open the database in read-only mode
+
+     @return generator of detached ORM objects
+    """
+    last_uid = None
+    while True:
+        with DataHandler(read_only=read_only) as db:
+            query = db.session.query(entity).filter(*filters)
+            if last_uid is not None:
+                query = query.filter(entity.uid > last_uid)
+            page = query.order_by(entity.uid).limit(batch_size).all()
+        if not page:
+            return
+        yield from page
+        last_uid = page[-1].uid
+
+
+def read_frame(entity, filters=(), columns=None, chunksize=None, read_only=False):
+    """
+     Read rows straight into pandas through a Core select, skipping ORM
+     object creation. With chunksize, rows are streamed from the cursor as
+     DataFrames of at most chunksize rows.
+
+     @param entity - mapped class
+     @param filters - clauses from flight_filters
+     @param columns - column names to read (all if None)
+     @param chunksize - rows per DataFrame, or None for a single DataFrame
+     @param read_only - open the database in read-only mode
+
+     @return pd.DataFrame, or generator of pd.DataFrame if chunksize is set
+    """
+    table = entity.__table__
+    cols = [table.c[c] for c in columns] if columns else [table]
+    stmt = select(*cols).where(*filters).order_by(table.c.uid)
+
+    if chunksize is None:
+        with DataHandler(read_only=read_only) as db:
+            return pd.read_sql(stmt, db.get_engine())
+
+    def chunks():
+        with DataHandler(read_only=read_only) as db:
+            with db.get_engine().connect() as connection:
+                yield from pd.read_sql(stmt, connection, chunksize=chunksize)
+
+    return chunks()
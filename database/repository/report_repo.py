@@ -1,8 +1,12 @@
 from database.configs.connection import DataHandler
 from database.entities.report import Report
+from database.repository.queries import flight_filters, iter_rows, read_frame
 from sqlalchemy.exc import IntegrityError
 
 class RpRepo:
+    def __init__(self, read_only=False):
+        self.read_only = read_only
+
     def select(self):
         with DataHandler() as db:
             try:
@@ -11,6 +15,14 @@ class RpRepo:
             except Exception as exception:
                 db.session.rollback()
                 raise exception
+
+    def iter_select(self, drone_uid=None, start=None, end=None, batch_size=1000):
+        filters = flight_filters(Report, drone_uid, start, end)
+        return iter_rows(Report, filters, batch_size, self.read_only)
+
+    def select_df(self, drone_uid=None, start=None, end=None, columns=None, chunksize=None):
+        filters = flight_filters(Report, drone_uid, start, end)
+        return read_frame(Report, filters, columns, chunksize, self.read_only)
                     
     def insert(self, timestamp, drone_uid, motors_status, motors_feedback, imu_status, imu_feedback, vcc_status, vcc_mean, vcc_std):
         with DataHandler() as db:
@@ -33,6 +45,16 @@ class RpRepo:
             except Exception as exception:
                 db.session.rollback()
                 raise exception
+
+    def update_many(self, rows):
+        with DataHandler() as db:
+            try:
+                db.session.bulk_update_mappings(Report, rows)
+                db.session.commit()
+            except Exception as exception:
+                db.session.rollback()
+                raise exception
+
     #TODO: format following considering the new entities        
     def delete(self, vbt):
         with DataHandler() as db:
@@ -0,0 +1,60 @@
+import numpy as np
+from database.configs.connection import DataHandler
+from database.entities.track import Track
+from database.repository.queries import flight_filters, iter_rows, read_frame
+
+class TrRepo:
+    def __init__(self, read_only=False):
+        self.read_only = read_only
+
+    def select(self):
+        with DataHandler() as db:
+            try:
+                data = db.session.query(Track).all()
+                return data
+            except Exception as exception:
+                db.session.rollback()
+                raise exception
+
+    def iter_select(self, drone_uid=None, start=None, end=None, batch_size=1000):
+        filters = flight_filters(Track, drone_uid, start, end)
+        return iter_rows(Track, filters, batch_size, self.read_only)
+
+    def select_df(self, drone_uid=None, start=None, end=None, columns=None, chunksize=None):
+        filters = flight_filters(Track, drone_uid, start, end)
+        return read_frame(Track, filters, columns, chunksize, self.read_only)
+
+
+def track_row(timestamp, drone_uid, name, coords, style=None):
+    """
+     Row of the track table for one flight.
+
+     @param coords - np.ndarray of shape (n, 2) with (lon, lat)
+     @param style - styleUrl of the shared line style
+
+     @return dict with the columns of the track table
+    """
+    coords = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+    low = coords.min(axis=0) if coords.size else np.full(2, np.nan)
+    high = coords.max(axis=0) if coords.size else np.full(2, np.nan)
+    return {
+        "timestamp": timestamp,
+        "drone_uid": drone_uid,
+        "name": name,
+        "style": style,
+        "min_lon": float(low[0]),
+        "min_lat": float(low[1]),
+        "max_lon": float(high[0]),
+        "max_lat": float(high[1]),
+        "points": int(coords.shape[0]),
+        "coords": coords.tobytes(),
+    }
+
+
+def track_coords(blob):
+    """
+     @param blob - coords column of the track table
+
+     @return np.ndarray of shape (n, 2) with (lon, lat)
+    """
+    return np.frombuffer(blob, dtype=np.float64).reshape(-1, 2)
@@ -0,0 +1,280 @@
+import gzip
+import json
+import socket
+import threading
+import urllib.request
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from database.configs.connection import DataHandler
+from database.entities.report import Report
+from database.entities.motors import Motors
+from database.entities.sync import ChangeLog, SyncState
+from sqlalchemy import select
+
+
+class DeltaSync:
+    tables = {"report": Report.__table__, "motors": Motors.__table__}
+
+    def __init__(self, endpoint, batch_size=500, timeout=30, source=None, db_path="database/configs/flights_master.db"):
+        """
+         Initialize the object. It installs the change tracking (change_log
+         table and triggers on report and motors) on first use and pushes only
+         the rows changed since the last batch acknowledged by the endpoint.
+
+         @param endpoint - URL that receives the gzipped JSON batches
+         @param batch_size - maximum number of changes per batch
+         @param timeout - seconds to wait for each request
+         @param source - name of this machine in the central database
+         @param db_path - sqlite database file
+        """
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.source = source or socket.gethostname()
+        self._db = DataHandler(db_path)
+        ChangeLog.metadata.create_all(
+            self._db.get_engine(), tables=[ChangeLog.__table__, SyncState.__table__]
+        )
+
+    def last_ack(self, session):
+        """
+         Sequence number of the last change acknowledged by the endpoint.
+
+         @param session - open session
+
+         @return int
+        """
+        state = session.get(SyncState, self.endpoint)
+        return state.last_seq if state is not None else 0
+
+    def next_batch(self, session, after):
+        """
+         Build the next batch of changes. Repeated changes of a row are
+         collapsed, and upserts carry the row as it is now.
+
+         @param session - open session
+         @param after - sequence number already acknowledged
+
+         @return dict payload, or None if there is nothing to send
+        """
+        changes = session.execute(
+            select(ChangeLog.seq, ChangeLog.table_name, ChangeLog.row_uid, ChangeLog.operation)
+            .where(ChangeLog.seq > after)
+            .order_by(ChangeLog.seq)
+            .limit(self.batch_size)
+        ).all()
+        if not changes:
+            return None
+
+        latest = {}
+        for seq, table_name, row_uid, operation in changes:
+            latest[(table_name, row_uid)] = operation
+
+        payload = {
+            "source": self.source,
+            "from_seq": after,
+            "to_seq": changes[-1].seq,
+            "upserts": {},
+            "deletes": {},
+        }
+        for name, table in DeltaSync.tables.items():
+            upserts = [uid for (t, uid), op in latest.items() if t == name and op == "U"]
+            deletes = [uid for (t, uid), op in latest.items() if t == name and op == "D"]
+            if upserts:
+                rows = session.execute(select(table).where(table.c.uid.in_(upserts))).mappings()
+                payload["upserts"][name] = [dict(row) for row in rows]
+            if deletes:
+                payload["deletes"][name] = deletes
+        return payload
+
+    def send(self, payload):
+        """
+         POST a batch as gzipped JSON. The endpoint must answer with the
+         acknowledged sequence number ({"ack": to_seq}).
+
+         @param payload - dict built by next_batch
+
+         @return acknowledged sequence number
+        """
+        body = gzip.compress(json.dumps(payload, default=float, separators=(",", ":")).encode("utf-8"))
+        request = urllib.request.Request(
+            self.endpoint,
+            data=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return int(json.loads(response.read())["ack"])
+
+    def push(self):
+        """
+         Send every pending change, one batch at a time. The acknowledged
+         position is committed after each batch, so an interrupted sync
+         resumes from the last acknowledged batch. This is the main method.
+
+         @return number of batches sent
+        """
+        batches = 0
+        while True:
+            with self._db as db:
+                payload = self.next_batch(db.session, self.last_ack(db.session))
+            if payload is None:
+                return batches
+
+            ack = self.send(payload)
+            if ack != payload["to_seq"]:
+                raise RuntimeError(f"Endpoint acknowledged {ack}, expected {payload['to_seq']}.")
+
+            with self._db as db:
+                try:
+                    db.session.merge(SyncState(endpoint=self.endpoint, last_seq=ack))
+                    db.session.commit()
+                except Exception as exception:
+                    db.session.rollback()
+                    raise exception
+            batches += 1
+
+
+class StubServer:
+    def __init__(self, output_path):
+        """
+         Local stand-in for the central database, for testing the sync. It
+         appends every received batch to a JSON lines file and acknowledges it.
+
+         @param output_path - JSON lines file that stores the batches
+        """
+        self.output_path = output_path
+        self._lock = threading.Lock()
+
+    def handler(self):
+        """
+         Build the request handler class bound to this stub.
+
+         @return BaseHTTPRequestHandler subclass
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                payload = json.loads(body)
+                with stub._lock:
+                    with open(stub.output_path, "a") as output:
+                        output.write(json.dumps(payload) + "\n")
+                reply = json.dumps({"ack": payload["to_seq"]}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve(self, host="127.0.0.1", port=8766):
+        """
+         Serve until interrupted.
+
+         @param host - interface to bind
+         @param port - TCP port
+        """
+        with ThreadingHTTPServer((host, port), self.handler()) as server:
+            server.serve_forever()
+
+
+##running when not being imported
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Delta sync of flight results with a central database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    push = commands.add_parser("push", help="send changes since the last acknowledged sync")
+    push.add_argument("endpoint", help="URL of the central database API")
+    push.add_argument("--batch-size", type=int, default=500, help="changes per batch")
+    stub = commands.add_parser("stub", help="run a local stub endpoint for testing")
+    stub.add_argument("--output", default="sync_stub.jsonl", help="file that stores received batches")
+    stub.add_argument("--port", type=int, default=8766, help="TCP port")
+    args = parser.parse_args()
+
+    if args.command == "push":
+        print(f"{DeltaSync(args.endpoint, args.batch_size).push()} batches sent.")
+    else:
+        StubServer(args.output).serve(port=args.port)
+
+
+############################################################
+## tests
+############################################################
+
+def test_push_and_resume(folder="/tmp"):
+    import os
+    import shutil
+    import sqlite3
+
+    path = os.path.join(folder, "sync_test.db")
+    output = os.path.join(folder, "sync_test.jsonl")
+    shutil.copy("database/configs/flights_master.db", path)
+    connection = sqlite3.connect(path)
+    connection.execute("DELETE FROM report")
+    connection.execute("DELETE FROM motors")
+    connection.commit()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubServer(output).handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/"
+    sync = DeltaSync(endpoint, batch_size=4, source="test", db_path=path)
+
+    for i in range(5):
+        connection.execute(
+            "INSERT INTO report (timestamp, drone_uid, motor_status, motor_feedback, imu_status, imu_feedback, "
+            "vcc_status, vcc_mean, vcc_std) VALUES (?, 'd1', 'OK', '', 'OK', '', 'OK', 5.0, 0.1)", (str(1.7e9 + i),)
+        )
+        connection.execute(
+            "INSERT INTO motors (timestamp, drone_uid, m1_avg_pwm, m2_avg_pwm, m3_avg_pwm, m4_avg_pwm) "
+            "VALUES (?, 'd1', 1500, 1500, 1500, 1500)", (str(1.7e9 + i),)
+        )
+    connection.commit()
+
+    # the connection drops after the first batch: only that one is acknowledged
+    send, sent = sync.send, []
+
+    def flaky_send(payload):
+        if sent:
+            raise OSError("connection reset")
+        sent.append(payload)
+        return send(payload)
+
+    sync.send = flaky_send
+    try:
+        sync.push()
+        raise AssertionError("the interrupted push did not fail")
+    except OSError:
+        pass
+    sync.send = send
+    with sync._db as db:
+        assert sync.last_ack(db.session) == 4
+
+    # the next push resumes after the acknowledged batch
+    assert sync.push() == 2
+    assert sync.push() == 0
+    connection.execute("UPDATE report SET motor_status = 'WARN' WHERE timestamp = ?", (str(1.7e9),))
+    connection.execute("DELETE FROM motors WHERE timestamp = ?", (str(1.7e9 + 4),))
+    connection.commit()
+    assert sync.push() == 1
+
+    with open(output) as received:
+        batches = [json.loads(line) for line in received]
+    assert [(b["from_seq"], b["to_seq"]) for b in batches] == [(0, 4), (4, 8), (8, 10), (10, 12)]
+    assert sum(len(b["upserts"].get("report", [])) for b in batches[:3]) == 5
+    assert sum(len(b["upserts"].get("motors", [])) for b in batches[:3]) == 5
+    assert [row["motor_status"] for row in batches[3]["upserts"]["report"]] == ["WARN"]
+    assert len(batches[3]["deletes"]["motors"]) == 1
+
+    server.shutdown()
+    server.server_close()
+    connection.close()
+    for name in [path, path + "-wal", path + "-shm", output]:
+        if os.path.exists(name):
+            os.remove(name)
@@ -17,35 +17,36 @@ import internal.lineintersect as li
 def GetFirstPoint(dataset):
     ''' Returns index of first point, which has the lowest y value '''
     # todo: what if there is more than one point with lowest y?
-    imin = np.argmin(dataset[:,1])
-    return dataset[imin]
-
-def GetNearestNeighbors(dataset, point, k):
-    ''' Returns indices of k nearest neighbors of point in dataset'''
-    # todo: experiment with leafsize for performance
-    mytree = spt.cKDTree(dataset,leafsize=10)
-    distances, indices = mytree.query(point,k)
-    # todo: something strange here, we get more indices than points in dataset
-    #       so have to do this
-    return dataset[indices[:dataset.shape[0]]]
+    return np.argmin(dataset[:,1])
+
+def GetNearestNeighbors(tree, remaining, point, k):
+    ''' Returns indices of the k nearest neighbors of point among the
+    remaining points. The tree holds the whole dataset and is built once;
+    points already in the hull are masked out of the query results, and
+    the query is widened only when too many of the nearest are masked. '''
+    n = remaining.shape[0]
+    count = min(k, int(remaining.sum()))
+    query = min(k, n)
+    while True:
+        distances, indices = tree.query(point, query)
+        indices = np.atleast_1d(indices)
+        indices = indices[indices < n]
+        indices = indices[remaining[indices]]
+        if indices.shape[0] >= count or query >= n:
+            return indices[:count]
+        query = min(2*query, n)
 
 def SortByAngle(kNearestPoints, currentPoint, prevPoint):
-    ''' Sorts the k nearest points given by angle '''
-    angles = np.zeros(kNearestPoints.shape[0])
-    i = 0
-    for NearestPoint in kNearestPoints:
-        # calculate the angle
-        angle = np.arctan2(NearestPoint[1]-currentPoint[1],
-                NearestPoint[0]-currentPoint[0]) - \
-                np.arctan2(prevPoint[1]-currentPoint[1],
-                prevPoint[0]-currentPoint[0])
-        angle = np.rad2deg(angle)
-        # only positive angles
-        angle = np.mod(angle+360,360)
-        #print NearestPoint[0], NearestPoint[1], angle
-        angles[i] = angle
-        i=i+1
-    return kNearestPoints[np.argsort(angles)]
+    ''' Returns the order of the k nearest points given by angle '''
+    # angle of each point, clockwise from the previous hull edge
+    angles = np.arctan2(kNearestPoints[:,1]-currentPoint[1],
+            kNearestPoints[:,0]-currentPoint[0]) - \
+            np.arctan2(prevPoint[1]-currentPoint[1],
+            prevPoint[0]-currentPoint[0])
+    angles = np.rad2deg(angles)
+    # only positive angles
+    angles = np.mod(angles+360,360)
+    return np.argsort(angles)
 
 def plotPoints(dataset):
     plt.plot(dataset[:,0],dataset[:,1],'o',markersize=10,markerfacecolor='0.75',
@@ -69,148 +70,189 @@ def plotPath(dataset, path):
     plt.savefig('./doc/figure_1.png', bbox_inches='tight')
     plt.show()
 
-def removePoint(dataset, point):
-    delmask = [np.logical_or(dataset[:,0]!=point[0],dataset[:,1]!=point[1])]
-    newdata = dataset[delmask]
-    return newdata
-
-
-def concaveHull(dataset, k):
-    assert k >= 3, 'k has to be greater or equal to 3.'
-    points = dataset
-    # todo: remove duplicate points from dataset
-    # todo: check if dataset consists of only 3 or less points
-    # todo: make sure that enough points for a given k can be found
-
-    firstpoint = GetFirstPoint(points)
-    # init hull as list to easily append stuff
-    hull = []
-    # add first point to hull
-    hull.append(firstpoint)
+def kNearestHull(points, tree, k, cell):
+    ''' One pass of the algorithm with a given k. Returns the hull as an
+    array of points, or None if all candidates of a step intersect the
+    hull. Consumed points are tracked with a mask instead of being removed
+    from the dataset, and hull edges are kept in a grid index (cell size
+    in units of the points) so candidates are only tested against the
+    edges near them. '''
+    remaining = np.ones(points.shape[0], dtype=bool)
+    edges = li.EdgeGrid(cell)
+    first = GetFirstPoint(points)
+    # init hull as list of indices to easily append stuff
+    hull = [first]
     # and remove it from dataset
-    points = removePoint(points,firstpoint)
-    currentPoint = firstpoint
+    remaining[first] = False
+    current = first
     # set prevPoint to a Point righ of currentpoint (angle=0)
-    prevPoint = (currentPoint[0]+10, currentPoint[1])
+    prevPoint = (points[first,0]+10, points[first,1])
     step = 2
 
-    while ( (not np.array_equal(firstpoint, currentPoint) or (step==2)) and points.size > 0 ):
+    while ( (current != first or step == 2) and remaining.any() ):
         if ( step == 5 ): # we're far enough to close too early
-            points = np.append(points, [firstpoint], axis=0)
-        kNearestPoints = GetNearestNeighbors(points, currentPoint, k)
-        cPoints = SortByAngle(kNearestPoints, currentPoint, prevPoint)
+            remaining[first] = True
+        candidates = GetNearestNeighbors(tree, remaining, points[current], k)
+        candidates = candidates[SortByAngle(points[candidates], points[current], prevPoint)]
         # avoid intersections: select first candidate that does not intersect any
-        # polygon edge
+        # polygon edge but the last one (edge i joins hull[i] and hull[i+1]);
+        # closing on the first point may touch the first edge
         its = True
-        i = 0
-        while ( (its==True) and (i<cPoints.shape[0]) ):
-                i=i+1
-                if ( np.array_equal(cPoints[i-1], firstpoint) ):
-                    lastPoint = 1
-                else:
-                    lastPoint = 0
-                j = 2
-                its = False
-                while ( (its==False) and (j<np.shape(hull)[0]-lastPoint) ):
-                    its = li.doLinesIntersect(hull[step-1-1], cPoints[i-1],
-                            hull[step-1-j-1],hull[step-j-1])
-                    j=j+1
+        for candidate in candidates:
+            lastPoint = 1 if candidate == first else 0
+            its = edges.intersects(points[current], points[candidate], lastPoint, len(hull)-2)
+            if ( its==False ):
+                break
         if ( its==True ):
-            #print "all candidates intersect -- restarting with k = ";k+1
-            return concaveHull(dataset,k+1)
-        prevPoint = currentPoint
-        currentPoint = cPoints[i-1]
+            return None
+        prevPoint = points[current]
+        current = candidate
         # add current point to hull
-        hull.append(currentPoint)
-        points = removePoint(points,currentPoint)
+        hull.append(current)
+        edges.add(points[hull[-2]], points[current])
+        remaining[current] = False
         step = step+1
-    # check if all points are inside the hull
-    p = Path(hull)
-    pContained = p.contains_points(dataset, radius=0.0000000001)
-    if (not pContained.all()):
-        #print "not all points of dataset contained in hull -- restarting with k = ",k+1
-        return concaveHull(dataset, k+1)
+    return points[hull]
 
-    #print "finished with k = ",k
+
+def concaveHull(dataset, k):
+    assert k >= 3, 'k has to be greater or equal to 3.'
+    dataset = np.asarray(dataset, dtype=float)
+    # remove duplicate points, keeping the order of the dataset
+    unique = np.sort(np.unique(dataset, axis=0, return_index=True)[1])
+    points = dataset[unique]
+    if ( points.shape[0] <= 3 ):
+        return np.vstack([points, points[:1]])
+    # the spatial index is built once, for every pass
+    tree = spt.cKDTree(points, leafsize=10)
+    # grid cell of the hull edges: about the distance to the k-th neighbour
+    sample = points[::max(points.shape[0]//1000, 1)]
+    cell = np.median(tree.query(sample, k+1)[0][:,-1]) or 1.0
+    hull = None
+
+    for k in range(k, points.shape[0]+1):
+        candidate = kNearestHull(points, tree, k, cell)
+        if ( candidate is None ):
+            #print "all candidates intersect -- restarting with k = ";k+1
+            continue
+        hull = candidate
+        # check if all points are inside the hull
+        p = Path(hull)
+        pContained = p.contains_points(points, radius=0.0000000001)
+        if ( pContained.all() ):
+            #print "finished with k = ",k
+            return hull
+        #print "not all points of dataset contained in hull -- restarting with k = ",k+1
     return hull
 
 
+def benchmark(sizes=(5000, 50000), k=3, seed=0):
+    ''' Times concaveHull on synthetic CAM sets: photos along the lines of
+    a survey, with GPS noise, in degrees. Returns a dict of
+    size -> (seconds, number of hull points). '''
+    import time
+    rng = np.random.default_rng(seed)
+    results = {}
+    for size in sizes:
+        lines = 20
+        per_line = size // lines
+        lat = np.tile(np.linspace(-22.0, -21.98, per_line), lines)
+        lon = np.repeat(-47.0 + np.arange(lines) * 0.0005, per_line)
+        cam = np.column_stack([lon, lat]) + rng.normal(0, 2e-6, (lines*per_line, 2))
+        start = time.perf_counter()
+        hull = concaveHull(cam, k)
+        results[size] = (time.perf_counter() - start, len(hull))
+    return results
+
+
 ############################################################
 ## tests
 ############################################################
 
-# nx = 5
-# ny = nx
-# tpoints = []
-# tpointsy = []
-# x = np.arange(nx)
-# for i in x:
-#         tpoints.append((i,0))
-#         tpointsy.append((0,i))
-# tpoints = np.asarray(tpoints)
-# tpointsy = np.asarray(tpointsy)
-
-# def test_GetNearestNeighbors_1d_x_00():
-#     neighbors = GetNearestNeighbors(tpoints, (0,0),nx)
-#     assert np.array_equal(neighbors,tpoints)
-# def test_GetNearestNeighbors_1d_x_nx():
-#     neighbors = GetNearestNeighbors(tpoints, (nx,nx),nx)
-#     assert np.array_equal(neighbors,tpoints[::-1])
-
-# def test_GetNearestNeighbors_1d_y_00():
-#     neighbors = GetNearestNeighbors(tpointsy, (0,0),nx)
-#     assert np.array_equal(neighbors,tpointsy)
-# def test_GetNearestNeighbors_1d_y_nx():
-#     neighbors = GetNearestNeighbors(tpointsy, (nx,nx),nx)
-#     assert np.array_equal(neighbors,tpointsy[::-1])
-
-
-# ################################################
-# clock = np.array([[3,2], [4,2], [4,3], [4,4], [3,4], [2,4], [2,3], [2,2]])
-
-# def check_SortByAngle(points,currentPoint,prevPoint,i):
-#     sortedPoints = SortByAngle(points,currentPoint,prevPoint)
-#     #for j in np.arange(len(clock)):
-#     #    print sortedPoints[j], clock[j], np.roll(clock,-i,axis=0)[j]
-#     assert np.array_equal(sortedPoints, np.roll(clock,-i,axis=0))
-
-# def test_SortByAngle_clock():
-#     i=0
-#     for point in clock:
-#         yield check_SortByAngle, clock, (3,3), point, i
-#         i=i+1
-
-# ################################################
-# # simple test dataset
-# points = np.array([[10,  9], [ 9, 18], [16, 13], [11, 15], [12, 14], [18, 12],
-#                    [ 2, 14], [ 6, 18], [ 9,  9], [10,  8], [ 6, 17], [ 5,  3],
-#                    [13, 19], [ 3, 18], [ 8, 17], [ 9,  7], [ 3,  0], [13, 18],
-#                    [15,  4], [13, 16]])
-# points_solution_k_5 = np.array([[3, 0],[10,  8],[15,  4],[18, 12],[13, 18],[13, 19],
-#                                [ 9, 18],[6, 18],[3, 18],[2, 14],[9, 9],[5, 3],[3, 0]
-#                                ])
-# def test_concaveHull_1_k_5():
-#     hull = concaveHull(points,5)
-#     assert np.array_equal(hull, points_solution_k_5)
-
-# def test_concaveHull_1_k_3():
-#     # this tests, if missed point (too far away) is detected and if the
-#     # function is started again with increased k
-#     hull = concaveHull(points,3)
-#     assert np.array_equal(hull, points_solution_k_5)
-
-
-# # points to test what happens if all points intersect
-# points_intersect = np.array([[1,1],[10,3],[11,8],[9,14],[15,21],[-5,15],[-3,10],
-#                             [2,5],    # from here the distracting points
-#                             [9,10],[8,9],[8,11],[8,12],[9,11],[9,12]
-#                             ])
-# points_intersect_solution = np.array([[1, 1],[10,  3],[11,  8],[9, 14],[15, 21],
-#                                      [-5, 15],[-3, 10],[1, 1]
-#                                      ])
-# def test_concaveHull_intersect():
-#     hull = concaveHull(points_intersect, 5)
-#     assert np.array_equal(hull, points_intersect_solution)
+nx = 5
+ny = nx
+tpoints = []
+tpointsy = []
+x = np.arange(nx)
+for i in x:
+        tpoints.append((i,0))
+        tpointsy.append((0,i))
+tpoints = np.asarray(tpoints)
+tpointsy = np.asarray(tpointsy)
+
+def check_GetNearestNeighbors(dataset, point, k):
+    tree = spt.cKDTree(dataset, leafsize=10)
+    remaining = np.ones(dataset.shape[0], dtype=bool)
+    return dataset[GetNearestNeighbors(tree, remaining, point, k)]
+
+def test_GetNearestNeighbors_1d_x_00():
+    neighbors = check_GetNearestNeighbors(tpoints, (0,0),nx)
+    assert np.array_equal(neighbors,tpoints)
+def test_GetNearestNeighbors_1d_x_nx():
+    neighbors = check_GetNearestNeighbors(tpoints, (nx,nx),nx)
+    assert np.array_equal(neighbors,tpoints[::-1])
+
+def test_GetNearestNeighbors_1d_y_00():
+    neighbors = check_GetNearestNeighbors(tpointsy, (0,0),nx)
+    assert np.array_equal(neighbors,tpointsy)
+def test_GetNearestNeighbors_1d_y_nx():
+    neighbors = check_GetNearestNeighbors(tpointsy, (nx,nx),nx)
+    assert np.array_equal(neighbors,tpointsy[::-1])
+
+def test_GetNearestNeighbors_masked():
+    # consumed points are skipped, the query is widened to find k others
+    tree = spt.cKDTree(tpoints, leafsize=10)
+    remaining = np.array([False, False, True, False, True])
+    neighbors = tpoints[GetNearestNeighbors(tree, remaining, (0,0), 3)]
+    assert np.array_equal(neighbors, tpoints[[2,4]])
+
+
+################################################
+clock = np.array([[3,2], [4,2], [4,3], [4,4], [3,4], [2,4], [2,3], [2,2]])
+
+def check_SortByAngle(points,currentPoint,prevPoint,i):
+    sortedPoints = points[SortByAngle(points,currentPoint,prevPoint)]
+    assert np.array_equal(sortedPoints, np.roll(clock,-i,axis=0))
+
+def test_SortByAngle_clock():
+    for i, point in enumerate(clock):
+        check_SortByAngle(clock, (3,3), point, i)
+
+################################################
+# simple test dataset
+points = np.array([[10,  9], [ 9, 18], [16, 13], [11, 15], [12, 14], [18, 12],
+                   [ 2, 14], [ 6, 18], [ 9,  9], [10,  8], [ 6, 17], [ 5,  3],
+                   [13, 19], [ 3, 18], [ 8, 17], [ 9,  7], [ 3,  0], [13, 18],
+                   [15,  4], [13, 16]])
+points_solution_k_5 = np.array([[3, 0],[10,  8],[15,  4],[18, 12],[13, 18],[13, 19],
+                               [ 9, 18],[6, 18],[3, 18],[2, 14],[9, 9],[5, 3],[3, 0]
+                               ])
+def test_concaveHull_1_k_5():
+    hull = concaveHull(points,5)
+    assert np.array_equal(hull, points_solution_k_5)
+
+def test_concaveHull_1_k_3():
+    # this tests, if missed point (too far away) is detected and if the
+    # function is started again with increased k
+    hull = concaveHull(points,3)
+    assert np.array_equal(hull, points_solution_k_5)
+
+
+# points to test what happens if all points intersect
+points_intersect = np.array([[1,1],[10,3],[11,8],[9,14],[15,21],[-5,15],[-3,10],
+                            [2,5],    # from here the distracting points
+                            [9,10],[8,9],[8,11],[8,12],[9,11],[9,12]
+                            ])
+points_intersect_solution = np.array([[1, 1],[10,  3],[11,  8],[9, 14],[15, 21],
+                                     [-5, 15],[-3, 10],[1, 1]
+                                     ])
+def test_concaveHull_intersect():
+    hull = concaveHull(points_intersect, 5)
+    assert np.array_equal(hull, points_intersect_solution)
+
+def test_concaveHull_duplicates():
+    hull = concaveHull(np.vstack([points, points[:5]]), 5)
+    assert np.array_equal(hull, points_solution_k_5)
 
 
 
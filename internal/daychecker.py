@@ -1,27 +1,80 @@
 import os
-import re
-import random
-import exifread
-import simplekml
+import copy
 import numpy as np
 import pandas as pd
-from pathlib import Path
 from internal.concave_hull import concaveHull
+from internal.triage import serial_from_messages, fallback_serial
+from internal.resample import DEFAULT_SIGNALS, align_signals
+from internal.exifscan import EXIF_FIELDS, ExifScan, summarize, name_list, write_noncompliant
+from database.repository.exif_cache_repo import ExRepo
+from internal.geotag import photo_times, match_geotags, write_geotags
+from internal.simplify import track_coords, simplify
+from internal.kmlstyles import style_url, set_balloon_data
+from database.repository.track_repo import track_row
 from tests.healthtests import HealthTests
-from concurrent.futures import ThreadPoolExecutor
+from tests.batterytests import BatteryTests
+from tests.trigmatch import write_photo_report
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# ArduPilot EV ids
+ARMED = 10
+DISARMED = 11
+
+# logs with fewer samples than this are analyzed serially: sending the
+# frames to a worker costs more than the tests
+PARALLEL_MIN_ROWS = 500000
+
+_pool = None
+
+
+def flight_pool():
+    """
+     Process pool shared by every log of the run, started on first use.
+
+     @return ProcessPoolExecutor
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _pool
+
+
+def analyze_flight(df_dict, drone_uid=None):
+    """
+     Run the health and battery tests of one flight. Module level so it can
+     be sent to a process pool.
+
+     @param df_dict - dict of DataFrames of the flight keyed by message type
+     @param drone_uid - serial number of the drone (selects the rules profile)
+
+     @return tuple (HealthTests, BatteryTests) with the results
+    """
+    report = HealthTests(
+        df_dict["RCOU"],
+        df_dict["VIBE"],
+        df_dict["POWR"],
+        df_dict["CAM"],
+        df_dict["TRIG"],
+        df_dict.get("IMU"),
+    ).run(drone_uid)
+    battery = BatteryTests(df_dict["BAT"], df_dict["CAM"]).run()
+    return report, battery
 
 
 # class containing functions for the data extraction/modeling and kml customization
 class DayChecker:
     messages = ["CAM", "EV", "BAT", "MSG", "POWR", "RCOU", "VIBE", "TRIG"]
 
-    def __init__(self, flight_log):
+    def __init__(self, flight_log, raw_imu=False):
         """
         Initialize the instance and run the program. This is the entry point for the class.
 
         @param flight_log - path to a BIN log file
+        @param raw_imu - also extract the raw IMU samples, for the vibration spectrum
         """
         self.flight_log = flight_log
+        self.messages = DayChecker.messages + (["IMU"] if raw_imu else [])
+        self.name = flight_log.name
         self.run()
 
     def create_csv(self):
@@ -43,7 +96,7 @@ class DayChecker:
             )
 
         with ThreadPoolExecutor() as executor:
-            executor.map(mycmd, DayChecker.messages)
+            executor.map(mycmd, self.messages)
 
     def create_df(self, csv_name):
         """
@@ -62,12 +115,12 @@ class DayChecker:
 
     def create_df_dict(self):
         """
-        Create and return a dictionary of dataframes. Keys are each of DayChecker.messages and values are their respective pandas DataFrames.
+        Create and return a dictionary of dataframes. Keys are each of the extracted messages and values are their respective pandas DataFrames.
 
 
         @return Dictionary of dataframes
         """
-        self.df_dict = {i: self.create_df(i) for i in DayChecker.messages}
+        self.df_dict = {i: self.create_df(i) for i in self.messages}
         return self.df_dict
 
     def delete_csv(self):
@@ -85,57 +138,49 @@ class DayChecker:
             os.remove(csv_file)
 
         with ThreadPoolExecutor() as executor:
-            executor.map(delete_all_csv, DayChecker.messages)
+            executor.map(delete_all_csv, self.messages)
 
-    def metadata_test(self):
+    def metadata_test(self, sample=None):
         """
-        Gets the metadata of random JPG files and run tests on it to make sure the JPG contains specific parameters.
+        Check the EXIF metadata (ISO, shutter speed, copyright and artist) of the JPG files of the flight folder. Only the EXIF header of each photo is read, in a thread pool, photos unchanged since a previous run come from the cache, and every photo (or an evenly spaced sample) is checked, so the results are reproducible. The non-compliant photos are written next to the log (<log>_camera.csv) and the first ones are named in the feedback.
 
+        @param sample - number of photos to check, or None for all of them
         """
         self.mdata_test = {}
-        img_path = self.flight_log.parent
-
-        def get_random_image_metadata():
-            """
-            Get metadata for a random image. This is useful for getting the EXIF data from an image taken as a sample of a bigger batch of images.
-
-
-            @return A dictionary of exif data for the image.
-            """
-            files = [f for f in os.listdir(img_path) if f.endswith(".JPG")]
-            random_file = random.choice(files)
-            with open(os.path.join(img_path, random_file), "rb") as f:
-                exif_data = exifread.process_file(f)
-            return exif_data
+        self.photo_metadata = None
+        self.noncompliant_photos = []
+        self.unreadable_photos = []
 
         try:
-            mdata = get_random_image_metadata()
-
-            # Camera's ISO
-            if 100 <= mdata["EXIF ISOSpeedRatings"].values[0] <= 1600:
-                self.mdata_test["ISO"] = ["OK"]
-            else:
-                self.mdata_test["ISO"] = ["FAIL", "Check camera ISO."]
-
-            # Camera's shutter speed
-            if str(mdata["EXIF ExposureTime"]) == "1/1600":
-                self.mdata_test["Shutter"] = ["OK"]
-            else:
-                self.mdata_test["Shutter"] = ["FAIL", "Check camera shutter speed."]
-
-            # Camera's copyright
-            if re.match(r"a[0-9]r[0-9]_[a-z]{3}", mdata["Thumbnail Copyright"].values):
-                self.mdata_test["Copyright"] = ["OK"]
-            else:
-                self.mdata_test["Copyright"] = ["FAIL", "Check camera copyright."]
-
-            # Camera's artist
-            if re.match(r"^\d{7}$", mdata["Image Artist"].values):
-                self.mdata_test["Artist"] = ["OK"]
-            else:
-                self.mdata_test["Artist"] = ["FAIL", "Check camera artist."]
-
-            keys = self.mdata_test.keys()
+            scanner = ExifScan(cache=ExRepo())
+            results = scanner.run(self.flight_log.parent, sample)
+            if results.empty:
+                raise FileNotFoundError(f"no JPG files in {self.flight_log.parent}")
+            self.photo_metadata = results
+            summary = summarize(results)
+            self.unreadable_photos = summary["unreadable"]
+            self.noncompliant_photos = results.loc[~results["camera_status"].isin(["OK", "UNREADABLE"]), "name"].tolist()
+            if self.noncompliant_photos or self.unreadable_photos:
+                write_noncompliant(results, self.flight_log.with_name(f"{self.flight_log.stem}_camera.csv"))
+
+            if self.unreadable_photos:
+                # reported apart from the camera settings, and overridden by them
+                self.mdata_test["Unreadable"] = [
+                    "WARN",
+                    f"{len(self.unreadable_photos)}/{summary['checked']} photos could not be read: {name_list(self.unreadable_photos)}",
+                ]
+
+            for field in EXIF_FIELDS:
+                failed = summary.get(field, [])
+                if failed:
+                    self.mdata_test[field] = [
+                        "FAIL",
+                        f"{scanner.feedbacks[field]} ({len(failed)}/{summary['checked']} photos: {name_list(failed)})",
+                    ]
+                else:
+                    self.mdata_test[field] = ["OK"]
+
+            keys = list(self.mdata_test.keys())
             # This method will set the result of the sensor test.
             if all(self.mdata_test[test][0] == "OK" for test in keys):
                 self.mdata_test["Result"] = ["OK", "no sensor issues"]
@@ -148,24 +193,92 @@ class DayChecker:
         except Exception as e:
             print(f"Error ocurred in the metadata test: {str(e)}")
 
-    def create_linestring(self, kml):
+    def geotag(self, csv_path=None, tolerance=0.9):
+        """
+         Link the JPG files of the flight folder to the CAM records of the log by capture time and sequence. Photos without a CAM record and CAM records without a photo are kept in geotags_missing and cam_orphans.
+
+         @param csv_path - optional geotag CSV written for photogrammetry tools
+         @param tolerance - maximum time error in seconds
+
+         @return pd.DataFrame with the position of each photo
+        """
+        photos = [p for p in self.flight_log.parent.iterdir() if p.suffix.upper() == ".JPG"]
+        self.geotags, orphans = match_geotags(photo_times(photos), self.df_dict["CAM"], tolerance)
+        self.geotags_missing = self.geotags.loc[self.geotags["missing_cam"], "name"].tolist()
+        self.cam_orphans = orphans.tolist()
+        if csv_path is not None:
+            write_geotags(self.geotags, csv_path)
+        return self.geotags
+
+    def photo_report_csv(self):
+        """
+         Write the trigger/feedback report of the flight next to the log
+         (<flight>_photos.csv): every photo with its status (ok, missing or
+         extra), latency and position, so the missing ones can be re-flown.
+        """
+        try:
+            write_photo_report(
+                self.report.photo_report,
+                np.array(self.report.trig_extra, dtype=np.int64),
+                self.df_dict["CAM"],
+                self.flight_log.with_name(f"{os.path.splitext(self.name)[0]}_photos.csv"),
+            )
+        except Exception as e:
+            print(f"Error ocurred while writing the photo report: {str(e)}")
+
+    def geotag_test(self):
+        """
+         Geotag the photos of the flight folder and write the geotag CSV next
+         to the log (<log>_geotags.csv). The number of photos without a CAM
+         record and of CAM records without a photo goes to geotag_feedback,
+         shown in the balloon. Skipped when the folder has no photos.
+        """
+        self.geotags_missing = []
+        self.cam_orphans = []
+        self.geotag_feedback = "no photos"
+        if self.photo_metadata is None:
+            return
+        try:
+            self.geotag(self.flight_log.with_name(f"{self.flight_log.stem}_geotags.csv"))
+            if self.geotags_missing or self.cam_orphans:
+                self.geotag_feedback = f"{len(self.geotags_missing)} photos without CAM record, {len(self.cam_orphans)} CAM records without photo."
+            else:
+                self.geotag_feedback = f"All {self.geotags.shape[0]} photos geotagged."
+        except Exception as e:
+            print(f"Error ocurred while geotagging: {str(e)}")
+
+    def create_linestring(self, kml, tolerance=None):
         """Creates a linestring feature based on the lat and lon of the CAM messages within the log.
 
         Args:
             kml (simplekml.Kml): The Kml object that will hold the
             linestring
+            tolerance (float): optional Douglas-Peucker tolerance in metres,
+            to drop points that do not change the shape of the track
 
         Returns:
             simplekml.LineString: The LineString object
         """
 
-        ls = kml.newlinestring(name=self.flight_log.name)
-        coords_list = [
-            (row.Lng, row.Lat) for index, row in self.df_dict["CAM"].iterrows()
-        ]
-        ls.coords = coords_list
+        ls = kml.newlinestring(name=self.name)
+        ls.coords = simplify(track_coords(self.df_dict["CAM"]), tolerance)
         return ls
 
+    def track_row(self):
+        """
+         Full resolution track of the flight, as a row of the track table,
+         so the fleet map can be rebuilt later without decoding the log.
+
+         @return dict with the columns of the track table
+        """
+        return track_row(
+            self.flight_timestamp,
+            self.drone_uid,
+            self.name,
+            track_coords(self.df_dict["CAM"]),
+            style_url("agr", self.camera_ok()),
+        )
+
     #TODO: add condition for merging polygons of merged flights
     def create_polygon(self, kml, container_index):
         """
@@ -177,168 +290,182 @@ class DayChecker:
          
          @return The polygon created in the KML file and added to
         """
-        poly = kml.containers[container_index].newpolygon(name=self.flight_log.name)
-        coords_list = [
-            (row.Lng, row.Lat) for index, row in self.df_dict["CAM"].iterrows()
-        ]
-        coords_list = np.array(coords_list)
-        poly.outerboundaryis = concaveHull(coords_list, 3)
+        poly = kml.containers[container_index].newpolygon(name=self.name)
+        poly.outerboundaryis = concaveHull(track_coords(self.df_dict["CAM"]), 3)
         return poly
 
-    def rgb_style(self, feature):
+    def aligned_signals(self, signals=DEFAULT_SIGNALS, rate=10.0, method="linear"):
+        """
+         Signals of the flight on a common time grid, as one float32 matrix,
+         for tests that correlate messages logged at different rates (ex.:
+         motors imbalance against vibration, Vcc sag against current draw).
+
+         @param signals - list of message.column names
+         @param rate - grid rate in Hz
+         @param method - "linear" or "previous" (asof)
+
+         @return internal.resample.AlignedSignals
+        """
+        return align_signals(self.df_dict, signals, rate, method)
+
+    def camera_ok(self):
+        """
+         Result of the camera metadata test, used to pick the line style.
+         A missing or broken test counts as OK, so the line keeps its
+         default color.
+
+         @return bool
+        """
+        try:
+            return "OK" in self.mdata_test["Result"][0]
+        except (AttributeError, KeyError, IndexError, TypeError):
+            return True
+
+    def rgb_style(self, feature, styles=""):
         """
          Set the style of the simplekml.LineString. It is used to indicate the sensor used in the flight.
+         The style is one of the shared styles of the document (internal.kmlstyles).
          
          @param feature - linestring to be stylized
+         @param styles - file holding the shared styles, if not the same document
         """
-        rgb_style = simplekml.Style()
-        rgb_style.linestyle.width = 3.0
-        
-        #Different color line if the test results are good or bad
-        try:
-            
-            if "OK" in self.mdata_test["Result"][0]:
-                rgb_style.linestyle.color = simplekml.Color.whitesmoke
-            else:
-                rgb_style.linestyle.color = simplekml.Color.black
-            feature.style = rgb_style
-            
-        #Ignores the color change if there is an issue with mdata_test
-        except:
-            rgb_style.linestyle.color = simplekml.Color.whitesmoke
-            feature.style = rgb_style
+        feature.placemark.styleurl = style_url("rgb", self.camera_ok(), styles)
 
-    def agr_style(self, feature):
+    def agr_style(self, feature, styles=""):
         """
         Set the style of the simplekml.LineString. It is used to indicate the sensor used in the flight.
+        The style is one of the shared styles of the document (internal.kmlstyles).
          
          @param feature - linestring to be stylized
+         @param styles - file holding the shared styles, if not the same document
         """
-        agr_style = simplekml.Style()
-        agr_style.linestyle.width = 2.0
-        try:
-            # This method is called when the test result is OK.
-            if "OK" in self.mdata_test["Result"][0]:
-                agr_style.linestyle.color = simplekml.Color.red
-            else:
-                agr_style.linestyle.color = simplekml.Color.yellow
-            feature.style = agr_style
-        except:
-            agr_style.linestyle.color = simplekml.Color.red
-            feature.style = agr_style
+        feature.placemark.styleurl = style_url("agr", self.camera_ok(), styles)
+
+    def flight_segments(self, min_duration=30.0):
+        """
+         Split the log into flights using the EV arm/disarm events, so logs
+         with several arm cycles are not merged into one report. An arm
+         without a disarm lasts until the end of the log. Arm cycles shorter
+         than min_duration (ground tests) are ignored.
+
+         @param min_duration - minimum flight length in seconds
+
+         @return list of (start, end) timestamps, or an empty list when the
+         log has no usable arm cycle
+        """
+        ev = self.df_dict["EV"]
+        if "Id" not in ev or ev.empty:
+            return []
+        ids = ev["Id"].to_numpy()
+        times = ev.index
+        end_of_log = max(df.index.max() for df in self.df_dict.values() if not df.empty)
+
+        segments = []
+        start = None
+        for i in np.flatnonzero((ids == ARMED) | (ids == DISARMED)):
+            if ids[i] == ARMED and start is None:
+                start = times[i]
+            elif ids[i] == DISARMED and start is not None:
+                segments.append((start, times[i]))
+                start = None
+        if start is not None:
+            segments.append((start, end_of_log))
+        return [(a, b) for a, b in segments if (b - a).total_seconds() >= min_duration]
+
+    def split_flights(self):
+        """
+         Create one DayChecker per flight segment of the log, sharing the log
+         data (serial number, metadata tests) and holding only the messages
+         of its segment. A log without arm cycles is a single flight.
+
+         @return list of DayChecker
+        """
+        segments = self.flight_segments()
+        if not segments:
+            return [self]
+        flights = []
+        for i, (start, end) in enumerate(segments):
+            flight = copy.copy(self)
+            flight.df_dict = {
+                msg_type: df if msg_type == "MSG" else df[(df.index >= start) & (df.index <= end)]
+                for msg_type, df in self.df_dict.items()
+            }
+            if len(segments) > 1:
+                flight.name = f"{self.flight_log.stem}_{i + 1}{self.flight_log.suffix}"
+            flights.append(flight)
+        return flights
+
+    def analyze_flights(self):
+        """
+         Run the health tests of every flight of the log. Long logs with
+         several flights are analyzed in the shared process pool, one flight
+         per worker. The first flight is stamped with the first EV of the
+         log, as single flight logs always were, so re-ingesting a log keeps
+         its key; the next ones with their own first EV (arm time).
+        """
+        frames = [flight.df_dict for flight in self.flights]
+        rows = sum(df.shape[0] for frame in frames for df in frame.values())
+        if len(frames) > 1 and rows >= PARALLEL_MIN_ROWS:
+            results = list(flight_pool().map(analyze_flight, frames, [self.drone_uid] * len(frames)))
+        else:
+            results = [analyze_flight(frame, self.drone_uid) for frame in frames]
+
+        for i, (flight, (report, battery)) in enumerate(zip(self.flights, results)):
+            flight.report = report
+            flight.battery = battery
+            ev = self.df_dict["EV"] if i == 0 else flight.df_dict["EV"]
+            flight.flight_timestamp = str(ev.index[0].timestamp())
+            flight.photo_report_csv()
 
     def run(self):
         """
-        This is the main method of the class. It will create the CSV files, the dataframes from the data files, and then delete the CSV files. It also runs the metadata tests and create the health reports.
+        This is the main method of the class. It will create the CSV files, the dataframes from the data files, and then delete the CSV files. It also runs the metadata and geotag tests, splits the log into flights and create the health reports of each one.
         """
         self.create_csv()
         self.create_df_dict()
         self.delete_csv()
         self.metadata_test()
+        self.geotag_test()
+
+        self.drone_uid = serial_from_messages(self.df_dict["MSG"].Message)
+        if self.drone_uid is None:
+            # drone_uid is NOT NULL in the database
+            self.drone_uid = fallback_serial(self.df_dict["MSG"].Message)
+            print(f"No board id in {self.name}, using {self.drone_uid} as drone uid.")
+        self.flights = self.split_flights()
+        self.analyze_flights()
+        self.flight_timestamp = self.flights[0].flight_timestamp
+        self.report = self.flights[0].report
+        self.battery = self.flights[0].battery
 
-        self.flight_timestamp = str(self.df_dict["EV"].index[0].timestamp())
-        # TODO: fix a bug where sometimes the version is imported instead of serial number
-        self.drone_uid = self.df_dict["MSG"].Message[2][9:].replace(" ", "")
-        self.report = HealthTests(
-            self.df_dict["RCOU"],
-            self.df_dict["VIBE"],
-            self.df_dict["POWR"],
-            self.df_dict["CAM"],
-            self.df_dict["TRIG"],
-        )
-        self.report.run()
-    #TODO: error dealing when BAT sheet is filled with NaN
     def create_balloon_report(self, feature):
         """
-         Create a report for the linestrings and save it to the KML file. It is used to show a balloon with useful information in google earth.
+         Attach the report values of the flight to the linestring. The balloon
+         itself is the template of the shared styles (internal/report_temp.html),
+         filled in by google earth from these values.
          
          @param feature - linestring to be stylized
         """
-        flight_data = self.df_dict["EV"].index[0]
-        flight_time = self.df_dict["EV"].index[-1] - flight_data
-        base_path = Path(__file__).parent
-        template_path = (base_path / "../internal/motororder-quad-x-2d.png").resolve()
-
-        # TODO: convert html to file instead of raw coding
-        # TODO: balloon being displayed as default
-        feature.balloonstyle.text = f"""<html>
-                                        <table align="center" border="0" cellpadding="0" cellspacing="0" style="border-collapse:collapse; height:270px; width:400px">
-                                        <tbody>
-                                            <tr>
-                                                <td>
-                                                <table align="center" border="0" cellpadding="0" cellspacing="0" style="border-collapse:collapse; height:100%; margin-left:auto; margin-right:auto; opacity:0.95; width:100%">
-                                                    <tbody>
-                                                        <tr>
-                                                            <td style="height:90px; text-align:center; vertical-align:middle; width:50%">
-                                                            <p><span style="color:#000000"><strong><span style="font-family:Tahoma,Geneva,sans-serif">Flight time:</span></strong></span></p>
-
-                                                            <p><span style="font-size:20px"><strong><span style="font-family:Tahoma,Geneva,sans-serif">{str(flight_time.components.minutes)}m {str(flight_time.components.seconds)}s</span></strong></span></p>
-                                                            </td>
-                                                            <td style="height:90px; text-align:center; vertical-align:middle; width:50%">
-                                                            <p><span style="color:#000000"><strong><span style="font-family:Tahoma,Geneva,sans-serif">Batt. cons.:</span></strong></span></p>
-
-                                                            <p><span style="font-size:20px"><strong><span style="font-family:Tahoma,Geneva,sans-serif">{str(round(self.df_dict['BAT'].CurrTot[-1]))} mAh</span></strong></span></p>
-                                                            </td>
-                                                        </tr>
-                                                        <tr>
-                                                            <td style="height:90px; text-align:center; vertical-align:middle; width:50%">
-                                                            <p><span style="color:#000000"><strong><span style="font-family:Tahoma,Geneva,sans-serif">Camera:</span></strong></span></p>
-
-                                                            <p><span style="font-size:20px"><strong><span style="font-family:Tahoma,Geneva,sans-serif">{self.mdata_test['Result'][0]}</span></strong></span></p>
-
-                                                            <p><span style="color:#bdc3c7"><em><span style="font-family:Tahoma,Geneva,sans-serif">{self.mdata_test['Result'][1]}&nbsp;</span></em></span></p>
-                                                            </td>
-                                                            <td style="height:90px; text-align:center; vertical-align:middle; width:50%">
-                                                            <p><span style="color:#000000"><strong><span style="font-family:Tahoma,Geneva,sans-serif">Motors:</span></strong></span></p>
-
-                                                            <p><span style="font-size:20px"><strong><span style="font-family:Tahoma,Geneva,sans-serif">{self.report.motors_status}</span></strong></span></p>
-
-                                                            <p><span style="color:#bdc3c7"><em><span style="font-family:Tahoma,Geneva,sans-serif">{self.report.motors_feedback}&nbsp;</span></em></span></p>
-                                                            </td>
-                                                        </tr>
-                                                        <tr>
-                                                            <td style="height:90px; text-align:center; vertical-align:middle; width:50%">
-                                                            <p><span style="color:#000000"><strong><span style="font-family:Tahoma,Geneva,sans-serif">IMU:</span></strong></span></p>
-
-                                                            <p><span style="font-size:20px"><strong><span style="font-family:Tahoma,Geneva,sans-serif">{self.report.imu_status}</span></strong></span></p>
-
-                                                            <p><span style="color:#bdc3c7"><em><span style="font-family:Tahoma,Geneva,sans-serif">{self.report.imu_feedback}</span></em></span></p>
-
-                                                            <p>&nbsp;</p>
-                                                            </td>
-                                                            <td style="height:90px; text-align:center; vertical-align:middle; width:50%">
-                                                            <p><span style="color:#000000"><strong><span style="font-family:Tahoma,Geneva,sans-serif">Board voltage:</span></strong></span></p>
-
-                                                            <p><span style="font-size:20px"><strong><span style="font-family:Tahoma,Geneva,sans-serif">{self.report.vcc_status}</span></strong></span></p>
-
-                                                            <p><span style="color:#bdc3c7"><em><span style="font-family:Tahoma,Geneva,sans-serif">{self.report.vcc_feedback}&nbsp;</span></em></span></p>
-                                                            </td>
-                                                        </tr>
-                                                    </tbody>
-                                                </table>
-
-                                                <p>&nbsp;</p>
-                                                </td>
-                                                <td>&nbsp;
-                                                <table align="center" border="0" cellpadding="0" cellspacing="0" style="border-collapse:collapse; height:100%; margin-left:auto; margin-right:auto; width:100%">
-                                                    <tbody>
-                                                        <tr>
-                                                            <td style="height:55px; text-align:center; vertical-align:middle; width:50%"><span style="font-size:24px"><span style="font-family:Tahoma,Geneva,sans-serif"><span style="color:#2ecc71"><strong>{self.report.motors_pwm_list[2]}</strong></span></span></span></td>
-                                                            <td style="height:55px; text-align:center; vertical-align:middle; width:50%"><span style="font-size:24px"><span style="font-family:Tahoma,Geneva,sans-serif"><strong><span style="color:#3498db">{self.report.motors_pwm_list[0]}</span></strong></span></span></td>
-                                                        </tr>
-                                                        <tr>
-                                                            <td colspan="2" style="text-align:center; vertical-align:middle"><span style="font-family:Tahoma,Geneva,sans-serif"><img alt="" src="{template_path.as_uri()}" style="border-style:solid; border-width:0px; height:159px; margin-left:20px; margin-right:20px; width:149px" /></span></td>
-                                                        </tr>
-                                                        <tr>
-                                                            <td style="height:55px; text-align:center; vertical-align:middle; width:50%"><span style="font-size:24px"><span style="font-family:Tahoma,Geneva,sans-serif"><strong><span style="color:#3498db">{self.report.motors_pwm_list[1]}</span></strong></span></span></td>
-                                                            <td style="height:55px; text-align:center; vertical-align:middle; width:50%"><span style="font-size:24px"><span style="font-family:Tahoma,Geneva,sans-serif"><span style="color:#2ecc71"><strong>{self.report.motors_pwm_list[3]}</strong></span></span></span></td>
-                                                        </tr>
-                                                    </tbody>
-                                                </table>
-
-                                                <p>&nbsp;</p>
-                                                </td>
-                                            </tr>
-                                        </tbody>
-                                    </table>
-                                </html>"""
+        flight_time = self.df_dict["EV"].index[-1] - self.df_dict["EV"].index[0]
+        consumed = self.battery.consumed_mah
+        set_balloon_data(
+            feature,
+            {
+                "flight_time": f"{flight_time.components.minutes}m {flight_time.components.seconds}s",
+                "consumed_mah": "n/a" if np.isnan(consumed) else round(consumed),
+                "camera_status": self.mdata_test["Result"][0],
+                "camera_feedback": self.mdata_test["Result"][1],
+                "geotag_feedback": self.geotag_feedback,
+                "trig_feedback": self.report.trig_feedback,
+                "trig_detail": self.report.trig_detail,
+                "motors_status": self.report.motors_status,
+                "motors_feedback": self.report.motors_feedback,
+                "imu_status": self.report.imu_status,
+                "imu_feedback": self.report.imu_feedback,
+                "imu_spectrum_feedback": self.report.imu_spectrum_feedback,
+                "window_feedback": self.report.window_feedback,
+                "vcc_status": self.report.vcc_status,
+                "vcc_feedback": self.report.vcc_feedback,
+                **{f"m{i + 1}_avg_pwm": pwm for i, pwm in enumerate(self.report.motors_pwm_list[:4])},
+            },
+        )
@@ -0,0 +1,382 @@
+import io
+import os
+import struct
+import exifread
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from tests.ruleengine import RuleEngine
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+APP1 = 0xE1
+SOS = 0xDA
+HEADER_READ = 64 * 1024  # APP1 segments are at most 64 KB
+
+# EXIF tags checked on the photos, named as the EXIF signals of the rules file
+EXIF_FIELDS = {
+    "ISO": ["EXIF ISOSpeedRatings"],
+    "Shutter": ["EXIF ExposureTime"],
+    "Copyright": ["Thumbnail Copyright", "Image Copyright"],
+    "Artist": ["Image Artist"],
+}
+
+
+def read_app1(image_path, read_size=HEADER_READ):
+    """
+     Read only the EXIF (APP1) segment of a JPEG, walking the segment
+     markers from the start of the file, instead of the whole image.
+
+     @param image_path - path to a JPG file
+     @param read_size - bytes read at a time
+
+     @return bytes of a minimal JPEG (SOI, APP1, EOI) or None without EXIF
+    """
+    with open(image_path, "rb") as image:
+        data = image.read(read_size)
+        if data[:2] != SOI:
+            return None
+        offset = 2
+        while True:
+            while len(data) < offset + 4:
+                more = image.read(read_size)
+                if not more:
+                    return None
+                data += more
+            if data[offset] != 0xFF:
+                return None
+            marker = data[offset + 1]
+            if marker == SOS or marker == 0xD9:
+                return None
+            length = struct.unpack(">H", data[offset + 2: offset + 4])[0]
+            end = offset + 2 + length
+            if marker == APP1:
+                while len(data) < end:
+                    more = image.read(max(read_size, end - len(data)))
+                    if not more:
+                        return None
+                    data += more
+                segment = data[offset:end]
+                if segment[4:10] == b"Exif\x00\x00":
+                    return SOI + segment + EOI
+            offset = end
+
+
+def _value(tags, names):
+    for name in names:
+        if name in tags:
+            tag = tags[name]
+            if name == "EXIF ExposureTime":
+                return str(tag)
+            values = tag.values
+            if isinstance(values, (list, tuple)):
+                return values[0] if values else None
+            return str(values).strip()
+    return None
+
+
+def photo_metadata(image_path):
+    """
+     EXIF fields checked on one photo, read from its header only.
+
+     @param image_path - path to a JPG file
+
+     @return dict with name, the EXIF_FIELDS values (None when missing) and
+     error, True when the photo could not be read (ex.: a share dropped)
+    """
+    row = {"name": Path(image_path).name, "error": False}
+    try:
+        header = read_app1(image_path)
+        tags = exifread.process_file(io.BytesIO(header), details=False) if header else {}
+    except (OSError, ValueError, struct.error):
+        row["error"] = True
+        tags = {}
+    for field, names in EXIF_FIELDS.items():
+        row[field] = _value(tags, names)
+    return row
+
+
+def sample_photos(photos, size=None):
+    """
+     Deterministic stratified sample: photos evenly spaced along the
+     mission, in name (capture) order, so repeated runs check the same ones.
+
+     @param photos - list of photo paths
+     @param size - number of photos, or None for all of them
+
+     @return sorted list of photo paths
+    """
+    photos = sorted(photos)
+    if size is None or size >= len(photos):
+        return photos
+    index = np.unique(np.linspace(0, len(photos) - 1, size).round().astype(int))
+    return [photos[i] for i in index]
+
+
+class ExifScan:
+    def __init__(self, engine=None, max_workers=32, cache=None):
+        """
+         Initialize the object. It reads the EXIF header of every photo of a
+         mission (or of a sample) in a thread pool, since the reads are
+         bound by disk or network latency, and checks the camera rules of
+         the rules file on each photo.
+
+         @param engine - RuleEngine with the camera rules
+         @param max_workers - number of threads
+         @param cache - ExRepo (or anything with lookup and store) holding
+         the fields of photos already read, keyed by path, size and mtime
+        """
+        self.engine = engine or RuleEngine()
+        self.max_workers = max_workers
+        self.cache = cache
+        self.feedbacks = {}
+        self.cache_hits = 0
+
+    def read(self, photos):
+        """
+         Read the EXIF fields of many photos. With a cache, only photos that
+         are new or changed since they were cached are opened. Photos that
+         could not be read are not cached, so they are read again next time.
+
+         @param photos - list of (path, size, mtime) tuples
+
+         @return pd.DataFrame with one row per photo
+        """
+        keys = [(Path(path).as_posix(), size, mtime) for path, size, mtime in photos]
+        cached = self.cache.lookup(keys) if self.cache is not None else {}
+        missing = [key for key in keys if key[0] not in cached]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            fresh = list(executor.map(photo_metadata, [path for path, size, mtime in missing]))
+        if self.cache is not None:
+            self.cache.store([
+                {"path": path, "size": size, "mtime": mtime, **row}
+                for (path, size, mtime), row in zip(missing, fresh)
+                if not row["error"]
+            ])
+        self.cache_hits = len(cached)
+
+        rows = {path: row for (path, size, mtime), row in zip(missing, fresh)}
+        for path, fields in cached.items():
+            rows[path] = {"name": Path(path).name, "error": False, **fields}
+        return pd.DataFrame(
+            [rows[path] for path, size, mtime in keys], columns=["name"] + list(EXIF_FIELDS) + ["error"]
+        ).astype({"error": bool})
+
+    def check(self, metadata, profile="default"):
+        """
+         Check every camera rule on every photo, vectorized per rule.
+
+         @param metadata - pd.DataFrame from read
+         @param profile - name of the rules profile
+
+         @return pd.DataFrame with a boolean column per rule and the status
+         and feedback of each photo (first failing rule). Photos that could
+         not be read are UNREADABLE and pass every rule, since their tags
+         are unknown rather than wrong.
+        """
+        unreadable = metadata["error"].to_numpy(dtype=bool) if "error" in metadata else np.zeros(metadata.shape[0], dtype=bool)
+        table = pd.DataFrame({"name": metadata["name"]})
+        status = np.full(metadata.shape[0], "OK", dtype=object)
+        feedback = np.full(metadata.shape[0], self.engine.tests["camera"]["ok"], dtype=object)
+        status[unreadable] = "UNREADABLE"
+        feedback[unreadable] = "Photo could not be read."
+        decided = unreadable.copy()
+        for rule, (feature, op) in self.engine.profiles[profile]:
+            if rule["test"] != "camera":
+                continue
+            field = feature.split(".")[1]
+            values = metadata[field]
+            # a missing tag fails the check, as a wrong value does
+            failed = (op(values) | values.isna().to_numpy()) & ~unreadable
+            table[field] = ~failed
+            self.feedbacks[field] = rule["feedback"]
+            hit = failed & ~decided
+            status[hit] = rule["level"]
+            feedback[hit] = rule["feedback"]
+            decided |= hit
+        table["camera_status"] = status
+        table["camera_feedback"] = feedback
+        return table
+
+    def run(self, folder, sample=None, profile="default"):
+        """
+         Scan the photos of a folder. This is the main method.
+
+         @param folder - folder with the JPG files
+         @param sample - number of photos to check, or None for all of them
+         @param profile - name of the rules profile
+
+         @return pd.DataFrame with the EXIF fields and checks of each photo
+        """
+        with os.scandir(folder) as entries:
+            # size and mtime come with the listing on Windows shares
+            stats = {
+                entry.path: (entry.stat().st_size, entry.stat().st_mtime)
+                for entry in entries
+                if entry.is_file() and entry.name.upper().endswith(".JPG")
+            }
+        if self.cache is not None and hasattr(self.cache, "invalidate_folder"):
+            self.cache.invalidate_folder(Path(folder).as_posix(), {Path(p).as_posix() for p in stats})
+        photos = sample_photos(list(stats), sample)
+        metadata = self.read([(path, *stats[path]) for path in photos])
+        return metadata.merge(self.check(metadata, profile), on="name", suffixes=("", "_ok"))
+
+
+def summarize(results):
+    """
+     Summary of a scan: number of photos checked and, for each EXIF field,
+     the photos that do not comply.
+
+     @param results - pd.DataFrame from ExifScan.run
+
+     @return dict with checked, noncompliant (count), the unreadable photos
+     and a list of names per field
+    """
+    status = results["camera_status"]
+    summary = {
+        "checked": int(results.shape[0]),
+        "noncompliant": int((~status.isin(["OK", "UNREADABLE"])).sum()),
+        "unreadable": results.loc[status == "UNREADABLE", "name"].tolist(),
+    }
+    for field in EXIF_FIELDS:
+        column = f"{field}_ok"
+        if column in results:
+            summary[field] = results.loc[~results[column], "name"].tolist()
+    return summary
+
+
+def name_list(names, limit=3):
+    """
+     First few names of a list, for feedback texts.
+
+     @param names - list of photo names
+     @param limit - names shown
+
+     @return str like "IMG_0003.JPG, IMG_0007.JPG and 5 more"
+    """
+    shown = ", ".join(names[:limit])
+    return f"{shown} and {len(names) - limit} more" if len(names) > limit else shown
+
+
+def write_noncompliant(results, csv_path):
+    """
+     Write the photos that failed a camera rule, with their EXIF fields and
+     the rule they failed, so they can be found among the whole mission.
+     Unreadable photos are listed too, with their own status.
+
+     @param results - pd.DataFrame from ExifScan.run
+     @param csv_path - output file
+
+     @return number of photos written
+    """
+    failed = results[results["camera_status"] != "OK"]
+    failed[["name", *EXIF_FIELDS, "camera_status", "camera_feedback"]].to_csv(csv_path, index=False)
+    return failed.shape[0]
+
+
+############################################################
+## tests
+############################################################
+
+def _jpeg(artist, copyright, iso, exposure):
+    def ascii_entry(tag, text):
+        data = text.encode() + b"\x00"
+        return tag, 2, len(data), data
+
+    def ifd(entries, start, next_ifd):
+        size = 2 + 12 * len(entries) + 4
+        head, data = struct.pack("<H", len(entries)), b""
+        for tag, kind, count, value in entries:
+            if len(value) <= 4:
+                head += struct.pack("<HHI", tag, kind, count) + value.ljust(4, b"\x00")
+            else:
+                head += struct.pack("<HHII", tag, kind, count, start + size + len(data))
+                data += value
+        return head + struct.pack("<I", next_ifd) + data
+
+    exif_entries = [(0x829A, 5, 1, struct.pack("<II", *exposure)), (0x8827, 3, 1, struct.pack("<H", iso))]
+    ifd1_entries = [ascii_entry(0x8298, copyright)]
+    ifd0_entries = [ascii_entry(0x013B, artist), (0x8769, 4, 1, b"")]
+    ifd0_size = len(ifd(ifd0_entries, 8, 0))
+    ifd1_start = 8 + ifd0_size
+    exif_start = ifd1_start + len(ifd(ifd1_entries, ifd1_start, 0))
+    ifd0_entries[1] = (0x8769, 4, 1, struct.pack("<I", exif_start))
+    tiff = b"II*\x00" + struct.pack("<I", 8)
+    tiff += ifd(ifd0_entries, 8, ifd1_start) + ifd(ifd1_entries, ifd1_start, 0) + ifd(exif_entries, exif_start, 0)
+    app1 = b"Exif\x00\x00" + tiff
+    app0 = b"JFIF\x00" + b"\x00" * 9
+    return (
+        SOI
+        + b"\xff\xe0" + struct.pack(">H", len(app0) + 2) + app0
+        + b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1
+        + b"\xff\xda" + b"\x00" * 50000 + EOI
+    )
+
+
+def test_exif_scan(folder=Path("/tmp/exifscan_test")):
+    folder.mkdir(exist_ok=True)
+    for i in range(40):
+        iso = 3200 if i == 7 else 200
+        artist = "12345" if i in (3, 7) else "1234567"
+        (folder / f"IMG_{i:04d}.JPG").write_bytes(_jpeg(artist, "a1r2_abc", iso, (1, 1600)))
+    (folder / "IMG_9999.JPG").write_bytes(SOI + b"\xff\xda" + b"\x00" * 10 + EOI)
+
+    row = photo_metadata(folder / "IMG_0000.JPG")
+    assert row == {"name": "IMG_0000.JPG", "error": False, "ISO": 200, "Shutter": "1/1600", "Copyright": "a1r2_abc", "Artist": "1234567"}
+    assert photo_metadata(folder / "IMG_9999.JPG")["error"] is False
+    assert photo_metadata(folder / "gone.JPG")["error"] is True
+
+    results = ExifScan().run(folder)
+    summary = summarize(results)
+    assert summary["checked"] == 41 and summary["noncompliant"] == 3
+    assert summary["ISO"] == ["IMG_0007.JPG", "IMG_9999.JPG"]
+    assert summary["Artist"] == ["IMG_0003.JPG", "IMG_0007.JPG", "IMG_9999.JPG"]
+    assert summary["Shutter"] == ["IMG_9999.JPG"]
+
+    assert name_list(summary["Artist"]) == "IMG_0003.JPG, IMG_0007.JPG, IMG_9999.JPG"
+    assert name_list(summary["Artist"], limit=1) == "IMG_0003.JPG and 2 more"
+    assert write_noncompliant(results, folder / "noncompliant.csv") == 3
+    written = pd.read_csv(folder / "noncompliant.csv")
+    assert written["name"].tolist() == ["IMG_0003.JPG", "IMG_0007.JPG", "IMG_9999.JPG"]
+    (folder / "noncompliant.csv").unlink()
+
+    assert len(ExifScan().run(folder, sample=10)) == 10
+
+    class MemoryCache:
+        def __init__(self):
+            self.rows = {}
+
+        def lookup(self, files):
+            return {
+                p: {f: self.rows[p][f] for f in EXIF_FIELDS}
+                for p, size, mtime in files
+                if p in self.rows and (self.rows[p]["size"], self.rows[p]["mtime"]) == (size, mtime)
+            }
+
+        def store(self, rows):
+            self.rows.update({row["path"]: row for row in rows})
+
+    scan = ExifScan(cache=MemoryCache())
+    first = scan.run(folder)
+    assert scan.cache_hits == 0
+    (folder / "IMG_0003.JPG").write_bytes(_jpeg("7654321", "a1r2_abc", 200, (1, 1600)))
+    second = scan.run(folder)
+    assert scan.cache_hits == 40
+    assert summarize(second)["Artist"] == ["IMG_0007.JPG", "IMG_9999.JPG"]
+    assert first.drop(columns=["Artist", "Artist_ok", "camera_status", "camera_feedback"]).equals(
+        second.drop(columns=["Artist", "Artist_ok", "camera_status", "camera_feedback"])
+    )
+    # a photo that could not be read is not cached, and is not reported as
+    # breaking the camera rules
+    metadata = scan.read([((folder / "gone.JPG").as_posix(), 100, 1.0), ((folder / "IMG_0003.JPG").as_posix(), 1, 1.0)])
+    assert (folder / "gone.JPG").as_posix() not in scan.cache.rows
+    assert metadata["error"].tolist() == [True, False]
+    checked = metadata.merge(scan.check(metadata), on="name", suffixes=("", "_ok"))
+    assert checked["camera_status"].tolist() == ["UNREADABLE", "OK"]
+    summary = summarize(checked)
+    assert summary["unreadable"] == ["gone.JPG"] and summary["noncompliant"] == 0
+    assert all(summary[field] == [] for field in EXIF_FIELDS)
+    for image in folder.iterdir():
+        image.unlink()
+    folder.rmdir()
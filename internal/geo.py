@@ -0,0 +1,36 @@
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # mean earth radius in meters
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+     Great-circle distance between points, vectorized over arrays.
+
+     @param lat1, lon1 - coordinates of the first points in degrees
+     @param lat2, lon2 - coordinates of the second points in degrees
+
+     @return distances in meters
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def track_length(lat, lon):
+    """
+     Length of a track. Points without a position (NaN or 0, 0 before the
+     GPS fix) are skipped.
+
+     @param lat - latitudes in degrees
+     @param lon - longitudes in degrees
+
+     @return length in meters
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    valid = ~np.isnan(lat) & ~np.isnan(lon) & ((lat != 0) | (lon != 0))
+    lat, lon = lat[valid], lon[valid]
+    if lat.size < 2:
+        return 0.0
+    return float(haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
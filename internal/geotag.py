@@ -0,0 +1,184 @@
+import io
+import struct
+import exifread
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from internal.exifscan import read_app1
+
+
+def capture_time(image_path):
+    """
+     Capture time of a photo (DateTimeOriginal plus SubSecTimeOriginal),
+     read from its EXIF header only.
+
+     @param image_path - path to a JPG file
+
+     @return tuple (name, capture time text or None, subseconds text or None)
+    """
+    name = Path(image_path).name
+    try:
+        header = read_app1(image_path)
+        tags = exifread.process_file(io.BytesIO(header), details=False) if header else {}
+    except (OSError, ValueError, struct.error):
+        tags = {}
+    captured = tags.get("EXIF DateTimeOriginal") or tags.get("Image DateTime")
+    subsec = tags.get("EXIF SubSecTimeOriginal")
+    return name, str(captured) if captured else None, str(subsec).strip() if subsec else None
+
+
+def photo_times(photos, max_workers=32):
+    """
+     Capture times of many photos, read in a thread pool.
+
+     @param photos - list of photo paths
+
+     @return pd.DataFrame with name and time (unix seconds in camera clock,
+     NaN when the photo has no capture time), in name order
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        rows = list(executor.map(capture_time, sorted(photos)))
+    df = pd.DataFrame(rows, columns=["name", "captured", "subsec"])
+    captured = pd.to_datetime(df["captured"], format="%Y:%m:%d %H:%M:%S", errors="coerce")
+    subsec = pd.to_numeric("0." + df["subsec"].fillna("0").str.replace(r"\D", "", regex=True), errors="coerce")
+    df["time"] = captured.astype("int64").where(captured.notna()) / 1e9 + subsec.fillna(0)
+    return df[["name", "time"]]
+
+
+def _pair(photo_times, cam_times, offset, tolerance):
+    """
+     One-to-one nearest-time pairing of photos and CAM records, after
+     shifting the photo times by the camera clock offset. Both inputs
+     must be sorted.
+
+     @return tuple (cam position of each photo or -1, time error of each photo)
+    """
+    shifted = photo_times - offset
+    right = np.clip(np.searchsorted(cam_times, shifted), 1, max(cam_times.size - 1, 1))
+    left = right - 1
+    if cam_times.size == 1:
+        right = left = np.zeros_like(right)
+    nearest = np.where(np.abs(cam_times[right] - shifted) < np.abs(cam_times[left] - shifted), right, left)
+    error = shifted - cam_times[nearest]
+    valid = (np.abs(error) <= tolerance) & ~np.isnan(shifted)
+
+    # a CAM record claimed by several photos goes to the closest one
+    order = np.lexsort((np.abs(error), nearest))
+    order = order[valid[order]]
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = nearest[order][1:] != nearest[order][:-1]
+    cam = np.full(photo_times.size, -1, dtype=np.int64)
+    cam[order[first]] = nearest[order[first]]
+    return cam, np.where(cam >= 0, error, np.nan)
+
+
+def estimate_offset(photo_times, cam_times, tolerance, candidates=5):
+    """
+     Camera clock offset (photo time minus log time, timezone included).
+     Candidates pair each of the first photos with each of the first CAM
+     records, so a few missing photos or records at the start are allowed,
+     and the candidate pairing the most photos wins; it is then refined with
+     the median error of the pairs.
+
+     @param photo_times - sorted capture times of the photos
+     @param cam_times - sorted times of the CAM records
+     @param tolerance - maximum time error of a pair in seconds
+     @param candidates - photos and records tried at the start
+
+     @return offset in seconds
+    """
+    photos = photo_times[~np.isnan(photo_times)]
+    offsets = (photos[:candidates, None] - cam_times[None, :candidates]).ravel()
+    best, best_count = offsets[0], -1
+    for offset in offsets:
+        cam, error = _pair(photo_times, cam_times, offset, tolerance)
+        count = (cam >= 0).sum()
+        if count > best_count:
+            best, best_count, best_error = offset, count, error
+    return best + np.nanmedian(best_error) if best_count > 0 else best
+
+
+def match_geotags(photos, cam_df, tolerance=0.9, offset=None):
+    """
+     Pair photos with CAM records by capture time and sequence, with sorted
+     searches only (no per-photo loops): photos and records are put in time
+     order, the camera clock offset is estimated, and each photo takes the
+     nearest record within the tolerance, one to one.
+
+     @param photos - pd.DataFrame with name and time, as from photo_times
+     @param cam_df - dataframe with CAM data, indexed by timestamp
+     @param tolerance - maximum time error in seconds (EXIF times often have
+     a one-second resolution)
+     @param offset - camera clock offset in seconds, estimated when None
+
+     @return tuple (pd.DataFrame per photo with name, cam_index, Lat, Lng,
+     Alt, error and missing_cam, positions of the CAM records without photo)
+    """
+    cam_times = cam_df.index.asi8 / 1e9 if isinstance(cam_df.index, pd.DatetimeIndex) else cam_df.index.to_numpy(dtype=np.float64)
+    cam_order = np.argsort(cam_times, kind="stable")
+    cam_sorted = cam_times[cam_order]
+    photos = photos.sort_values(["time", "name"], na_position="last", ignore_index=True)
+    times = photos["time"].to_numpy(dtype=np.float64)
+
+    result = pd.DataFrame({"name": photos["name"], "cam_index": -1, "error": np.nan})
+    if cam_sorted.size and (~np.isnan(times)).any():
+        if offset is None:
+            offset = estimate_offset(times, cam_sorted, tolerance)
+        cam, error = _pair(times, cam_sorted, offset, tolerance)
+        matched = cam >= 0
+        result.loc[matched, "cam_index"] = cam_order[cam[matched]]
+        result["error"] = error
+
+    matched = result["cam_index"].to_numpy() >= 0
+    for column in ["Lat", "Lng", "Alt"]:
+        values = np.full(result.shape[0], np.nan)
+        if column in cam_df:
+            values[matched] = cam_df[column].to_numpy(dtype=np.float64)[result["cam_index"].to_numpy()[matched]]
+        result[column] = values
+    result["missing_cam"] = ~matched
+    result = result.sort_values("name", ignore_index=True)
+    orphans = np.setdiff1d(np.arange(cam_times.size), result["cam_index"].to_numpy()[matched])
+    return result, orphans
+
+
+def write_geotags(geotags, csv_path):
+    """
+     Write the matched photos as a geotag CSV (name, latitude, longitude,
+     altitude), the layout read by photogrammetry tools.
+
+     @param geotags - pd.DataFrame from match_geotags
+     @param csv_path - output file
+    """
+    matched = geotags[~geotags["missing_cam"]]
+    matched[["name", "Lat", "Lng", "Alt"]].rename(
+        columns={"Lat": "latitude", "Lng": "longitude", "Alt": "altitude"}
+    ).to_csv(csv_path, index=False, float_format="%.8f")
+
+
+############################################################
+## tests
+############################################################
+
+def test_match_geotags():
+    rng = np.random.default_rng(0)
+    n = 5000
+    cam_times = 1.6e9 + np.cumsum(rng.uniform(1.8, 2.2, n))
+    cam = pd.DataFrame(
+        {"Lat": rng.uniform(-23, -22, n), "Lng": rng.uniform(-48, -47, n), "Alt": 120.0},
+        index=pd.to_datetime(cam_times, unit="s"),
+    )
+    # camera clock three hours behind, times truncated to whole seconds
+    shot = np.delete(np.arange(n), [0, 1, 2500, 4999])
+    photo = pd.DataFrame(
+        {"name": [f"DSC{i:05d}.JPG" for i in shot], "time": np.floor(cam_times[shot] + 0.05 - 3 * 3600)}
+    )
+    photo = pd.concat([photo, pd.DataFrame({"name": ["DSC99999.JPG"], "time": [np.nan]})], ignore_index=True)
+    # records of missing photos, as kept by the log
+    geotags, orphans = match_geotags(photo.sample(frac=1, random_state=1), cam.iloc[rng.permutation(n)].sort_index())
+
+    assert geotags["missing_cam"].sum() == 1
+    assert list(orphans) == [0, 1, 2500, 4999]
+    matched = geotags[~geotags["missing_cam"]]
+    assert (matched["cam_index"].to_numpy() == shot).all()
+    assert np.allclose(matched["Lat"].to_numpy(), cam["Lat"].to_numpy()[shot])
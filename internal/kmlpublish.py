@@ -0,0 +1,190 @@
+import os
+import re
+import simplekml
+from pathlib import Path
+from datetime import datetime, timezone
+from internal.kmlwriter import KmlWriter
+from internal.kmlstyles import shared_styles
+
+STYLES_FILE = "styles.kml"
+
+
+def _replace(path, write):
+    """
+     Write a file through a temporary one, so readers never see it half
+     written.
+
+     @param path - final path
+     @param write - function writing the file at the path it is given
+    """
+    path = Path(path)
+    temporary = path.with_name(f".{path.name}.tmp")
+    write(temporary)
+    os.replace(temporary, path)
+
+
+class KmlPublisher:
+    def __init__(self, master, name="flights", kmz=False):
+        """
+         Initialize the object. It publishes flights incrementally: each
+         flight is written once as its own fragment, keyed by drone and
+         timestamp, and linked from the index of its day, which is linked
+         from the master file. A run only writes its own fragments and the
+         indexes of the days they belong to, so earlier runs are kept and
+         publishing does not grow with the archive.
+
+           master.kml
+           master/styles.kml
+           master/<day>.kml
+           master/<day>/<drone_uid>_<timestamp>.kml
+
+         @param master - path of the master KML file
+         @param name - name of the master document
+         @param kmz - write the fragments as KMZ
+        """
+        self.path = str(master)
+        self.name = name
+        self.kmz = kmz
+        self.folder_path = Path(self.path).with_suffix("")
+        self.folder_path.mkdir(parents=True, exist_ok=True)
+        self.touched = set()
+        self.count = 0
+        _replace(self.folder_path / STYLES_FILE, self._write_styles)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write_styles(self, path):
+        with KmlWriter(path, name="styles") as writer:
+            writer.write_raw(shared_styles())
+
+    @property
+    def styles(self):
+        """
+         Reference to the shared styles file, relative to the fragments.
+        """
+        return f"../{STYLES_FILE}"
+
+    def folder(self, name):
+        """
+         New, empty folder for the features of one flight.
+
+         @param name - name of the folder
+
+         @return simplekml.Folder
+        """
+        return simplekml.Kml().newfolder(name=name)
+
+    def fragment(self, timestamp, drone_uid):
+        """
+         @param timestamp - unix timestamp of the flight
+         @param drone_uid - serial number of the drone
+
+         @return tuple (day, path of the fragment of the flight)
+        """
+        day = datetime.fromtimestamp(float(timestamp), timezone.utc).strftime("%Y-%m-%d")
+        key = re.sub(r"[^\w.-]", "_", f"{drone_uid}_{timestamp}")
+        return day, self.folder_path / day / f"{key}.{'kmz' if self.kmz else 'kml'}"
+
+    def publish(self, feature, timestamp, drone_uid):
+        """
+         Write (or replace) the fragment of one flight.
+
+         @param feature - simplekml folder of the flight, as from folder()
+         @param timestamp - unix timestamp of the flight
+         @param drone_uid - serial number of the drone
+
+         @return path of the fragment
+        """
+        day, path = self.fragment(timestamp, drone_uid)
+        path.parent.mkdir(exist_ok=True)
+
+        def write(temporary):
+            with KmlWriter(temporary, name=path.stem, kmz=self.kmz) as writer:
+                writer.write(feature)
+
+        _replace(path, write)
+        self.touched.add(day)
+        self.count += 1
+        return path
+
+    def _write_index(self, path, name, hrefs):
+        def write(temporary):
+            with KmlWriter(temporary, name=name) as writer:
+                for href in hrefs:
+                    link = simplekml.Kml().newnetworklink(name=Path(href).stem)
+                    link.link.href = href
+                    writer.write(link)
+
+        _replace(path, write)
+
+    def close(self):
+        """
+         Rewrite the indexes of the days published in this run, and the
+         master file when a day was added.
+        """
+        days = sorted(self.touched)
+        self.touched = set()
+        new_day = False
+        for day in days:
+            index = self.folder_path / f"{day}.kml"
+            new_day |= not index.exists()
+            fragments = sorted(
+                entry.name for entry in os.scandir(self.folder_path / day)
+                if entry.is_file() and not entry.name.startswith(".")
+            )
+            self._write_index(index, day, [f"{day}/{fragment}" for fragment in fragments])
+        if new_day or not Path(self.path).exists():
+            indexes = sorted(
+                entry.name for entry in os.scandir(self.folder_path)
+                if entry.is_file() and entry.name != STYLES_FILE and not entry.name.startswith(".")
+            )
+            self._write_index(self.path, self.name, [f"{self.folder_path.name}/{index}" for index in indexes])
+
+
+############################################################
+## tests
+############################################################
+
+def test_kml_publisher(folder=Path("/tmp/kmlpublish_test")):
+    import shutil
+    import xml.etree.ElementTree as ET
+
+    ns = "{http://www.opengis.net/kml/2.2}"
+    master = folder / "flights.kml"
+    day = 86400.0
+
+    def hrefs(path):
+        return [href.text for href in ET.parse(path).getroot().iter(f"{ns}href")]
+
+    def flight(publisher, timestamp, drone_uid, name):
+        feature = publisher.folder(name)
+        ls = feature.newlinestring(name=name, coords=[(1, 2), (3, 4)])
+        ls.placemark.styleurl = f"{publisher.styles}#agr_ok"
+        return publisher.publish(feature, timestamp, drone_uid)
+
+    with KmlPublisher(master) as publisher:
+        flight(publisher, 1.7e9, "A", "first")
+        flight(publisher, 1.7e9 + 60, "B", "second")
+        flight(publisher, 1.7e9 + day, "A", "third")
+    assert hrefs(master) == ["flights/2023-11-14.kml", "flights/2023-11-15.kml"]
+    assert hrefs(folder / "flights" / "2023-11-14.kml") == [
+        "2023-11-14/A_1700000000.0.kml", "2023-11-14/B_1700000060.0.kml"
+    ]
+    first_day = (folder / "flights" / "2023-11-14.kml").stat().st_mtime_ns
+
+    # a later run replaces one flight and adds another: the first day is untouched
+    with KmlPublisher(master) as publisher:
+        flight(publisher, 1.7e9 + day, "A", "third again")
+        flight(publisher, 1.7e9 + day + 60, "C", "fourth")
+    assert (folder / "flights" / "2023-11-14.kml").stat().st_mtime_ns == first_day
+    assert hrefs(folder / "flights" / "2023-11-15.kml") == [
+        "2023-11-15/A_1700086400.0.kml", "2023-11-15/C_1700086460.0.kml"
+    ]
+    third = ET.parse(folder / "flights" / "2023-11-15" / "A_1700086400.0.kml").getroot()
+    assert [n.text for n in third.iter(f"{ns}name")][-1] == "third again"
+    assert [s.text for s in third.iter(f"{ns}styleUrl")] == ["../styles.kml#agr_ok"]
+    shutil.rmtree(folder)
@@ -0,0 +1,109 @@
+import simplekml
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+BALLOON_TEMPLATE = Path(__file__).parent / "report_temp.html"
+MOTOR_IMAGE = Path(__file__).parent / "motororder-quad-x-2d.png"
+
+# shared line styles: (color, width), by sensor and camera test result
+LINE_STYLES = {
+    "agr_ok": (simplekml.Color.red, 2.0),
+    "agr_fail": (simplekml.Color.yellow, 2.0),
+    "rgb_ok": (simplekml.Color.whitesmoke, 3.0),
+    "rgb_fail": (simplekml.Color.black, 3.0),
+}
+
+
+def load_balloon(template=BALLOON_TEMPLATE, image=MOTOR_IMAGE):
+    """
+     Read the balloon template. The values of each flight are filled in by
+     the viewer from the ExtendedData of the placemark ($[field]); only the
+     motor order image is set here.
+
+     @param template - HTML file of the balloon
+     @param image - motor order image
+
+     @return balloon text
+    """
+    text = Path(template).read_text(encoding="utf-8")
+    return text.replace("{motor_image}", Path(image).resolve().as_uri())
+
+
+def shared_styles(balloon=None):
+    """
+     KML of the shared styles, to be written once at the top of the
+     document. Features point to them with style_url instead of carrying
+     their own style and balloon.
+
+     @param balloon - balloon text (default: load_balloon())
+
+     @return KML fragment with one Style per LINE_STYLES entry
+    """
+    balloon = load_balloon() if balloon is None else balloon
+    return "".join(
+        f'<Style id="{style_id}">'
+        f"<LineStyle><color>{color}</color><width>{width}</width></LineStyle>"
+        f"<BalloonStyle><text><![CDATA[{balloon}]]></text></BalloonStyle>"
+        "</Style>"
+        for style_id, (color, width) in LINE_STYLES.items()
+    )
+
+
+def style_url(sensor, ok, styles=""):
+    """
+     @param sensor - "agr" or "rgb"
+     @param ok - result of the camera test
+     @param styles - file holding the shared styles, when they are not in
+     the same document (ex.: "../styles.kml")
+
+     @return styleUrl of the shared style
+    """
+    return f"{styles}#{sensor}_{'ok' if ok else 'fail'}"
+
+
+def set_balloon_data(feature, values):
+    """
+     Attach the values shown by the balloon template to a feature.
+
+     @param feature - simplekml feature (ex.: LineString)
+     @param values - dict of template field -> value
+    """
+    for name, value in values.items():
+        # simplekml writes Data values as they are
+        feature.extendeddata.newdata(name=name, value=escape(str(value)))
+
+
+############################################################
+## tests
+############################################################
+
+def test_shared_styles(path="/tmp/kmlstyles_test.kml"):
+    import os
+    import re
+    import xml.etree.ElementTree as ET
+    from internal.kmlwriter import KmlWriter
+
+    balloon = load_balloon()
+    fields = set(re.findall(r"\$\[(\w+)\]", balloon))
+    assert "{motor_image}" not in balloon and "motors_status" in fields
+
+    with KmlWriter(path) as writer:
+        writer.write_raw(shared_styles(balloon))
+        for i in range(20):
+            folder = writer.folder(f"flight {i}")
+            ls = folder.newlinestring(name=f"flight {i}", coords=[(1, 2), (3, 4)])
+            ls.placemark.styleurl = style_url("agr", i % 2 == 0)
+            set_balloon_data(ls, {field: "<ok> & fine" for field in fields})
+            writer.write(folder)
+
+    ns = "{http://www.opengis.net/kml/2.2}"
+    document = ET.parse(path).getroot().find(f"{ns}Document")
+    styles = {style.get("id") for style in document.iter(f"{ns}Style")}
+    assert styles == set(LINE_STYLES)
+    placemarks = list(document.iter(f"{ns}Placemark"))
+    assert all(p.find(f"{ns}styleUrl").text[1:] in styles for p in placemarks)
+    data = placemarks[0].find(f"{ns}ExtendedData")
+    assert {d.get("name"): d.find(f"{ns}value").text for d in data} == {field: "<ok> & fine" for field in fields}
+    # the balloon is written once per style, not once per flight
+    assert open(path, encoding="utf-8").read().count("Board voltage") == len(LINE_STYLES)
+    os.remove(path)
@@ -0,0 +1,125 @@
+import io
+import os
+import zipfile
+import simplekml
+from xml.sax.saxutils import escape
+
+KML_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+    "<Document>\n"
+)
+KML_FOOTER = "</Document>\n</kml>\n"
+
+
+class KmlWriter:
+    def __init__(self, path, name="flights", kmz=None):
+        """
+         Initialize the object. It streams a KML document to disk: each
+         flight is built as a small simplekml folder, written as soon as it
+         is ready and then dropped, so memory stays flat however many
+         flights are exported, and the flights already written survive a
+         failure (the document is closed in close(), also on errors).
+
+         @param path - output file (.kml or .kmz)
+         @param name - name of the document
+         @param kmz - write a zipped KMZ (default: from the file extension)
+        """
+        self.path = str(path)
+        self.kmz = self.path.lower().endswith(".kmz") if kmz is None else kmz
+        self.count = 0
+        self._zip = None
+        if self.kmz:
+            self._zip = zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_DEFLATED)
+            self._file = io.TextIOWrapper(self._zip.open("doc.kml", "w", force_zip64=True), encoding="utf-8")
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write(KML_HEADER)
+        self._file.write(f"<name>{escape(name)}</name>\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def folder(self, name):
+        """
+         New, empty folder for the features of one flight. It takes the
+         place of the simplekml.Kml object: newlinestring, newpolygon...
+
+         @param name - name of the folder
+
+         @return simplekml.Folder
+        """
+        return simplekml.Kml().newfolder(name=name)
+
+    def write_raw(self, text):
+        """
+         Write KML text (ex.: shared styles) at the current position of the
+         document.
+
+         @param text - KML fragment
+        """
+        self._file.write(text)
+        self._file.write("\n")
+
+    def write(self, feature):
+        """
+         Append a flight folder (or any simplekml feature) to the document
+         and flush it to disk.
+
+         @param feature - simplekml feature, as from folder()
+        """
+        self._file.write(str(feature))
+        self._file.write("\n")
+        self._file.flush()
+        if not self.kmz:
+            os.fsync(self._file.fileno())
+        self.count += 1
+
+    def close(self):
+        """
+         Close the document, so the file is valid KML (or KMZ).
+        """
+        if self._file is None:
+            return
+        try:
+            self._file.write(KML_FOOTER)
+            self._file.close()
+        finally:
+            self._file = None
+            if self._zip is not None:
+                self._zip.close()
+
+
+############################################################
+## tests
+############################################################
+
+def test_kml_writer(folder="/tmp"):
+    import xml.etree.ElementTree as ET
+
+    ns = {"kml": "http://www.opengis.net/kml/2.2"}
+    for name in ["kmlwriter_test.kml", "kmlwriter_test.kmz"]:
+        path = os.path.join(folder, name)
+        try:
+            with KmlWriter(path, name="a & b") as writer:
+                for i in range(3):
+                    flight = writer.folder(f"flight {i}")
+                    ls = flight.newlinestring(name=f"<{i}>", coords=[(1, 2), (3, 4)])
+                    ls.style.linestyle.color = simplekml.Color.red
+                    ls.balloonstyle.text = "<b>hi</b> & bye"
+                    writer.write(flight)
+                raise RuntimeError("crash after three flights")
+        except RuntimeError:
+            pass
+        if name.endswith(".kmz"):
+            with zipfile.ZipFile(path) as kmz:
+                root = ET.fromstring(kmz.read("doc.kml"))
+        else:
+            root = ET.parse(path).getroot()
+        document = root.find("kml:Document", ns)
+        assert document.find("kml:name", ns).text == "a & b"
+        assert [p.find("kml:name", ns).text for p in document.iter("{%s}Placemark" % ns["kml"])] == ["<0>", "<1>", "<2>"]
+        os.remove(path)
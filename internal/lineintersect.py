@@ -63,6 +63,99 @@ def doLinesIntersect(a,b,c,d):
            lineSegmentTouchesOrCrossesLine(a,b,c,d) and \
            lineSegmentTouchesOrCrossesLine(c,d,a,b)
 
+def doLinesIntersectMany(a,b,c,d):
+    '''
+    Vectorized doLinesIntersect: check line segments (a-b) against
+    segments (c-d) row by row, with NumPy broadcasting (ex.: one segment
+    against every edge of a polygon, or many against many). Touching and
+    collinear segments intersect, as in doLinesIntersect.
+    Points are arrays of shape (..., 2).
+    '''
+    a = np.asarray(a, dtype=float); b = np.asarray(b, dtype=float)
+    c = np.asarray(c, dtype=float); d = np.asarray(d, dtype=float)
+    low1 = np.minimum(a,b); high1 = np.maximum(a,b)
+    low2 = np.minimum(c,d); high2 = np.maximum(c,d)
+    boxes = (low1 <= high2).all(axis=-1) & (high1 >= low2).all(axis=-1)
+
+    def cross(o,p,q):
+        # cross product of (p-o) and (q-o), as in isPointOnLine
+        return (p[...,0]-o[...,0])*(q[...,1]-o[...,1]) - \
+               (p[...,1]-o[...,1])*(q[...,0]-o[...,0])
+
+    def touchesOrCrosses(r1, r2):
+        return (np.abs(r1) < 0.0000000001) | (np.abs(r2) < 0.0000000001) | \
+               ((r1 < 0) ^ (r2 < 0))
+
+    return boxes & \
+           touchesOrCrosses(cross(a,b,c), cross(a,b,d)) & \
+           touchesOrCrosses(cross(c,d,a), cross(c,d,b))
+
+class EdgeGrid:
+    '''
+    Uniform grid index of line segments by bounding box, so a segment is
+    only tested against the segments near it. Segments spanning more than
+    max_cells cells are kept apart and always tested.
+    '''
+    def __init__(self, cell, max_cells=64):
+        self.cell = float(cell)
+        self.max_cells = max_cells
+        self.count = 0
+        self._a = np.empty((64,2))
+        self._b = np.empty((64,2))
+        self._cells = {}
+        self._large = []
+
+    def _range(self, a, b):
+        low = np.floor(np.minimum(a,b) / self.cell).astype(int)
+        high = np.floor(np.maximum(a,b) / self.cell).astype(int)
+        return low, high, (high[0]-low[0]+1) * (high[1]-low[1]+1)
+
+    def add(self, a, b):
+        '''
+        Add line segment (a-b). Returns its index.
+        '''
+        if self.count == self._a.shape[0]:
+            self._a = np.concatenate([self._a, np.empty_like(self._a)])
+            self._b = np.concatenate([self._b, np.empty_like(self._b)])
+        index = self.count
+        self._a[index] = a
+        self._b[index] = b
+        self.count += 1
+        low, high, cells = self._range(a, b)
+        if cells > self.max_cells:
+            self._large.append(index)
+        else:
+            for i in range(low[0], high[0]+1):
+                for j in range(low[1], high[1]+1):
+                    self._cells.setdefault((i,j), []).append(index)
+        return index
+
+    def near(self, a, b):
+        '''
+        Indices of the segments whose bounding box may intersect the one
+        of line segment (a-b). An index may appear more than once.
+        '''
+        low, high, cells = self._range(a, b)
+        if cells > self.max_cells:
+            return np.arange(self.count)
+        found = list(self._large)
+        for i in range(low[0], high[0]+1):
+            for j in range(low[1], high[1]+1):
+                found.extend(self._cells.get((i,j), ()))
+        return np.array(found, dtype=int)
+
+    def intersects(self, a, b, first=0, last=None):
+        '''
+        Check if line segment (a-b) intersects any indexed segment with
+        index in [first, last).
+        '''
+        last = self.count if last is None else last
+        index = self.near(a, b)
+        index = index[(index >= first) & (index < last)]
+        if index.size == 0:
+            return False
+        return bool(doLinesIntersectMany(a, b, self._a[index], self._b[index]).any())
+
 
 ##############################
 ## Tests
@@ -130,4 +223,25 @@ def check_intersection(name):
 
 def test_doLinesIntersect():
     for case in cases:
-        yield check_intersection, case
+        check_intersection(case)
+
+def test_doLinesIntersectMany():
+    A,B,C,D = (np.array([tcase(name)[i] for name in cases]) for i in range(4))
+    results = np.array([tcase(name)[4] for name in cases])
+    assert np.array_equal(doLinesIntersectMany(A,B,C,D), results)
+    assert np.array_equal(doLinesIntersectMany(C,D,A,B), results)
+    # one segment against many
+    A,B,C,D, result = tcase('T1')
+    assert np.array_equal(doLinesIntersectMany(A,B,[C,(5,5)],[D,(6,6)]), [True, False])
+
+def test_EdgeGrid():
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(0, 100, (500,2))
+    ends = starts + rng.normal(0, 3, (500,2))
+    ends[:5] = rng.uniform(0, 100, (5,2))   # a few long segments
+    grid = EdgeGrid(cell=4.0)
+    for a, b in zip(starts, ends):
+        grid.add(a, b)
+    for a, b in zip(starts[:100] + 0.5, ends[:100] - 0.5):
+        brute = [doLinesIntersect(a,b,c,d) for c, d in zip(starts[50:400], ends[50:400])]
+        assert grid.intersects(a, b, 50, 400) == any(brute)
@@ -0,0 +1,47 @@
+import pandas as pd
+from pymavlink import mavutil
+
+
+def _frame(rows, stamps):
+    """
+     Build a record batch from decoded messages.
+
+     @param rows - list of message dicts
+     @param stamps - list of unix timestamps of the messages
+
+     @return pd.DataFrame indexed by timestamp, like DayChecker.create_df
+    """
+    df = pd.DataFrame(rows, index=pd.to_datetime(stamps, unit="s", origin="unix"))
+    df.index.name = "timestamp"
+    return df.drop(columns="mavpackettype", errors="ignore")
+
+
+def iter_batches(flight_log, types, batch_size=5000):
+    """
+     Decode a dataflash log and yield its messages in record batches as they
+     are decoded, so callers never hold more than one batch per type.
+
+     @param flight_log - path to a BIN log file
+     @param types - list of message types to decode (ex.: ["RCOU", "VIBE"])
+     @param batch_size - number of messages in each batch
+
+     @return generator of (msg_type, pd.DataFrame) tuples
+    """
+    mlog = mavutil.mavlink_connection(str(flight_log))
+    rows = {msg_type: [] for msg_type in types}
+    stamps = {msg_type: [] for msg_type in types}
+
+    while True:
+        m = mlog.recv_match(type=types)
+        if m is None:
+            break
+        msg_type = m.get_type()
+        rows[msg_type].append(m.to_dict())
+        stamps[msg_type].append(m._timestamp)
+        if len(rows[msg_type]) >= batch_size:
+            yield msg_type, _frame(rows[msg_type], stamps[msg_type])
+            rows[msg_type], stamps[msg_type] = [], []
+
+    for msg_type in types:
+        if rows[msg_type]:
+            yield msg_type, _frame(rows[msg_type], stamps[msg_type])
@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+from database.repository.motors_repo import MtRepo
+
+
+# class containing the fleet-wide motor degradation analysis
+class MotorTrend:
+    # quad-x layout: each motor is compared with the motor on the same axis,
+    # the same pairs used by HealthTests.motor_test (1-3 frontal, 2-4 back)
+    siblings = [2, 3, 0, 1]
+
+    def __init__(self, window=20, horizon=10, min_flights=5, warn_level=30, fail_level=45):
+        """
+         Initialize the object. It loads the motors history of every drone and
+         fits a rolling regression of each motor's PWM offset against its
+         sibling, so motors drifting towards the HealthTests limits are
+         flagged before a flight fails.
+
+         @param window - number of flights in each regression window
+         @param horizon - number of flights ahead used to project the drift
+         @param min_flights - minimum flights in a window to trust the fit
+         @param warn_level - PWM offset that raises a WARN (as in motor_test)
+         @param fail_level - PWM offset that raises a FAIL (as in motor_test)
+        """
+        self.window = window
+        self.horizon = horizon
+        self.min_flights = min_flights
+        self.warn_level = warn_level
+        self.fail_level = fail_level
+        self.history = None
+        self.drift = None
+
+    def load_history(self):
+        """
+         Load the motors table straight into a DataFrame, without building ORM
+         objects.
+
+         @return pd.DataFrame with one row per flight
+        """
+        self.history = MtRepo().select_df(
+            columns=["timestamp", "drone_uid", "m1_avg_pwm", "m2_avg_pwm", "m3_avg_pwm", "m4_avg_pwm"]
+        )
+        self.history["timestamp"] = self.history["timestamp"].astype(float)
+        return self.history
+
+    def rolling_sum(self, values, group_start):
+        """
+         Sum values over the last self.window rows of the same group. Windows
+         are clipped at the first row of each group, so drones never mix.
+
+         @param values - array of shape (n,) or (n, m), sorted by group
+         @param group_start - index of the first row of each row's group
+
+         @return array with the same shape as values
+        """
+        csum = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+        end = np.arange(1, values.shape[0] + 1)
+        start = np.maximum(end - self.window, group_start)
+        return csum[end] - csum[start]
+
+    def compute_drift(self, history=None):
+        """
+         Compute the rolling drift of every motor of every drone in one
+         vectorized pass. Each motor's offset against its sibling is regressed
+         on the flight index inside a sliding window.
+
+         @param history - DataFrame like the motors table (loaded if None)
+
+         @return pd.DataFrame with offset, slope and projected offset per motor
+        """
+        if history is None:
+            history = self.load_history() if self.history is None else self.history
+        history = history.sort_values(["drone_uid", "timestamp"], kind="mergesort").reset_index(drop=True)
+
+        pwm = history[["m1_avg_pwm", "m2_avg_pwm", "m3_avg_pwm", "m4_avg_pwm"]].to_numpy(dtype=np.float64)
+        offset = pwm - pwm[:, MotorTrend.siblings]
+
+        # position of each flight inside its drone's history
+        codes = pd.factorize(history["drone_uid"])[0]
+        rows = np.arange(history.shape[0])
+        first = np.r_[True, codes[1:] != codes[:-1]] if rows.size else np.array([], dtype=bool)
+        group_start = np.maximum.accumulate(np.where(first, rows, 0))
+        x = (rows - group_start).astype(np.float64)
+
+        n = self.rolling_sum(np.ones_like(x), group_start)
+        sx = self.rolling_sum(x, group_start)
+        sxx = self.rolling_sum(x * x, group_start)
+        sy = self.rolling_sum(offset, group_start)
+        sxy = self.rolling_sum(offset * x[:, None], group_start)
+
+        # least squares slope/intercept of offset ~ flight index
+        denom = (n * sxx - sx * sx)[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(denom > 0, (n[:, None] * sxy - sx[:, None] * sy) / denom, 0.0)
+        intercept = (sy - slope * sx[:, None]) / n[:, None]
+        level = intercept + slope * x[:, None]
+        projected = level + slope * self.horizon
+
+        status = np.full(offset.shape, "OK", dtype=object)
+        status[projected >= self.warn_level] = "WARN"
+        status[projected >= self.fail_level] = "FAIL"
+        status[n < self.min_flights] = "UNKNOWN"
+
+        self.drift = pd.DataFrame(
+            {
+                "timestamp": np.repeat(history["timestamp"].to_numpy(), 4),
+                "drone_uid": np.repeat(history["drone_uid"].to_numpy(), 4),
+                "motor": np.tile(np.arange(1, 5), history.shape[0]),
+                "flights": np.repeat(n, 4).astype(int),
+                "offset": offset.ravel(),
+                "level": level.ravel(),
+                "slope": slope.ravel(),
+                "projected": projected.ravel(),
+                "status": status.ravel(),
+            }
+        )
+        return self.drift
+
+    def flagged(self):
+        """
+         Latest trend of each motor of each drone, keeping only motors that
+         are trending towards the warn or fail levels.
+
+         @return pd.DataFrame with one row per flagged motor
+        """
+        if self.drift is None:
+            self.compute_drift()
+        latest = self.drift.groupby(["drone_uid", "motor"], sort=False).tail(1)
+        return latest[latest.status.isin(["WARN", "FAIL"])].reset_index(drop=True)
+
+    def run(self):
+        """
+         Load the history, compute the drift and return the flagged motors.
+         This is the main method.
+
+         @return pd.DataFrame with one row per flagged motor
+        """
+        self.load_history()
+        self.compute_drift()
+        return self.flagged()
+
+
+############################################################
+## tests
+############################################################
+
+def test_drifting_motor():
+    rng = np.random.default_rng(0)
+    flights = 60
+    rows = []
+    for drone in ["healthy", "drifting"]:
+        pwm = 1500 + rng.normal(0, 2, (flights, 4))
+        if drone == "drifting":
+            # motor 3 wears out from flight 30: +1.5 PWM per flight
+            pwm[30:, 2] += 1.5 * np.arange(flights - 30)
+        for i in range(flights):
+            rows.append((1.6e9 + i * 3600 + (drone == "drifting"), drone, *pwm[i]))
+    history = pd.DataFrame(rows, columns=["timestamp", "drone_uid", "m1_avg_pwm", "m2_avg_pwm", "m3_avg_pwm", "m4_avg_pwm"])
+
+    trend = MotorTrend(window=20, horizon=10)
+    drift = trend.compute_drift(history.sample(frac=1, random_state=0))
+    assert (drift.loc[drift["flights"] < trend.min_flights, "status"] == "UNKNOWN").all()
+
+    # the slope of the last window is the least squares fit of that window
+    last = drift[(drift["drone_uid"] == "drifting") & (drift["motor"] == 3)].tail(1)
+    tail = history[history["drone_uid"] == "drifting"].tail(20)
+    offset = tail["m3_avg_pwm"].to_numpy() - tail["m1_avg_pwm"].to_numpy()
+    slope, intercept = np.polyfit(np.arange(flights - 20, flights), offset, 1)
+    assert np.isclose(last["slope"].iat[0], slope) and abs(slope - 1.5) < 0.3
+    assert np.isclose(last["projected"].iat[0], intercept + slope * (flights - 1 + trend.horizon))
+
+    flagged = trend.flagged()
+    assert flagged[["drone_uid", "motor", "status"]].values.tolist() == [["drifting", 3, "FAIL"]]
+    # it was already trending before it crossed the fail level itself
+    motor3 = drift[(drift["drone_uid"] == "drifting") & (drift["motor"] == 3)].reset_index(drop=True)
+    first_flag = motor3.index[motor3["status"] != "OK"][trend.min_flights:].min()
+    assert motor3["offset"].iat[first_flag] < trend.warn_level
@@ -0,0 +1,267 @@
+import os
+import numpy as np
+import pandas as pd
+import simplekml
+from pathlib import Path
+from datetime import datetime, timezone
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from internal.geo import EARTH_RADIUS
+from internal.simplify import simplify
+from internal.kmlwriter import KmlWriter
+from internal.kmlstyles import shared_styles, set_balloon_data
+from database.repository.track_repo import TrRepo, track_coords
+
+MIN_LOD = 128  # pixels of a tile on screen before it is loaded
+FADE_LOD = 512  # pixels after which a tile hides its tracks, drawn by its children
+TILE_PIXELS = 512  # tolerance of the tracks of a tile: its width over this
+TILE_BALLOON = "<b>$[name]</b><br/>$[drone_uid]<br/>$[date]"
+
+
+def clip_track(coords, bounds):
+    """
+     Pieces of a track that cross a tile: runs of consecutive segments whose
+     bounding box overlaps the tile, so lines still reach the tile edges.
+
+     @param coords - array of shape (n, 2) with (lon, lat)
+     @param bounds - (west, south, east, north) of the tile
+
+     @return list of arrays of shape (m, 2)
+    """
+    if coords.shape[0] < 2:
+        return []
+    west, south, east, north = bounds
+    low = np.minimum(coords[:-1], coords[1:])
+    high = np.maximum(coords[:-1], coords[1:])
+    hit = (low[:, 0] <= east) & (high[:, 0] >= west) & (low[:, 1] <= north) & (high[:, 1] >= south)
+    edges = np.diff(np.concatenate([[0], hit.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return [coords[start:end + 1] for start, end in zip(starts, ends)]
+
+
+def plan_tiles(boxes, bounds, max_depth=6, max_tracks=50):
+    """
+     Quadtree of tiles over the tracks. A tile is split in four while more
+     than max_tracks tracks cross it, so busy areas get deeper tiles and
+     quiet ones stay coarse. Only the bounding boxes are used here.
+
+     @param boxes - array of shape (n, 4) with (west, south, east, north) of each track
+     @param bounds - (west, south, east, north) of the root tile
+     @param max_depth - depth of the deepest tiles
+     @param max_tracks - tracks a tile may hold before it is split
+
+     @return dict of (depth, x, y) -> dict with bounds, tracks (positions in
+     boxes) and children (keys)
+    """
+    def crossing(index, tile):
+        west, south, east, north = tile
+        box = boxes[index]
+        return index[(box[:, 0] <= east) & (box[:, 2] >= west) & (box[:, 1] <= north) & (box[:, 3] >= south)]
+
+    tiles = {}
+    stack = [((0, 0, 0), tuple(bounds), crossing(np.arange(boxes.shape[0]), bounds))]
+    while stack:
+        key, tile, index = stack.pop()
+        tiles[key] = {"bounds": tile, "tracks": index, "children": []}
+        depth, x, y = key
+        if depth >= max_depth or index.size <= max_tracks:
+            continue
+        west, south, east, north = tile
+        mid_lon, mid_lat = (west + east) / 2, (south + north) / 2
+        for dx, (w, e) in enumerate([(west, mid_lon), (mid_lon, east)]):
+            for dy, (s, n) in enumerate([(south, mid_lat), (mid_lat, north)]):
+                child = crossing(index, (w, s, e, n))
+                if child.size:
+                    child_key = (depth + 1, 2 * x + dx, 2 * y + dy)
+                    tiles[key]["children"].append(child_key)
+                    stack.append((child_key, (w, s, e, n), child))
+    return tiles
+
+
+def tile_name(key):
+    return "{}_{}_{}.kml".format(*key)
+
+
+def _region(region, bounds, min_lod, max_lod):
+    west, south, east, north = bounds
+    region.latlonaltbox.west = west
+    region.latlonaltbox.south = south
+    region.latlonaltbox.east = east
+    region.latlonaltbox.north = north
+    region.lod.minlodpixels = min_lod
+    region.lod.maxlodpixels = max_lod
+
+
+def write_tile(path, key, bounds, tracks, children, tolerance):
+    """
+     Write one tile: its tracks, clipped and simplified for its zoom range,
+     and a NetworkLink per child tile, loaded when its region is on screen.
+     Module level so it can be sent to a process pool.
+
+     @param path - output file
+     @param key - (depth, x, y) of the tile
+     @param bounds - (west, south, east, north) of the tile
+     @param tracks - list of (name, drone_uid, timestamp, style, coords)
+     @param children - list of (key, bounds) of the child tiles
+     @param tolerance - Douglas-Peucker tolerance in metres, or None for
+     the full tracks
+
+     @return number of placemarks written
+    """
+    count = 0
+    with KmlWriter(path, name=Path(path).stem) as writer:
+        folder = writer.folder("tracks")
+        # the root is always drawn; tiles with children give way to them
+        _region(folder.region, bounds, 0 if key[0] == 0 else MIN_LOD, FADE_LOD if children else -1)
+        for name, drone_uid, timestamp, style, coords in tracks:
+            pieces = clip_track(coords, bounds)
+            if not pieces:
+                continue
+            geometry = folder.newmultigeometry(name=name)
+            for piece in pieces:
+                geometry.newlinestring(coords=simplify(piece, tolerance))
+            if style:
+                geometry.placemark.styleurl = f"../styles.kml{style}"
+            date = datetime.fromtimestamp(float(timestamp), timezone.utc).strftime("%Y-%m-%d %H:%M")
+            set_balloon_data(geometry, {"drone_uid": drone_uid, "date": date})
+            count += 1
+        writer.write(folder)
+        for child_key, child_bounds in children:
+            link = simplekml.Kml().newnetworklink(name=tile_name(child_key))
+            link.link.href = tile_name(child_key)
+            link.link.viewrefreshmode = simplekml.ViewRefreshMode.onregion
+            _region(link.region, child_bounds, MIN_LOD, -1)
+            writer.write(link)
+    return count
+
+
+def _write_tile(job):
+    return write_tile(*job)
+
+
+def regionate(tracks, folder, max_depth=6, max_tracks=50, leaf_tolerance=None, max_workers=None):
+    """
+     Regionated export of stored tracks: a quadtree of KML tiles with
+     Region/Lod and NetworkLinks, so the viewer loads coarse, simplified
+     tracks when zoomed out and the full tracks only for the area on screen.
+     The tiles are written in a process pool. This is the main function.
+
+     @param tracks - pd.DataFrame of the track table (TrRepo.select_df)
+     @param folder - output folder (fleet.kml, styles.kml and tiles/)
+     @param max_depth - depth of the deepest tiles
+     @param max_tracks - tracks a tile may hold before it is split
+     @param leaf_tolerance - tolerance of the deepest tiles in metres, or
+     None for the full tracks
+     @param max_workers - number of processes
+
+     @return path of the master file (fleet.kml)
+    """
+    folder = Path(folder)
+    tiles_folder = folder / "tiles"
+    tiles_folder.mkdir(parents=True, exist_ok=True)
+    for old in tiles_folder.glob("*.kml"):
+        old.unlink()
+
+    tracks = tracks.dropna(subset=["min_lon", "min_lat", "max_lon", "max_lat"])
+    tracks = tracks[tracks["points"] >= 2]
+    boxes = tracks[["min_lon", "min_lat", "max_lon", "max_lat"]].to_numpy(dtype=np.float64)
+    columns = ["name", "drone_uid", "timestamp", "style", "coords"]
+    rows = [
+        (name, drone_uid, timestamp, style, track_coords(coords))
+        for name, drone_uid, timestamp, style, coords in tracks[columns].itertuples(index=False)
+    ]
+    bounds = (boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()) if rows else (-180.0, -90.0, 180.0, 90.0)
+    tiles = plan_tiles(boxes, bounds, max_depth, max_tracks)
+
+    jobs = []
+    for key, tile in tiles.items():
+        west, south, east, north = tile["bounds"]
+        width = np.radians(east - west) * EARTH_RADIUS * np.cos(np.radians((south + north) / 2))
+        tolerance = width / TILE_PIXELS if tile["children"] else leaf_tolerance
+        jobs.append((
+            str(tiles_folder / tile_name(key)),
+            key,
+            tile["bounds"],
+            [rows[i] for i in tile["tracks"]],
+            [(child, tiles[child]["bounds"]) for child in tile["children"]],
+            tolerance,
+        ))
+    if len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            list(executor.map(_write_tile, jobs))
+    else:
+        for job in jobs:
+            _write_tile(job)
+
+    with KmlWriter(folder / "styles.kml", name="styles") as writer:
+        writer.write_raw(shared_styles(TILE_BALLOON))
+    master = folder / "fleet.kml"
+    with KmlWriter(master, name="fleet") as writer:
+        link = simplekml.Kml().newnetworklink(name="fleet")
+        link.link.href = f"tiles/{tile_name((0, 0, 0))}"
+        writer.write(link)
+    return master
+
+
+def main():
+    parser = ArgumentParser(description="Regionated KML of the stored flight tracks.")
+    parser.add_argument("folder", help="output folder")
+    parser.add_argument("--drone", action="append", help="only tracks of this drone (repeatable)")
+    parser.add_argument("--start", type=float, help="only flights at or after this unix timestamp")
+    parser.add_argument("--end", type=float, help="only flights before this unix timestamp")
+    parser.add_argument("--max-depth", type=int, default=6)
+    parser.add_argument("--max-tracks", type=int, default=50)
+    args = parser.parse_args()
+    tracks = TrRepo(read_only=True).select_df(args.drone, args.start, args.end)
+    print(regionate(tracks, args.folder, args.max_depth, args.max_tracks))
+
+
+if __name__ == "__main__":
+    main()
+
+
+############################################################
+## tests
+############################################################
+
+def test_clip_track():
+    coords = np.array([[0.0, 0.0], [1.0, 0.0], [2.0, 0.0], [3.0, 0.0], [2.0, 1.0], [1.5, 3.0], [0.5, 3.0]])
+    pieces = clip_track(coords, (1.2, -1.0, 2.5, 2.0))
+    assert [p.tolist() for p in pieces] == [[[1.0, 0.0], [2.0, 0.0], [3.0, 0.0], [2.0, 1.0], [1.5, 3.0]]]
+    # a segment crossing the tile without a point inside is kept
+    assert [p.tolist() for p in clip_track(np.array([[0.0, 0.5], [3.0, 0.5]]), (1.0, 0.0, 2.0, 1.0))] == [[[0.0, 0.5], [3.0, 0.5]]]
+    assert clip_track(coords, (10.0, 10.0, 11.0, 11.0)) == []
+
+
+def test_regionate(folder=Path("/tmp/regionate_test")):
+    import shutil
+    import xml.etree.ElementTree as ET
+    from database.repository.track_repo import track_row
+
+    rng = np.random.default_rng(0)
+    rows = []
+    for i in range(300):
+        start = rng.uniform([-48.0, -23.0], [-47.0, -22.0])
+        coords = start + np.cumsum(rng.normal(0, 2e-5, (2000, 2)), axis=0)
+        rows.append(track_row(str(1.6e9 + i * 3600), f"drone{i % 7}", f"log{i}.BIN", coords, "#agr_ok"))
+    tracks = pd.DataFrame(rows)
+    master = regionate(tracks, folder, max_depth=4, max_tracks=40, max_workers=2)
+
+    ns = "{http://www.opengis.net/kml/2.2}"
+    tiles = {path.name: ET.parse(path).getroot() for path in (folder / "tiles").glob("*.kml")}
+    assert "0_0_0.kml" in tiles and len(tiles) > 5
+    assert ET.parse(master).getroot().find(f".//{ns}href").text == "tiles/0_0_0.kml"
+    # every link points to an existing tile and every track reaches a leaf
+    in_leaves = set()
+    for root in tiles.values():
+        links = [href.text for href in root.iter(f"{ns}href")]
+        assert all(link in tiles for link in links)
+        for placemark in root.iter(f"{ns}Placemark"):
+            assert placemark.find(f"{ns}styleUrl").text == "../styles.kml#agr_ok"
+            if not links:
+                in_leaves.add(placemark.find(f"{ns}name").text)
+    assert len(in_leaves) == 300
+    # the root holds coarse tracks only
+    root_points = sum(len(line.text.split()) for line in tiles["0_0_0.kml"].iter(f"{ns}coordinates"))
+    assert root_points < 300 * 2000 / 20
+    shutil.rmtree(folder)
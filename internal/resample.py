@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+
+# signals most cross-signal tests need, as message.column
+DEFAULT_SIGNALS = [
+    "RCOU.C1",
+    "RCOU.C2",
+    "RCOU.C3",
+    "RCOU.C4",
+    "VIBE.VibeX",
+    "VIBE.VibeY",
+    "VIBE.VibeZ",
+    "POWR.Vcc",
+    "BAT.Volt",
+    "BAT.Curr",
+]
+
+
+def _seconds(index):
+    """
+     Timestamps of a frame index as unix seconds.
+
+     @param index - pd.DatetimeIndex or numeric index
+
+     @return np.ndarray of float64
+    """
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8 / 1e9
+    return np.asarray(index, dtype=np.float64)
+
+
+class AlignedSignals:
+    def __init__(self, times, values, columns):
+        """
+         Signals of a flight sampled on a common time grid.
+
+         @param times - grid timestamps in unix seconds, shape (n,)
+         @param values - float32 matrix of shape (n, len(columns)), NaN where
+         a signal has no data
+         @param columns - signal names (message.column)
+        """
+        self.times = times
+        self.values = values
+        self.columns = list(columns)
+        self._position = {name: i for i, name in enumerate(self.columns)}
+
+    def __len__(self):
+        return self.times.size
+
+    def column(self, name):
+        """
+         Samples of one signal on the grid.
+
+         @param name - signal name (ex.: "POWR.Vcc")
+
+         @return float32 view of shape (n,)
+        """
+        return self.values[:, self._position[name]]
+
+    def select(self, names):
+        """
+         Samples of several signals on the grid.
+
+         @param names - list of signal names
+
+         @return float32 array of shape (n, len(names))
+        """
+        return self.values[:, [self._position[name] for name in names]]
+
+    def correlation(self, names=None):
+        """
+         Pearson correlation between signals over the grid points where all
+         of them have data.
+
+         @param names - signals to correlate (all by default)
+
+         @return pd.DataFrame with the correlation matrix
+        """
+        names = self.columns if names is None else names
+        values = self.select(names).astype(np.float64)
+        values = values[~np.isnan(values).any(axis=1)]
+        if values.shape[0] < 2:
+            return pd.DataFrame(np.nan, index=names, columns=names)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return pd.DataFrame(np.corrcoef(values, rowvar=False), index=names, columns=names)
+
+    def to_frame(self):
+        """
+         @return pd.DataFrame indexed by timestamp, one column per signal
+        """
+        index = pd.to_datetime(self.times, unit="s", origin="unix")
+        return pd.DataFrame(self.values, index=index, columns=self.columns)
+
+
+def align_signals(df_dict, signals=DEFAULT_SIGNALS, rate=10.0, method="linear", max_gap=1.0, start=None, end=None):
+    """
+     Put signals logged on different time bases on one time grid. Each
+     signal is interpolated (method="linear") or carried forward like an
+     asof join (method="previous") onto the grid, without pandas merges.
+     Grid points outside a signal's samples, or in a gap longer than max_gap
+     seconds, are NaN. Missing samples (NaN) are skipped.
+
+     @param df_dict - dict of DataFrames keyed by message type, indexed by timestamp
+     @param signals - list of message.column names
+     @param rate - grid rate in Hz
+     @param method - "linear" or "previous"
+     @param max_gap - longest gap between samples bridged, in seconds
+     @param start - grid start in unix seconds (first sample by default)
+     @param end - grid end in unix seconds (last sample by default)
+
+     @return AlignedSignals
+    """
+    if method not in ("linear", "previous"):
+        raise ValueError(f"Unknown method: {method}")
+    signals = [s for s in signals if s.split(".")[0] in df_dict and s.split(".")[1] in df_dict[s.split(".")[0]]]
+    times = {msg: _seconds(df_dict[msg].index) for msg in {s.split(".")[0] for s in signals}}
+    spans = [(t.min(), t.max()) for t in times.values() if t.size]
+    if not spans:
+        return AlignedSignals(np.empty(0), np.empty((0, len(signals)), dtype=np.float32), signals)
+    start = min(a for a, b in spans) if start is None else start
+    end = max(b for a, b in spans) if end is None else end
+    grid = start + np.arange(int(np.floor((end - start) * rate)) + 1) / rate
+
+    values = np.full((grid.size, len(signals)), np.nan, dtype=np.float32)
+    for j, name in enumerate(signals):
+        msg, column = name.split(".")
+        t = times[msg]
+        x = pd.to_numeric(df_dict[msg][column], errors="coerce").to_numpy(dtype=np.float64)
+        valid = ~np.isnan(x) & ~np.isnan(t)
+        t, x = t[valid], x[valid]
+        if t.size == 0:
+            continue
+        order = np.argsort(t, kind="stable")
+        t, x = t[order], x[order]
+
+        after = np.searchsorted(t, grid, side="left")
+        before = np.searchsorted(t, grid, side="right") - 1
+        inside = (before >= 0) & (after < t.size)
+        # gap between the samples around each grid point
+        gap = t[np.minimum(after, t.size - 1)] - t[np.maximum(before, 0)]
+        keep = inside & (gap <= max_gap)
+        if method == "linear":
+            values[keep, j] = np.interp(grid[keep], t, x)
+        else:
+            values[keep, j] = x[before[keep]]
+    return AlignedSignals(grid, values, signals)
+
+
+############################################################
+## tests
+############################################################
+
+def _random_frames(rng, seconds=120.0):
+    def frame(rate, columns):
+        t = np.sort(rng.uniform(0, seconds, int(seconds * rate))) + 1.6e9
+        df = pd.DataFrame({c: rng.normal(size=t.size) for c in columns}, index=pd.to_datetime(t, unit="s"))
+        return df
+
+    df_dict = {"RCOU": frame(10, ["C1", "C2", "C3", "C4"]), "VIBE": frame(25, ["VibeX", "VibeY", "VibeZ"]), "POWR": frame(1, ["Vcc"])}
+    df_dict["POWR"].iloc[5:8, 0] = np.nan
+    return df_dict
+
+
+def test_align_signals():
+    rng = np.random.default_rng(0)
+    df_dict = _random_frames(rng)
+    aligned = align_signals(df_dict, rate=5.0, max_gap=30.0)
+    assert aligned.values.dtype == np.float32
+    assert aligned.columns == [s for s in DEFAULT_SIGNALS if not s.startswith("BAT")]
+
+    for name in aligned.columns:
+        msg, column = name.split(".")
+        series = df_dict[msg][column].dropna()
+        t = series.index.asi8 / 1e9
+        expected = np.interp(aligned.times, t, series.to_numpy())
+        expected[(aligned.times < t.min()) | (aligned.times > t.max())] = np.nan
+        assert np.allclose(aligned.column(name), expected, equal_nan=True, atol=1e-6), name
+
+
+def test_align_signals_previous():
+    rng = np.random.default_rng(1)
+    df_dict = _random_frames(rng)
+    aligned = align_signals(df_dict, ["POWR.Vcc"], rate=2.0, method="previous", max_gap=30.0)
+    grid = pd.to_datetime(aligned.times, unit="s")
+    series = df_dict["POWR"]["Vcc"].dropna()
+    expected = pd.merge_asof(pd.DataFrame(index=grid), series.to_frame(), left_index=True, right_index=True)
+    expected = expected["Vcc"].where(grid <= series.index.max()).to_numpy()
+    assert np.allclose(aligned.column("POWR.Vcc"), expected, equal_nan=True, atol=1e-6)
+
+    gaps = align_signals(df_dict, ["POWR.Vcc"], rate=2.0, max_gap=0.5)
+    assert np.isnan(gaps.column("POWR.Vcc")).mean() > 0.5
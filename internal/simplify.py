@@ -0,0 +1,123 @@
+import numpy as np
+from internal.geo import EARTH_RADIUS
+
+
+def track_coords(cam_df):
+    """
+     Track of a flight as an array of (lon, lat), taken straight from the
+     CAM columns. Points without a position (NaN, or 0, 0 before the GPS
+     fix) are dropped.
+
+     @param cam_df - dataframe with CAM data
+
+     @return np.ndarray of shape (n, 2)
+    """
+    if cam_df is None or "Lat" not in cam_df or "Lng" not in cam_df:
+        return np.empty((0, 2))
+    coords = cam_df[["Lng", "Lat"]].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(coords).any(axis=1) & (coords != 0).any(axis=1)
+    return coords[valid]
+
+
+def to_meters(coords):
+    """
+     Local equirectangular projection of (lon, lat) degrees to metres, around
+     the mean latitude. Accurate enough at the size of a flight.
+
+     @param coords - array of shape (n, 2)
+
+     @return array of shape (n, 2) in metres
+    """
+    lat0 = np.radians(np.mean(coords[:, 1])) if coords.size else 0.0
+    return np.radians(coords) * EARTH_RADIUS * np.array([np.cos(lat0), 1.0])
+
+
+def douglas_peucker(coords, tolerance):
+    """
+     Douglas-Peucker line simplification. Points are kept while they are
+     farther than the tolerance from the simplified line; the distances of
+     each span are computed in one vectorized pass.
+
+     @param coords - array of shape (n, 2) in (lon, lat) degrees
+     @param tolerance - maximum distance from the original track in metres
+
+     @return boolean mask of the kept points
+    """
+    n = coords.shape[0]
+    keep = np.zeros(n, dtype=bool)
+    if n <= 2:
+        keep[:] = True
+        return keep
+    points = to_meters(coords)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = points[start + 1:end]
+        a, b = points[start], points[end]
+        ab = b - a
+        length = np.hypot(*ab)
+        if length == 0:
+            distances = np.hypot(*(inner - a).T)
+        else:
+            # distance to the segment, so loops back over the start are kept
+            t = np.clip(((inner - a) @ ab) / (length * length), 0.0, 1.0)
+            distances = np.hypot(*(inner - (a + t[:, None] * ab)).T)
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def simplify(coords, tolerance=None):
+    """
+     Simplify a track, if a tolerance is given.
+
+     @param coords - array of shape (n, 2) in (lon, lat) degrees
+     @param tolerance - maximum distance from the original track in metres
+
+     @return array of shape (m, 2)
+    """
+    if tolerance is None or tolerance <= 0:
+        return coords
+    return coords[douglas_peucker(coords, tolerance)]
+
+
+############################################################
+## tests
+############################################################
+
+def test_douglas_peucker():
+    rng = np.random.default_rng(0)
+    # lawnmower survey pattern with 0.3 m of GPS noise
+    legs = []
+    for i in range(10):
+        lat = np.linspace(-22.0, -21.99, 500) if i % 2 == 0 else np.linspace(-21.99, -22.0, 500)
+        legs.append(np.column_stack([np.full(500, -47.0 + i * 0.0005), lat]))
+    coords = np.vstack(legs)
+    coords += rng.normal(0, 0.3 / EARTH_RADIUS * 180 / np.pi, coords.shape)
+
+    simplified = simplify(coords, 2.0)
+    assert simplified.shape[0] < coords.shape[0] / 10
+    assert (simplified[0] == coords[0]).all() and (simplified[-1] == coords[-1]).all()
+
+    # every original point stays within the tolerance of the simplified line
+    points = to_meters(coords)
+    line = points[douglas_peucker(coords, 2.0)]
+    a, b = line[:-1], line[1:]
+    ab = b - a
+    t = np.clip(np.einsum("pij,ij->pi", points[:, None, :] - a[None], ab) / (ab * ab).sum(axis=1), 0, 1)
+    nearest = np.hypot(*(points[:, None, :] - (a[None] + t[..., None] * ab[None])).transpose(2, 0, 1)).min(axis=1)
+    assert nearest.max() <= 2.0 + 1e-6
+
+
+def test_track_coords():
+    import pandas as pd
+
+    cam = pd.DataFrame({"Lat": [0.0, -22.0, np.nan, -22.1], "Lng": [0.0, -47.0, -47.0, -47.1]})
+    assert track_coords(cam).tolist() == [[-47.0, -22.0], [-47.1, -22.1]]
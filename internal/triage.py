@@ -0,0 +1,293 @@
+import re
+import struct
+import pandas as pd
+from pathlib import Path
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from pymavlink.DFReader import FORMAT_TO_STRUCT
+
+HEAD = b"\xa3\x95"
+FMT_ID = 0x80
+# FMT describes every other message and is the only one known beforehand
+FMT_FORMAT = (89, "FMT", "BBnNZ", ["Type", "Length", "Name", "Format", "Columns"])
+GPS_EPOCH = 315964800  # 1980-01-06 in unix time
+LEAP_SECONDS = 18  # same offset pymavlink uses for the log clock
+
+BOARD_ID = re.compile(r"^(?P<board>\S+)\s+(?P<id>[0-9A-F]{8}\s*[0-9A-F]{8}\s*[0-9A-F]{8})\s*$")
+FIRMWARE = re.compile(r"^(?P<vehicle>Ardu\w+|Blimp|AP_Periph)\s+(?P<version>V[\w.\-]+)(\s*\((?P<git>\w+)\))?")
+FRAME = re.compile(r"^Frame:\s*(?P<frame>.+)$")
+
+
+def parse_message(text, header):
+    """
+     Read the drone serial, firmware or frame type out of a MSG text. The
+     serial number is the board's 96-bit id, logged as a board name followed
+     by three groups of 8 hex digits; the other MSG lines (vehicle and
+     version, ChibiOS hash, RC protocol...) come in different orders
+     depending on the firmware, so lines are matched by their format.
+
+     @param text - text of a MSG message
+     @param header - dict being filled with drone_uid, board, firmware and frame
+    """
+    text = text.strip()
+    match = BOARD_ID.match(text)
+    if match and header.get("drone_uid") is None:
+        header["board"] = match["board"]
+        header["drone_uid"] = re.sub(r"\s", "", match["id"])
+        return
+    match = FIRMWARE.match(text)
+    if match and header.get("firmware") is None:
+        header["firmware"] = f"{match['vehicle']} {match['version']}"
+        if match["git"]:
+            header["firmware"] += f" ({match['git']})"
+        return
+    match = FRAME.match(text)
+    if match and header.get("frame") is None:
+        header["frame"] = match["frame"].strip()
+
+
+def serial_from_messages(messages):
+    """
+     Drone serial number from the MSG texts of a log.
+
+     @param messages - iterable of MSG texts
+
+     @return serial number, or None if the log has no board id line
+    """
+    header = {}
+    for text in messages:
+        parse_message(str(text), header)
+        if header.get("drone_uid") is not None:
+            return header["drone_uid"]
+    return None
+
+
+def fallback_serial(messages):
+    """
+     Serial number of logs without a board id line, as it was stored before
+     the board id was parsed: the third MSG text from its tenth character,
+     without spaces (ex.: "rV4.0.5(3f6b43e3)"), or the first MSG text of
+     shorter logs, so flights of those drones keep their drone_uid.
+
+     @param messages - iterable of MSG texts
+
+     @return serial number ("unknown" for a log without MSG)
+    """
+    messages = [str(text) for text in messages]
+    if len(messages) > 2 and messages[2][9:].strip():
+        return messages[2][9:].replace(" ", "")
+    if messages and messages[0].strip():
+        return messages[0].replace(" ", "")
+    return "unknown"
+
+
+def _text(value):
+    return value.split(b"\0", 1)[0].decode("ascii", "ignore")
+
+
+class _Format:
+    def __init__(self, length, name, fmt, columns):
+        self.length = length
+        self.name = name
+        self.columns = columns
+        self.unpack = struct.Struct("<" + "".join(FORMAT_TO_STRUCT[c][0] for c in fmt)).unpack
+
+    def decode(self, body):
+        values = [_text(v) if isinstance(v, bytes) else v for v in self.unpack(body)]
+        return dict(zip(self.columns, values))
+
+
+def triage(flight_log, max_bytes=16 * 1024 * 1024, chunk_size=64 * 1024):
+    """
+     Read the header of a BIN log without decoding it all: only FMT, PARM,
+     MSG, the first EV and the first GPS with a fix are decoded, and reading
+     stops as soon as the drone serial, firmware, frame type and the time of
+     the first EV are known.
+
+     @param flight_log - path to a BIN log file
+     @param max_bytes - give up on the missing fields after this many bytes
+     @param chunk_size - bytes read at a time
+
+     @return dict with path, drone_uid, board, firmware, frame, timestamp
+     (unix time of the first EV, as DayChecker.flight_timestamp) and bytes_read
+    """
+    formats = {FMT_ID: _Format(*FMT_FORMAT)}
+    header = {"path": str(flight_log), "drone_uid": None, "board": None, "firmware": None, "frame": None}
+    params = {}
+    first_ev_us = None
+    timebase = None
+
+    def complete():
+        return (
+            header["drone_uid"] is not None
+            and header["firmware"] is not None
+            and (header["frame"] is not None or "FRAME_CLASS" in params)
+            and first_ev_us is not None
+            and timebase is not None
+        )
+
+    buffer = b""
+    offset = 0
+    read = 0
+    with open(flight_log, "rb") as log:
+        while not complete() and read < max_bytes:
+            chunk = log.read(chunk_size)
+            if not chunk:
+                break
+            read += len(chunk)
+            buffer = buffer[offset:] + chunk
+            offset = 0
+
+            while len(buffer) - offset >= 3 and not complete():
+                if buffer[offset:offset + 2] != HEAD or buffer[offset + 2] not in formats:
+                    # not a message start: resync on the next header
+                    next_head = buffer.find(HEAD, offset + 1)
+                    offset = next_head if next_head >= 0 else len(buffer) - 1
+                    continue
+                fmt = formats[buffer[offset + 2]]
+                if len(buffer) - offset < fmt.length:
+                    break
+                body = buffer[offset + 3: offset + fmt.length]
+                offset += fmt.length
+
+                if fmt.name == "FMT":
+                    m = fmt.decode(body)
+                    try:
+                        formats[m["Type"]] = _Format(m["Length"], m["Name"], m["Format"], m["Columns"].split(","))
+                    except (KeyError, struct.error):
+                        pass
+                elif fmt.name == "MSG":
+                    parse_message(fmt.decode(body)["Message"], header)
+                elif fmt.name == "PARM":
+                    m = fmt.decode(body)
+                    params[m["Name"]] = m["Value"]
+                elif fmt.name == "EV" and first_ev_us is None:
+                    first_ev_us = fmt.decode(body)["TimeUS"]
+                elif fmt.name == "GPS" and timebase is None:
+                    m = fmt.decode(body)
+                    if m.get("GWk", 0) and m.get("TimeUS", 0):
+                        gps_time = GPS_EPOCH + m["GWk"] * 604800 + m["GMS"] * 1e-3 - LEAP_SECONDS
+                        timebase = gps_time - m["TimeUS"] * 1e-6
+
+    if header["frame"] is None and "FRAME_CLASS" in params:
+        header["frame"] = f"class {int(params['FRAME_CLASS'])} type {int(params.get('FRAME_TYPE', 0))}"
+    header["timestamp"] = None
+    if first_ev_us is not None and timebase is not None:
+        header["timestamp"] = timebase + first_ev_us * 1e-6
+    header["bytes_read"] = read
+    return header
+
+
+def triage_many(logs, max_workers=None):
+    """
+     Triage many logs in a thread pool.
+
+     @param logs - iterable of paths to BIN log files
+     @param max_workers - number of threads
+
+     @return pd.DataFrame with one row per log, sorted by drone and time,
+     with a duplicate column marking logs already seen (same drone and time)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        headers = pd.DataFrame(list(executor.map(triage, logs)))
+    if headers.empty:
+        return headers
+    headers = headers.sort_values(["drone_uid", "timestamp"], na_position="last", ignore_index=True)
+    headers["duplicate"] = headers.duplicated(["drone_uid", "timestamp"]) & headers["timestamp"].notna()
+    return headers
+
+
+############################################################
+## tests
+############################################################
+
+def _message(msg_id, fmt, *values):
+    return HEAD + bytes([msg_id]) + struct.pack("<" + "".join(FORMAT_TO_STRUCT[c][0] for c in fmt), *values)
+
+
+def _fmt(msg_id, name, fmt, columns):
+    length = 3 + struct.calcsize("<" + "".join(FORMAT_TO_STRUCT[c][0] for c in fmt))
+    return _message(FMT_ID, "BBnNZ", msg_id, length, name.encode(), fmt.encode(), columns.encode())
+
+
+def _sample_log(path, messages, padding=0):
+    data = b"".join(
+        [
+            _fmt(FMT_ID, "FMT", "BBnNZ", "Type,Length,Name,Format,Columns"),
+            _fmt(0x81, "MSG", "QZ", "TimeUS,Message"),
+            _fmt(0x82, "PARM", "QNf", "TimeUS,Name,Value"),
+            _fmt(0x83, "EV", "QB", "TimeUS,Id"),
+            _fmt(0x84, "GPS", "QBIHBcLLeffffB", "TimeUS,Status,GMS,GWk,NSats,HDop,Lat,Lng,Alt,Spd,GCrs,VZ,Yaw,U"),
+            b"\x00\x17",
+        ]
+        + [_message(0x81, "QZ", 1000 + i, text.encode()) for i, text in enumerate(messages)]
+        + [
+            _message(0x82, "QNf", 2000, b"FRAME_CLASS", 1.0),
+            _message(0x84, "QBIHBcLLeffffB", 3000000, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1),
+            _message(0x83, "QB", 5000000, 10),
+            _message(0x84, "QBIHBcLLeffffB", 6000000, 3, 345600000, 2100, 12, 80, 0, 0, 0, 0, 0, 0, 0, 1),
+        ]
+        + [_message(0x83, "QB", 7000000 + i, 11) for i in range(padding)]
+    )
+    Path(path).write_bytes(data)
+
+
+def test_triage(tmp_path=Path("/tmp")):
+    from pymavlink import mavutil
+
+    log = Path(tmp_path) / "triage_test.BIN"
+    # the firmware line at index 2 is what DayChecker used to store as serial
+    _sample_log(
+        log,
+        ["ChibiOS: d4fce84e", "Frame: QUAD/X", "ArduCopter V4.0.5 (3f6b43e3)", "CubeBlack 002C001D 4E30500C 20333135"],
+        padding=200000,
+    )
+    header = triage(log, chunk_size=4096)
+    assert header["drone_uid"] == "002C001D4E30500C20333135"
+    assert header["board"] == "CubeBlack"
+    assert header["firmware"] == "ArduCopter V4.0.5 (3f6b43e3)"
+    assert header["frame"] == "QUAD/X"
+    assert header["bytes_read"] < log.stat().st_size
+
+    mlog = mavutil.mavlink_connection(str(log))
+    ev = mlog.recv_match(type="EV")
+    assert abs(ev._timestamp - header["timestamp"]) < 1e-3
+
+    _sample_log(log, ["ArduCopter V4.0.5 (3f6b43e3)"])
+    header = triage(log)
+    assert header["drone_uid"] is None and header["frame"] == "class 1 type 0"
+    log.unlink()
+
+
+def test_fallback_serial(tmp_path=Path("/tmp")):
+    from pymavlink import mavutil
+
+    # a log without board id line keeps the serial stored by older versions
+    log = Path(tmp_path) / "fallback_test.BIN"
+    _sample_log(log, ["ChibiOS: d4fce84e", "Frame: QUAD/X", "ArduCopter V4.0.5 (3f6b43e3)"])
+    mlog = mavutil.mavlink_connection(str(log))
+    messages = []
+    while True:
+        msg = mlog.recv_match(type="MSG")
+        if msg is None:
+            break
+        messages.append(msg.Message)
+    log.unlink()
+    assert serial_from_messages(messages) is None
+    assert fallback_serial(messages) == "rV4.0.5(3f6b43e3)"
+    assert fallback_serial(["ArduCopter V4.0.5"]) == "ArduCopterV4.0.5"
+    assert fallback_serial([]) == "unknown"
+
+
+##running when not being imported
+if __name__ == "__main__":
+    parser = ArgumentParser(description="List the drone, firmware, frame and start time of BIN logs.")
+    parser.add_argument("folder", help="folder searched recursively for BIN logs")
+    parser.add_argument("--workers", type=int, default=None, help="number of threads")
+    args = parser.parse_args()
+
+    logs = sorted(Path(args.folder).rglob("*.BIN"))
+    headers = triage_many(logs, args.workers)
+    if not headers.empty:
+        headers["timestamp"] = pd.to_datetime(headers["timestamp"], unit="s", origin="unix")
+        print(headers.drop(columns="bytes_read").to_string(index=False))
@@ -8,13 +8,16 @@
 # @author: caioems
 # """
 
-# TODO: create a windows service for syncing data with cloud db(API)
+# TODO: create a windows service running the delta sync with cloud db (python -m database.sync push <endpoint>)
 
-import simplekml, os
-from database.repository.report_repo import RpRepo
-from database.repository.motors_repo import MtRepo
+import os, sys
+from database.repository.batch_writer import BatchWriter
 from internal.loglist import LogList
+from internal.kmlpublish import KmlPublisher
+from internal.regionate import regionate
+from database.repository.track_repo import TrRepo
 from internal.daychecker import DayChecker
+from internal.motortrend import MotorTrend
 from tqdm import tqdm
 
 
@@ -28,45 +31,51 @@ class PipeLine:
         self._root = LogList()
         self._log_list = self._root.log_list
         self._kml = self.create_kml()
+        self._writer = BatchWriter()
 
-    def create_kml(self, kml_name="flights"):
+    def create_kml(self, kml_name="flights", kmz=False):
         """
-         Create KML object which will hold geometries and reports.
+         Create the KML publisher which will hold geometries and reports. Each
+         flight is written to its own fragment as soon as it is analyzed, and
+         the master file links the fragments of every run.
          
-         @param kml_name - The name of the KML object.
+         @param kml_name - The name of the master KML document (and of the file).
+         @param kmz - Write the flight fragments as zipped KMZ.
          
-         @return The newly created KML object.
+         @return The newly created KmlPublisher.
          
         """
-        self._kml = simplekml.Kml(name=kml_name)
+        self._kml = KmlPublisher(f"{self._root.root_folder}/{kml_name}.kml", name=kml_name, kmz=kmz)
         return self._kml
 
-    def write_to_db(self):
+    def write_to_db(self, flight):
         """
-         Write data to sqlite database.
+         Queue data to be written to the sqlite database by the background writer.
          
+         @param flight - DayChecker of one flight of the log
         """
-        rp_repo = RpRepo()
-        rp_repo.insert(
-            self.dc.flight_timestamp,
-            self.dc.drone_uid,
-            self.dc.report.motors_status,
-            self.dc.report.motors_feedback,
-            self.dc.report.imu_status,
-            self.dc.report.imu_feedback,
-            self.dc.report.vcc_status,
-            self.dc.report.vcc_mean,
-            self.dc.report.vcc_std,
-        )
-
-        m_repo = MtRepo()
-        m_repo.insert(
-            self.dc.flight_timestamp,
-            self.dc.drone_uid,
-            self.dc.report.motors_pwm_list[0],
-            self.dc.report.motors_pwm_list[1],
-            self.dc.report.motors_pwm_list[2],
-            self.dc.report.motors_pwm_list[3],
+        self._writer.put(
+            {
+                "timestamp": flight.flight_timestamp,
+                "drone_uid": flight.drone_uid,
+                "motor_status": flight.report.motors_status,
+                "motor_feedback": flight.report.motors_feedback,
+                "imu_status": flight.report.imu_status,
+                "imu_feedback": flight.report.imu_feedback,
+                "vcc_status": flight.report.vcc_status,
+                "vcc_mean": flight.report.vcc_mean,
+                "vcc_std": flight.report.vcc_std,
+            },
+            {
+                "timestamp": flight.flight_timestamp,
+                "drone_uid": flight.drone_uid,
+                "m1_avg_pwm": flight.report.motors_pwm_list[0],
+                "m2_avg_pwm": flight.report.motors_pwm_list[1],
+                "m3_avg_pwm": flight.report.motors_pwm_list[2],
+                "m4_avg_pwm": flight.report.motors_pwm_list[3],
+            },
+            flight.battery.to_row(flight.flight_timestamp, flight.drone_uid),
+            flight.track_row(),
         )
 
     def run(self, flight_log):
@@ -76,27 +85,52 @@ class PipeLine:
          @param flight_log - flight log to be analyzed
          
         """
-        self.dc = DayChecker(flight_log)
+        # raw IMU samples for the vibration spectrum (python run.py --raw-imu)
+        self.dc = DayChecker(flight_log, raw_imu="--raw-imu" in sys.argv)
 
-        # Storing data into db
-        self.write_to_db()
+        for flight in self.dc.flights:
+            # Storing data into db
+            self.write_to_db(flight)
 
-        # Creating the kml features
-        flight_ls = self.dc.create_linestring(self._kml)
-        self.dc.agr_style(flight_ls)
-        self.dc.create_balloon_report(flight_ls)
+            # Creating the kml features, published as soon as the flight is done
+            folder = self._kml.folder(flight.name)
+            flight_ls = flight.create_linestring(folder, tolerance=1.0)
+            flight.agr_style(flight_ls, self._kml.styles)
+            flight.create_balloon_report(flight_ls)
+            self._kml.publish(folder, flight.flight_timestamp, flight.drone_uid)
 
 
 ##running when not being imported
 if __name__ == "__main__":
     flights = PipeLine()
-    kml_file = f"{flights._root.root_folder}/flights.kml"
+    kml_file = flights._kml.path
 
-    ## map method
-    results = list(
-        tqdm(map(flights.run, flights._log_list), total=len(flights._log_list))
-    )
-
-    flights._kml.save(kml_file)
+    ## map method; the flights already published are kept if one fails
+    writer_error = None
+    try:
+        results = list(
+            tqdm(map(flights.run, flights._log_list), total=len(flights._log_list))
+        )
+    finally:
+        flights._kml.close()
+        ## a failed write is raised at the end, so it neither masks an
+        ## ingest error nor skips the steps below
+        try:
+            flights._writer.close()
+        except Exception as exception:
+            writer_error = exception
+            print(f"Error ocurred in writing {len(flights._writer.failed)} flights: {exception!r}")
+
+    ## regionated map of every stored flight (python run.py --regions)
+    if "--regions" in sys.argv:
+        print(regionate(TrRepo(read_only=True).select_df(), f"{flights._root.root_folder}/regions"))
+
+    ## fleet motor trends, refreshed with the flights just ingested
+    trends = MotorTrend().run()
+    if not trends.empty:
+        print("Motors trending towards failure:")
+        print(trends[["drone_uid", "motor", "projected", "status"]].to_string(index=False))
     print("Done.")
     os.startfile(kml_file)
+    if writer_error is not None:
+        raise writer_error
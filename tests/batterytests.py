@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+from internal.geo import track_length
+
+
+def _column(df, name):
+    """
+     Column of a frame as float64, or all NaN when the frame lacks it.
+    """
+    if df is None or name not in df:
+        return np.full(0 if df is None else df.shape[0], np.nan)
+    return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _seconds(df):
+    if df is None:
+        return np.empty(0)
+    if isinstance(df.index, pd.DatetimeIndex):
+        return df.index.asi8 / 1e9
+    return df.index.to_numpy(dtype=np.float64)
+
+
+class BatteryTests:
+    def __init__(self, bat_df, cam_df=None, idle_quantile=0.1, load_quantile=0.9):
+        """
+         Initialize the object. It computes the battery usage of a flight
+         (energy, capacity, average and peak current, voltage sag under
+         load, internal resistance and energy per km of track) from the BAT
+         samples, skipping NaN gaps, so pack health can be trended per drone.
+
+         @param bat_df - dataframe with BAT data (battery monitor)
+         @param cam_df - dataframe with CAM data, for the track length
+         @param idle_quantile - current quantile below which the pack is resting
+         @param load_quantile - current quantile above which the pack is loaded
+        """
+        self._bat_df = bat_df
+        self._cam_df = cam_df
+        self.idle_quantile = idle_quantile
+        self.load_quantile = load_quantile
+
+        self.energy_wh = np.nan
+        self.consumed_mah = np.nan
+        self.avg_curr = np.nan
+        self.peak_curr = np.nan
+        self.min_volt = np.nan
+        self.volt_sag = np.nan
+        self.resistance_mohm = np.nan
+        self.distance_km = np.nan
+        self.wh_per_km = np.nan
+
+    def __repr__(self):
+        return f"""energy_wh = {self.energy_wh}
+consumed_mah = {self.consumed_mah}
+avg_curr = {self.avg_curr}
+peak_curr = {self.peak_curr}
+volt_sag = {self.volt_sag}
+resistance_mohm = {self.resistance_mohm}
+wh_per_km = {self.wh_per_km}"""
+
+    def energy_test(self):
+        """
+         Energy and charge drawn from the pack, integrated with the
+         trapezoidal rule over the valid samples, and the current stats.
+         The firmware counters (CurrTot, EnrgTot) are used when logged.
+        """
+        t = _seconds(self._bat_df)
+        volt = _column(self._bat_df, "Volt")
+        curr = _column(self._bat_df, "Curr")
+
+        valid = ~np.isnan(t) & ~np.isnan(curr)
+        if valid.sum() >= 2:
+            tc, ic = t[valid], curr[valid]
+            charge = np.trapz(ic, tc)
+            self.consumed_mah = charge / 3.6
+            if tc[-1] > tc[0]:
+                # samples with a single timestamp have no average
+                self.avg_curr = charge / (tc[-1] - tc[0])
+            self.peak_curr = ic.max()
+
+        valid &= ~np.isnan(volt)
+        if valid.sum() >= 2:
+            self.energy_wh = np.trapz(volt[valid] * curr[valid], t[valid]) / 3600
+
+        for name, attr in [("CurrTot", "consumed_mah"), ("EnrgTot", "energy_wh")]:
+            counter = _column(self._bat_df, name)
+            counter = counter[~np.isnan(counter)]
+            if counter.size >= 2:
+                setattr(self, attr, counter[-1] - counter[0])
+
+    def sag_test(self):
+        """
+         Voltage sag (resting voltage minus voltage under load) and the pack
+         internal resistance. The resistance is the slope of the voltage
+         steps against the current steps between consecutive samples, which
+         cancels the slow voltage drop from discharge.
+        """
+        volt = _column(self._bat_df, "Volt")
+        curr = _column(self._bat_df, "Curr")
+        valid = ~np.isnan(volt) & ~np.isnan(curr)
+        if valid.sum() < 2:
+            return
+        volt, curr = volt[valid], curr[valid]
+        self.min_volt = volt.min()
+
+        idle, load = np.quantile(curr, [self.idle_quantile, self.load_quantile])
+        if load > idle:
+            self.volt_sag = np.median(volt[curr <= idle]) - np.median(volt[curr >= load])
+
+        d_volt, d_curr = np.diff(volt), np.diff(curr)
+        denominator = (d_curr * d_curr).sum()
+        if denominator > 0:
+            self.resistance_mohm = -(d_volt * d_curr).sum() / denominator * 1e3
+
+    def distance_test(self):
+        """
+         Track length from the CAM positions, and the energy per km.
+        """
+        if self._cam_df is None or self._cam_df.empty:
+            return
+        self.distance_km = track_length(_column(self._cam_df, "Lat"), _column(self._cam_df, "Lng")) / 1e3
+        if self.distance_km > 0:
+            self.wh_per_km = self.energy_wh / self.distance_km
+
+    def run(self):
+        """
+         Run all the tests. This is the main method.
+
+         @return self
+        """
+        self.energy_test()
+        self.sag_test()
+        self.distance_test()
+        return self
+
+    def to_row(self, timestamp, drone_uid):
+        """
+         Results as a row of the battery table, with NaN stored as NULL.
+
+         @param timestamp - flight timestamp
+         @param drone_uid - serial number of the drone
+
+         @return dict
+        """
+        row = {"timestamp": timestamp, "drone_uid": drone_uid}
+        for name in ["energy_wh", "consumed_mah", "avg_curr", "peak_curr", "min_volt", "volt_sag",
+                     "resistance_mohm", "distance_km", "wh_per_km"]:
+            value = getattr(self, name)
+            row[name] = None if value is None or np.isnan(value) else round(float(value), 3)
+        return row
+
+
+############################################################
+## tests
+############################################################
+
+def test_battery():
+    rng = np.random.default_rng(0)
+    t = np.arange(0, 600, 0.1)
+    curr = 20 + 10 * np.sin(t / 7) + rng.normal(0, 0.5, t.size)
+    curr[:300] = 1.0
+    volt = 25.2 - 0.004 * t - 0.015 * curr
+    bat = pd.DataFrame({"Volt": volt, "Curr": curr}, index=pd.to_datetime(t, unit="s"))
+    bat.iloc[1000:1500] = np.nan
+
+    lat = np.linspace(-22.0, -22.0 + 0.05, 200)
+    cam = pd.DataFrame({"Lat": lat, "Lng": -47.0})
+    cam.iloc[0] = 0.0
+
+    battery = BatteryTests(bat, cam).run()
+    valid = ~np.isnan(bat["Curr"].to_numpy())
+    expected = np.trapz(curr[valid], t[valid]) / 3.6
+    assert np.isclose(battery.consumed_mah, expected)
+    assert np.isclose(battery.resistance_mohm, 15.0, rtol=0.05)
+    assert battery.volt_sag > 0
+    assert np.isclose(battery.distance_km, 5.56, rtol=0.01)
+    assert np.isclose(battery.wh_per_km, battery.energy_wh / battery.distance_km)
+
+
+def test_battery_all_nan():
+    bat = pd.DataFrame({"Volt": np.nan, "Curr": np.nan, "CurrTot": np.nan}, index=pd.to_datetime(np.arange(10), unit="s"))
+    battery = BatteryTests(bat, pd.DataFrame(columns=["Lat", "Lng"])).run()
+    row = battery.to_row("1.0", "x")
+    assert row["consumed_mah"] is None and row["energy_wh"] is None
+
+
+def test_battery_same_timestamp():
+    bat = pd.DataFrame({"Volt": [25.0, 24.9], "Curr": [10.0, 12.0]}, index=pd.to_datetime([5.0, 5.0], unit="s"))
+    with np.errstate(all="raise"):
+        battery = BatteryTests(bat, pd.DataFrame(columns=["Lat", "Lng"])).run()
+    assert battery.consumed_mah == 0 and battery.peak_curr == 12.0
+    assert battery.to_row("1.0", "x")["avg_curr"] is None
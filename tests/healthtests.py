@@ -1,9 +1,155 @@
+import numpy as np
 import pandas as pd
-from statistics import mean
+from tests.ruleengine import RuleEngine
+
+MOTOR_CHANNELS = ["C1", "C2", "C3", "C4"]
+VIBE_AXES = ["VibeX", "VibeY", "VibeZ"]
+CLIP_AXES = ["Clip0", "Clip1", "Clip2"]
+
+_rules = None
+
+
+def rule_engine():
+    """
+     Rule engine shared by the flights of a process, loaded on first use
+     (tests/rules.json is re-read when it changes).
+
+     @return tests.ruleengine.RuleEngine
+    """
+    global _rules
+    if _rules is None:
+        _rules = RuleEngine()
+    return _rules
+
+
+def segment_stats(values, offsets):
+    """
+     NaN-aware statistics of consecutive segments of an array, computed for
+     all segments at once. Segment i spans values[offsets[i]:offsets[i + 1]].
+
+     @param values - array of shape (n,) or (n, m) with the stacked samples
+     @param offsets - start index of each segment (non-empty segments)
+
+     @return dict with count, mean, std (ddof=1), max and last per segment
+    """
+    values = np.asarray(values, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    ends = np.r_[offsets[1:], values.shape[0]]
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+
+    count = np.add.reduceat(valid, offsets, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.add.reduceat(filled, offsets, axis=0) / count
+        centered = np.where(valid, values - np.repeat(mean, ends - offsets, axis=0), 0.0)
+        std = np.sqrt(np.add.reduceat(centered * centered, offsets, axis=0) / (count - 1))
+    maximum = np.maximum.reduceat(np.where(valid, values, -np.inf), offsets, axis=0)
+
+    return {"count": count, "mean": mean, "std": std, "max": maximum, "last": values[ends - 1]}
+
+
+def motor_status(pwm_means, warn_level=30, fail_level=45):
+    """
+     Motors imbalance for many flights. Frontal (1-3) and back (2-4) motors
+     PWM averages are compared against the warn and fail levels.
+
+     @param pwm_means - array of shape (n, 4) with the C1..C4 averages
+
+     @return tuple (status, feedback, pwm) with pwm truncated to int
+    """
+    pwm = np.trunc(pwm_means).astype(np.int64)
+    fmotors = np.abs(pwm[:, 0] - pwm[:, 2])
+    bmotors = np.abs(pwm[:, 1] - pwm[:, 3])
+
+    warn = (fmotors >= warn_level) | (bmotors >= warn_level)
+    fail = (fmotors >= fail_level) | (bmotors >= fail_level)
+    bad_pwm = np.where(
+        fmotors >= warn_level,
+        np.maximum(pwm[:, 0], pwm[:, 2]),
+        np.maximum(pwm[:, 1], pwm[:, 3]),
+    )
+    bad_motor = np.argmax(pwm == bad_pwm[:, None], axis=1) + 1
+
+    status = np.where(fail, "FAIL", np.where(warn, "WARN", "OK")).astype(object)
+    feedback = np.full(pwm.shape[0], "balanced", dtype=object)
+    for i in np.flatnonzero(warn):
+        if fail[i]:
+            feedback[i] = f'Big difference in {"frontal" if fmotors[i] >= fail_level else "back"} motors PWM\'s avg. Check motor {bad_motor[i]}.'
+        else:
+            feedback[i] = f'Small difference between {"frontal" if fmotors[i] >= warn_level else "back"} motors PWM. Check motor {bad_motor[i]}.'
+    return status, feedback, pwm
+
+
+def vibe_status(vibe_means, last_clips, vibe_level=30):
+    """
+     Vibration and accel clipping for many flights.
+
+     @param vibe_means - array of shape (n, 3) with the VibeX/Y/Z averages
+     @param last_clips - array of shape (n, 3) with the last Clip0/1/2 counters
+
+     @return tuple (status, feedback)
+    """
+    vibes = vibe_means.max(axis=1)
+    clips = last_clips.max(axis=1)
+    warn = (vibe_means > vibe_level).any(axis=1)
+    fail = ~warn & (last_clips > 0).any(axis=1)
+
+    status = np.where(warn, "WARN", np.where(fail, "FAIL", "OK")).astype(object)
+    feedback = np.full(vibes.shape[0], "no vibe issues", dtype=object)
+    for i in np.flatnonzero(warn):
+        feedback[i] = f"Several vibration ({round(vibes[i], 1)} m/s/s)."
+    for i in np.flatnonzero(fail):
+        feedback[i] = f"Accel was clipped {int(clips[i])} times."
+    return status, feedback
+
+
+def vcc_status(vcc_mean, vcc_std, warn_level=0.1, fail_level=0.15):
+    """
+     Board voltage deviation for many flights.
+
+     @param vcc_mean - array with the Vcc averages, rounded to 2 decimals
+     @param vcc_std - array with the Vcc standard deviations, rounded to 2 decimals
+
+     @return tuple (status, feedback)
+    """
+    status = np.where(
+        vcc_std >= fail_level, "FAIL", np.where(vcc_std >= warn_level, "WARN", "OK")
+    ).astype(object)
+    feedback = np.empty(status.shape[0], dtype=object)
+    for i, level in enumerate(status):
+        if level == "FAIL":
+            feedback[i] = f"Big voltage deviation ({vcc_std[i]}v), please check the board."
+        elif level == "WARN":
+            feedback[i] = f"Small voltage deviation ({vcc_std[i]}v), please check the board."
+        else:
+            feedback[i] = f"No board voltage issues (avg: {vcc_mean[i]}v, std: {vcc_std[i]}v)."
+    return status, feedback
+
+
+def trig_status(triggers, feedbacks):
+    """
+     Camera triggers against camera feedbacks for many flights.
+
+     @param triggers - array with the number of TRIG messages
+     @param feedbacks - array with the number of CAM messages
+
+     @return tuple (status, feedback)
+    """
+    status = np.where(triggers == feedbacks, "OK", "FAIL").astype(object)
+    feedback = np.empty(status.shape[0], dtype=object)
+    for i, (t, f) in enumerate(zip(triggers, feedbacks)):
+        if t == f:
+            feedback[i] = f"No photos skipped ({t})."
+        elif t > f:
+            feedback[i] = f"{t - f} photos were taken without feedback."
+        else:
+            feedback[i] = f"The camera skipped {f - t} photos."
+    return status, feedback
+
 
 # TODO: motor efficiency = Thrust (grams) x Power (watts)
 class HealthTests:
-    def __init__(self, rcou_df, vibe_df, powr_df, cam_df, trig_df):
+    def __init__(self, rcou_df, vibe_df, powr_df, cam_df, trig_df, imu_df=None):
         """
          Initialize the object. It stores dataframes and apply logical
          tests to point out status and feedback of UAV hardware.
@@ -13,22 +159,36 @@ class HealthTests:
          @param powr_df - dataframe with POWR data (board voltage)
          @param cam_df - dataframe with CAM data (camera messages)
          @param trig_df - dataframe with TRIG data (camera trigger)
+         @param imu_df - optional dataframe with raw IMU data, for the spectrum
         """
         self._rcou_df = rcou_df
         self._vibe_df = vibe_df
         self._powr_df = powr_df
         self._cam_df = cam_df
         self._trig_df = trig_df
+        self._imu_df = imu_df
 
         self.motors_status = "UNKNOWN"
         self.motors_feedback = ""
         self.imu_status = "UNKNOWN"
         self.imu_feedback = ""
+        self.imu_peaks = None
+        self.imu_spectrum_feedback = ""
         self.gps_status = "UNKNOWN"
         self.gps_feedback = ""
         self.vcc_status = None
+        self.vcc_feedback = ""
         self.vcc_mean = None
         self.vcc_std = None
+        self.trig_status = "UNKNOWN"
+        self.trig_feedback = ""
+        self.trig_missing = []
+        self.trig_extra = []
+        self.trig_latency = {}
+        self.trig_detail = ""
+        self.photo_report = None
+        self.worst_windows = {}
+        self.window_feedback = ""
 
     def __repr__(self):
         return f"""motors_status = {self.motors_status} 
@@ -41,7 +201,6 @@ trig_status = {self.trig_status}
 trig_feedback = {self.trig_feedback}"""
 
     def motor_test(self):
-        # sourcery skip: extract-duplicate-method, hoist-statement-from-if, merge-duplicate-blocks, move-assign-in-block, remove-redundant-if, split-or-ifs
         """
          This is a test to see if it's possible to predict 
          motors maintenance. It compares each servo channel 
@@ -49,44 +208,13 @@ trig_feedback = {self.trig_feedback}"""
          levels as needed.
          
         """
-        self.motors_status = "OK"
-        self.motors_feedback = "balanced"
-        self.motors_pwm_list = []
+        pwm = self._rcou_df[MOTOR_CHANNELS].to_numpy(dtype=np.float64)
+        stats = segment_stats(pwm, [0])
+        status, feedback, pwm_list = motor_status(stats["mean"])
 
-        pwm_df = pd.DataFrame(
-            {
-                "1": [mean(self._rcou_df.C1), max(self._rcou_df.C1)],
-                "2": [mean(self._rcou_df.C2), max(self._rcou_df.C2)],
-                "3": [mean(self._rcou_df.C3), max(self._rcou_df.C3)],
-                "4": [mean(self._rcou_df.C4), max(self._rcou_df.C4)],
-            }
-        ).T
-        pwm_df.columns = ["mean", "max"]
-
-        self.motors_pwm_list = [int(x) for x in pwm_df["mean"]]
-
-        # Comparing frontal motors and back motors
-        fmotors = abs(self.motors_pwm_list[0] - self.motors_pwm_list[2])
-        bmotors = abs(self.motors_pwm_list[1] - self.motors_pwm_list[3])
-        
-        warn_level = 30
-        if fmotors >= warn_level or bmotors >= warn_level:
-            bad_pwm = None
-            bad_motor = None
-            if fmotors >= warn_level:
-                bad_pwm = max([self.motors_pwm_list[0], self.motors_pwm_list[2]])
-                bad_motor = str(self.motors_pwm_list.index(bad_pwm) + 1)
-            elif bmotors >= warn_level:
-                bad_pwm = max([self.motors_pwm_list[1], self.motors_pwm_list[3]])
-                bad_motor = str(self.motors_pwm_list.index(bad_pwm) + 1)
-
-            fail_level = 45
-            if fmotors >= fail_level or bmotors >= fail_level:
-                self.motors_status = "FAIL"
-                self.motors_feedback = f'Big difference in {"frontal" if fmotors >= fail_level else "back"} motors PWM\'s avg. Check motor {bad_motor}.'
-            else:
-                self.motors_status = "WARN"
-                self.motors_feedback = f'Small difference between {"frontal" if fmotors >= warn_level else "back"} motors PWM. Check motor {bad_motor}.'
+        self.motors_status = status[0]
+        self.motors_feedback = feedback[0]
+        self.motors_pwm_list = [int(x) for x in pwm_list[0]]
 
     def vibe_test(self):
         """
@@ -94,29 +222,12 @@ trig_feedback = {self.trig_feedback}"""
         with UAV vibration.
         
         """
-        self.imu_status = "OK"
-        self.imu_feedback = "no vibe issues"
+        vibes = segment_stats(self._vibe_df[VIBE_AXES].to_numpy(dtype=np.float64), [0])
+        clips = self._vibe_df[CLIP_AXES].to_numpy()[-1:]
+        status, feedback = vibe_status(vibes["mean"], clips)
 
-        clips = (
-            self._vibe_df.Clip0[-1],
-            self._vibe_df.Clip1[-1],
-            self._vibe_df.Clip2[-1],
-        )
-        vibes = (
-            mean(self._vibe_df.VibeX),
-            mean(self._vibe_df.VibeY),
-            mean(self._vibe_df.VibeZ),
-        )
-
-        # Check if the vibration is enough for accel clipping
-        if any(v > 30 for v in vibes):
-            max_vibes = str(round(max(vibes), 1))
-            self.imu_status = "WARN"
-            self.imu_feedback = f"Several vibration ({max_vibes} m/s/s)."
-        elif any(c > 0 for c in clips):
-            max_clips = str(max(clips))
-            self.imu_status = "FAIL"
-            self.imu_feedback = f"Accel was clipped {max_clips} times."
+        self.imu_status = status[0]
+        self.imu_feedback = feedback[0]
     
     def vcc_test(self):
         """
@@ -124,57 +235,248 @@ trig_feedback = {self.trig_feedback}"""
          flight controller.
          
         """
-        self.vcc_mean = round(self._powr_df.Vcc.mean(), 2)
-        self.vcc_std = round(self._powr_df.Vcc.std(), 2)
+        stats = segment_stats(self._powr_df.Vcc.to_numpy(dtype=np.float64), [0])
+        self.vcc_mean = np.round(stats["mean"], 2)[0]
+        self.vcc_std = np.round(stats["std"], 2)[0]
 
-        self.vcc_status = "OK"
-        self.vcc_feedback = (
-            f"No board voltage issues (avg: {self.vcc_mean}v, std: {self.vcc_std}v)."
-        )
+        status, feedback = vcc_status(np.array([self.vcc_mean]), np.array([self.vcc_std]))
+        self.vcc_status = status[0]
+        self.vcc_feedback = feedback[0]
+
+    def spectral_test(self, nperseg=256, peaks=3):
+        """
+         Dominant vibration frequencies of each accelerometer axis, from the
+         raw IMU samples, to tell prop imbalance (motor rotation frequency)
+         from frame resonance. VIBE is logged too slowly to resolve them, so
+         without IMU samples (DayChecker raw_imu) the test is skipped.
+         
+         @param nperseg - samples per FFT segment
+         @param peaks - number of frequencies reported per axis
+        """
+        from tests.spectraltests import SPECTRAL_AXES, VibrationSpectrum, spectral_frame
 
-        # Check the voltage deviation of the board
-        if self.vcc_std >= 0.1:
-            self.vcc_status = "WARN"
-            self.vcc_feedback = (
-                f"Small voltage deviation ({self.vcc_std}v), please check the board."
-            )
-        # Check the board to see if the voltage deviation is greater than 0.15v
-        if self.vcc_std >= 0.15:
-            self.vcc_status = "FAIL"
-            self.vcc_feedback = (
-                f"Big voltage deviation ({self.vcc_std}v), please check the board."
-            )
-
-    def trig_test(self):
+        msg_type, df = spectral_frame(self._imu_df)
+        if msg_type is None:
+            return
+        self.imu_peaks = VibrationSpectrum(SPECTRAL_AXES[msg_type], nperseg=nperseg, peaks=peaks).run(df)
+        if not self.imu_peaks.empty:
+            top = self.imu_peaks.groupby("axis", sort=False).first()
+            self.imu_spectrum_feedback = "Dominant vibration: " + ", ".join(
+                f"{axis} {freq:.1f} Hz" for axis, freq in top["freq"].items()
+            ) + f" ({msg_type})."
+
+    def trig_test(self, tolerance=0.5):
         """
          Test the trigger and camera messages to see if the camera is
-         shooting properly.
+         shooting properly. Each trigger is also paired with its feedback,
+         so the missing photos (to be re-flown) and the extra ones are known
+         by index, along with the feedback latency percentiles (trig_detail).
          
+         @param tolerance - maximum feedback latency in seconds
         """
+        from tests.trigmatch import photo_report, latency_percentiles, extra_photos, photo_detail
+
         triggers = self._trig_df.shape[0]
         feedbacks = self._cam_df.shape[0]
-        # This function is called when the camera has skipped the triggers.
-        if triggers == feedbacks:
-            self.trig_status = "OK"
-            self.trig_feedback = f"No photos skipped ({triggers})."
-        elif triggers > feedbacks:
-            self.trig_status = "FAIL"
-            self.trig_feedback = (
-                f"{triggers - feedbacks} photos were taken without feedback."
-            )
-        elif triggers < feedbacks:
-            self.trig_status = "FAIL"
-            self.trig_feedback = f"The camera skipped {feedbacks - triggers} photos."
-
-    def run(self):
+        status, feedback = trig_status(np.array([triggers]), np.array([feedbacks]))
+
+        self.trig_status = status[0]
+        self.trig_feedback = feedback[0]
+
+        self.photo_report, extra = photo_report(self._trig_df, self._cam_df, tolerance)
+        self.trig_missing = self.photo_report["photo"][self.photo_report["missing"]].tolist()
+        self.trig_extra = extra.tolist()
+        self.trig_latency = latency_percentiles(self.photo_report["latency_ms"].to_numpy() / 1e3)
+        self.trig_detail = photo_detail(self.photo_report, extra_photos(self._cam_df, extra), self.trig_latency)
+
+    def window_test(self, window=20.0, stride=5.0):
+        """
+         Look for short bursts that whole-flight averages hide: the worst
+         windows of vibration, accel clipping, motors imbalance and board
+         voltage deviation. The worst window of each goes to window_feedback,
+         shown in the balloon.
+         
+         @param window - window length in seconds
+         @param stride - window step in seconds
+        """
+        from tests.windowtests import WindowedHealth
+
+        self.worst_windows = WindowedHealth(window, stride).run(
+            {"VIBE": self._vibe_df, "RCOU": self._rcou_df, "POWR": self._powr_df}
+        )
+        formats = {
+            "vibe": "vibration {:.1f} m/s/s",
+            "clip": "{:.0f} accel clips",
+            "motors": "motors PWM diff {:.0f}",
+            "vcc": "Vcc std {:.2f}v",
+        }
+        parts = []
+        for metric, text in formats.items():
+            worst = self.worst_windows.get(metric)
+            if worst is not None and not worst.empty and worst["score"].iat[0] > 0:
+                parts.append(f"{text.format(worst['score'].iat[0])} at {worst['start'].iat[0]:%H:%M:%S}")
+        if parts:
+            self.window_feedback = f"Worst {window:.0f}s windows: {', '.join(parts)}."
+
+    def rules_test(self, drone_uid=None, rules=None):
+        """
+         Set the status and feedback of the motors, imu, vcc and trig tests
+         from the health rules (tests/rules.json), with the profile of the
+         drone. Tests the rules can't evaluate keep the built-in result.
+         
+         @param drone_uid - serial number of the drone (selects the profile)
+         @param rules - RuleEngine (default: rule_engine())
+        """
+        rules = rule_engine() if rules is None else rules
+        results = rules.evaluate_frames(
+            {"RCOU": self._rcou_df, "VIBE": self._vibe_df, "POWR": self._powr_df, "CAM": self._cam_df, "TRIG": self._trig_df},
+            drone_uid,
+        )
+        for test in ["motors", "imu", "vcc", "trig"]:
+            if results.get(f"{test}_status") is not None:
+                setattr(self, f"{test}_status", results[f"{test}_status"])
+                setattr(self, f"{test}_feedback", results[f"{test}_feedback"])
+
+    def run(self, drone_uid=None, rules=None):
         """
          Run all the tests. This is the main method.
          
+         @param drone_uid - serial number of the drone (selects the rules profile)
+         @param rules - RuleEngine (default: rule_engine())
          
          @return self
         """
         self.motor_test()
         self.vibe_test()
+        self.spectral_test()
         self.vcc_test()
         self.trig_test()
+        self.window_test()
+        self.rules_test(drone_uid, rules)
         return self
+
+    @staticmethod
+    def score_batch(rcou, rcou_offsets, vibe, vibe_offsets, powr, powr_offsets, triggers, feedbacks,
+                    drone_uids=None, rules=None):
+        """
+         Score many flights in a single call. Samples of all flights are
+         stacked and each flight is located by the start offset of its segment,
+         so re-scoring an archive takes one vectorized pass per message type.
+         Statuses and feedbacks come from the health rules with the profile
+         of each drone, as in run().
+
+         @param rcou - array of shape (n, 4) with the stacked C1..C4 samples
+         @param rcou_offsets - start index of each flight in rcou
+         @param vibe - array of shape (n, 6) with VibeX/Y/Z and Clip0/1/2
+         @param vibe_offsets - start index of each flight in vibe
+         @param powr - array of shape (n,) with the stacked Vcc samples
+         @param powr_offsets - start index of each flight in powr
+         @param triggers - number of TRIG messages of each flight
+         @param feedbacks - number of CAM messages of each flight
+         @param drone_uids - serial number of the drone of each flight (selects
+         the rules profile; default profile when None)
+         @param rules - RuleEngine (default: rule_engine())
+
+         @return pd.DataFrame with one row of results per flight
+        """
+        motors = segment_stats(rcou, rcou_offsets)
+        motors_status, motors_feedback, pwm = motor_status(motors["mean"])
+
+        vibes = segment_stats(vibe, vibe_offsets)
+        imu_status, imu_feedback = vibe_status(vibes["mean"][:, :3], vibes["last"][:, 3:])
+
+        vcc = segment_stats(powr, powr_offsets)
+        vcc_mean = np.round(vcc["mean"], 2)
+        vcc_std = np.round(vcc["std"], 2)
+        vcc_stat, vcc_feedback = vcc_status(vcc_mean, vcc_std)
+
+        triggers = np.asarray(triggers)
+        feedbacks = np.asarray(feedbacks)
+        trig_stat, trig_feedback = trig_status(triggers, feedbacks)
+
+        results = pd.DataFrame(
+            {
+                "motors_status": motors_status,
+                "motors_feedback": motors_feedback,
+                "m1_avg_pwm": pwm[:, 0],
+                "m2_avg_pwm": pwm[:, 1],
+                "m3_avg_pwm": pwm[:, 2],
+                "m4_avg_pwm": pwm[:, 3],
+                "imu_status": imu_status,
+                "imu_feedback": imu_feedback,
+                "vcc_status": vcc_stat,
+                "vcc_mean": vcc_mean,
+                "vcc_std": vcc_std,
+                "vcc_feedback": vcc_feedback,
+                "trig_status": trig_stat,
+                "trig_feedback": trig_feedback,
+            }
+        )
+
+        # the rules' aggregates, from the statistics already computed
+        rules = rule_engine() if rules is None else rules
+        stacked = {"RCOU": (motors, MOTOR_CHANNELS), "VIBE": (vibes, VIBE_AXES + CLIP_AXES), "POWR": (vcc, ["Vcc"])}
+        aggregates = {"TRIG.TimeUS.count": triggers, "CAM.TimeUS.count": feedbacks}
+        for name in rules.signals():
+            msg, column, aggregate = name.split(".")
+            if msg in stacked and column in stacked[msg][1] and aggregate in stacked[msg][0]:
+                values = stacked[msg][0][aggregate]
+                aggregates[name] = values[:, stacked[msg][1].index(column)] if values.ndim == 2 else values
+        aggregates = pd.DataFrame(aggregates)
+
+        drone_uids = pd.Series([None] * results.shape[0] if drone_uids is None else list(drone_uids))
+        profiles = drone_uids.map(rules.profile_for)
+        for profile, flights in profiles.groupby(profiles, sort=False).groups.items():
+            scored = rules.evaluate(aggregates.loc[flights], profile)
+            for test in ["motors", "imu", "vcc", "trig"]:
+                if scored[f"{test}_status"].notna().all():
+                    results.loc[flights, f"{test}_status"] = scored[f"{test}_status"].to_numpy()
+                    results.loc[flights, f"{test}_feedback"] = scored[f"{test}_feedback"].to_numpy()
+        return results
+
+
+############################################################
+## tests
+############################################################
+
+def test_score_batch_matches_run(path="/tmp/healthtests_rules.json"):
+    import os
+    import json
+    from tests.ruleengine import RULES_FILE
+    from tests.streamtests import _random_flight
+
+    # drone "strict" warns on any frontal imbalance
+    with open(RULES_FILE, "r") as rules_file:
+        config = json.load(rules_file)
+    config["profiles"]["strict"] = {"rules": [{"name": "motors_front_warn", "value": 1}]}
+    config["drones"] = {"strict": "strict"}
+    with open(path, "w") as rules_file:
+        json.dump(config, rules_file)
+    rules = RuleEngine(path)
+
+    rng = np.random.default_rng(0)
+    flights = [_random_flight(rng, rng.integers(50, 1500)) for _ in range(20)]
+    drone_uids = ["strict" if i % 3 == 0 else f"drone{i}" for i in range(len(flights))]
+
+    def stack(msg_type, columns):
+        frames = [flight[msg_type][columns].to_numpy(dtype=np.float64) for flight in flights]
+        return np.concatenate(frames), np.cumsum([0] + [frame.shape[0] for frame in frames[:-1]])
+
+    rcou, rcou_offsets = stack("RCOU", MOTOR_CHANNELS)
+    vibe, vibe_offsets = stack("VIBE", VIBE_AXES + CLIP_AXES)
+    powr, powr_offsets = stack("POWR", ["Vcc"])
+    batch = HealthTests.score_batch(
+        rcou, rcou_offsets, vibe, vibe_offsets, powr[:, 0], powr_offsets,
+        [flight["TRIG"].shape[0] for flight in flights], [flight["CAM"].shape[0] for flight in flights],
+        drone_uids, rules,
+    )
+
+    assert (batch.loc[[0, 3, 6], "motors_status"] != "OK").all()
+    for i, (flight, drone_uid) in enumerate(zip(flights, drone_uids)):
+        report = HealthTests(flight["RCOU"], flight["VIBE"], flight["POWR"], flight["CAM"], flight["TRIG"])
+        report.run(drone_uid, rules)
+        for test in ["motors", "imu", "vcc", "trig"]:
+            assert batch[f"{test}_status"].iat[i] == getattr(report, f"{test}_status"), (i, test)
+            assert batch[f"{test}_feedback"].iat[i] == getattr(report, f"{test}_feedback"), (i, test)
+        assert batch.loc[i, ["m1_avg_pwm", "m2_avg_pwm", "m3_avg_pwm", "m4_avg_pwm"]].tolist() == report.motors_pwm_list
+    os.remove(path)
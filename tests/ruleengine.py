@@ -0,0 +1,414 @@
+import json
+import string
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from argparse import ArgumentParser
+
+RULES_FILE = Path(__file__).parent / "rules.json"
+
+# stored columns of the report and motors tables and the aggregates they hold
+STORED_AGGREGATES = {
+    "m1_avg_pwm": "RCOU.C1.mean",
+    "m2_avg_pwm": "RCOU.C2.mean",
+    "m3_avg_pwm": "RCOU.C3.mean",
+    "m4_avg_pwm": "RCOU.C4.mean",
+    "vcc_mean": "POWR.Vcc.mean",
+    "vcc_std": "POWR.Vcc.std",
+}
+
+LEVELS = ["OK", "WARN", "FAIL"]
+
+
+def _aggregate(series, aggregate):
+    """
+     Reduce a column of a decoded message frame to a single value.
+
+     @param series - pd.Series with the samples of one signal
+     @param aggregate - mean, std, min, max, first, last or count
+
+     @return scalar
+    """
+    if aggregate == "count":
+        return series.count()
+    series = series.dropna()
+    if series.empty:
+        return np.nan
+    if aggregate == "first":
+        return series.iloc[0]
+    if aggregate == "last":
+        return series.iloc[-1]
+    values = series.to_numpy(dtype=np.float64)
+    if aggregate == "mean":
+        return values.mean()
+    if aggregate == "std":
+        return values.std(ddof=1) if values.size > 1 else np.nan
+    if aggregate == "min":
+        return values.min()
+    if aggregate == "max":
+        return values.max()
+    raise ValueError(f"Unknown aggregate: {aggregate}")
+
+
+def _comparison(compare, value):
+    """
+     Build the vectorized comparison of a rule.
+
+     @param compare - comparison operator name
+     @param value - threshold, [low, high] pair or regex
+
+     @return function taking a pd.Series and returning a boolean array
+    """
+    numeric = {
+        ">": np.greater,
+        ">=": np.greater_equal,
+        "<": np.less,
+        "<=": np.less_equal,
+    }
+    if compare in numeric:
+        op = numeric[compare]
+        return lambda s: op(pd.to_numeric(s, errors="coerce").to_numpy(dtype=np.float64), value)
+    if compare in ("between", "outside"):
+        low, high = value
+        inside = lambda s: pd.to_numeric(s, errors="coerce").between(low, high).to_numpy()
+        if compare == "between":
+            return inside
+        return lambda s: ~inside(s) & s.notna().to_numpy()
+    if compare in ("==", "!="):
+        equal = lambda s: (s.astype(str) == str(value)).to_numpy()
+        if compare == "==":
+            return equal
+        return lambda s: ~equal(s) & s.notna().to_numpy()
+    if compare in ("match", "not_match"):
+        matches = lambda s: s.astype(str).str.match(value).to_numpy(dtype=bool)
+        if compare == "match":
+            return matches
+        return lambda s: ~matches(s) & s.notna().to_numpy()
+    raise ValueError(f"Unknown comparison: {compare}")
+
+
+class RuleEngine:
+    feature_ops = {
+        "trunc": lambda args, spec: np.trunc(args[0]),
+        "round": lambda args, spec: np.round(args[0], spec.get("digits", 0)),
+        "abs": lambda args, spec: np.abs(args[0]),
+        "diff": lambda args, spec: args[0] - args[1],
+        "absdiff": lambda args, spec: np.abs(args[0] - args[1]),
+        "max": lambda args, spec: np.max(np.column_stack(args), axis=1),
+        "min": lambda args, spec: np.min(np.column_stack(args), axis=1),
+        # label of the largest argument (ex.: the motor with the highest PWM)
+        "argmax": lambda args, spec: np.asarray(spec["labels"])[np.argmax(np.column_stack(args), axis=1)],
+    }
+
+    def __init__(self, path=RULES_FILE):
+        """
+         Initialize the object. It loads health rules (signal, aggregate,
+         comparison, level and feedback) from a JSON file and compiles them
+         into vectorized evaluators, which can score decoded frames of a
+         flight or the aggregates stored for the whole history.
+
+         @param path - path to the rules file
+        """
+        self.path = Path(path)
+        self._mtime = None
+        self.reload()
+
+    def reload(self):
+        """
+         Read the rules file and compile every profile.
+        """
+        with open(self.path, "r") as rules_file:
+            config = json.load(rules_file)
+        self._mtime = self.path.stat().st_mtime
+        self.tests = config["tests"]
+        self.features = config.get("features", {})
+        self.drones = config.get("drones", {})
+        self.profiles = {}
+        for name in config["profiles"]:
+            rules = self.resolve(config["profiles"], name)
+            self.profiles[name] = [(rule, self.compile(rule)) for rule in rules]
+
+    def maybe_reload(self):
+        """
+         Reload the rules if the file changed since it was last read.
+
+         @return True if the rules were reloaded
+        """
+        if self.path.stat().st_mtime != self._mtime:
+            self.reload()
+            return True
+        return False
+
+    def resolve(self, profiles, name):
+        """
+         Expand a profile. A profile is a list of rules or a dict that
+         extends another profile, replacing rules by name and adding new ones.
+
+         @param profiles - the profiles section of the rules file
+         @param name - profile to expand
+
+         @return list of rule dicts, in evaluation order
+        """
+        profile = profiles[name]
+        if isinstance(profile, list):
+            return profile
+        rules = [dict(rule) for rule in self.resolve(profiles, profile.get("extends", "default"))]
+        index = {rule["name"]: i for i, rule in enumerate(rules)}
+        for rule in profile.get("rules", []):
+            if rule["name"] in index:
+                rules[index[rule["name"]]].update(rule)
+            else:
+                rules.append(rule)
+        return rules
+
+    def compile(self, rule):
+        """
+         Compile one rule.
+
+         @param rule - rule dict from the rules file
+
+         @return tuple (feature name, comparison function)
+        """
+        if rule["level"] not in LEVELS[1:]:
+            raise ValueError(f"Unknown level in rule {rule['name']}: {rule['level']}")
+        feature = rule["signal"]
+        if "aggregate" in rule:
+            feature = f"{feature}.{rule['aggregate']}"
+        return feature, _comparison(rule["compare"], rule["value"])
+
+    def signals(self):
+        """
+         Raw aggregates (message.column.aggregate) needed by any feature or rule.
+
+         @return set of aggregate names
+        """
+        names = {feature for rules in self.profiles.values() for rule, (feature, op) in rules}
+        names |= {arg for spec in self.features.values() for arg in spec["args"]}
+        return {name for name in names if name not in self.features and name.count(".") == 2}
+
+    def aggregates(self, df_dict):
+        """
+         Reduce the decoded message frames of one flight to the aggregates
+         used by the rules.
+
+         @param df_dict - dict of DataFrames keyed by message type
+
+         @return pd.DataFrame with a single row
+        """
+        row = {}
+        for name in self.signals():
+            msg, column, aggregate = name.split(".")
+            if msg in df_dict and column in df_dict[msg]:
+                row[name] = _aggregate(df_dict[msg][column], aggregate)
+        return pd.DataFrame([row])
+
+    def derive(self, aggregates):
+        """
+         Add the derived features to a table of aggregates, one column each.
+         Features whose inputs are missing are skipped.
+
+         @param aggregates - pd.DataFrame with one row per flight
+
+         @return pd.DataFrame with aggregates and features
+        """
+        table = aggregates.copy()
+        for name, spec in self.features.items():
+            if all(arg in table for arg in spec["args"]):
+                args = [pd.to_numeric(table[arg], errors="coerce").to_numpy(dtype=np.float64) for arg in spec["args"]]
+                table[name] = RuleEngine.feature_ops[spec["op"]](args, spec)
+        return table
+
+    def evaluate(self, aggregates, profile="default"):
+        """
+         Evaluate every test of a profile over many flights at once. In each
+         test the first matching rule, in file order, sets the level and the
+         feedback. Tests whose signals are not available are left as None.
+
+         @param aggregates - pd.DataFrame of aggregates, one row per flight
+         @param profile - name of the rules profile
+
+         @return pd.DataFrame with <test>_status and <test>_feedback columns
+        """
+        table = self.derive(aggregates).reset_index(drop=True)
+        results = pd.DataFrame(index=table.index)
+        rules = self.profiles[profile]
+
+        for test, settings in self.tests.items():
+            test_rules = [(rule, feature, op) for rule, (feature, op) in rules if rule["test"] == test]
+            if not test_rules or not all(feature in table for rule, feature, op in test_rules):
+                results[f"{test}_status"] = None
+                results[f"{test}_feedback"] = None
+                continue
+
+            status = np.full(table.shape[0], "OK", dtype=object)
+            feedback = np.array([self.format(settings["ok"], table, i) for i in table.index], dtype=object)
+            decided = np.zeros(table.shape[0], dtype=bool)
+            for rule, feature, op in test_rules:
+                hit = op(table[feature]) & ~decided
+                for i in np.flatnonzero(hit):
+                    status[i] = rule["level"]
+                    feedback[i] = self.format(rule["feedback"], table, i, table[feature].iat[i])
+                decided |= hit
+            results[f"{test}_status"] = status
+            results[f"{test}_feedback"] = feedback
+        return results
+
+    def format(self, template, table, i, value=None):
+        """
+         Fill a feedback template with the values of one flight. Templates can
+         use {value} (the rule's signal) and any feature named like an identifier.
+
+         @param template - feedback template
+         @param table - pd.DataFrame of features
+         @param i - row of the flight
+         @param value - value of the rule's signal
+
+         @return feedback string
+        """
+        fields = {"value": value}
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            if field and field != "value" and field in table:
+                fields[field] = table[field].iat[i]
+        try:
+            return template.format_map(fields)
+        except (KeyError, ValueError, TypeError):
+            return template
+
+    def profile_for(self, drone_uid):
+        """
+         Rules profile assigned to a drone in the rules file.
+
+         @param drone_uid - serial number of the drone
+
+         @return profile name
+        """
+        return self.drones.get(drone_uid, "default")
+
+    def evaluate_frames(self, df_dict, drone_uid=None):
+        """
+         Evaluate the rules over the decoded frames of one flight.
+
+         @param df_dict - dict of DataFrames keyed by message type
+         @param drone_uid - serial number of the drone (selects the profile)
+
+         @return dict with <test>_status and <test>_feedback values
+        """
+        self.maybe_reload()
+        results = self.evaluate(self.aggregates(df_dict), self.profile_for(drone_uid))
+        return results.iloc[0].to_dict()
+
+    def evaluate_stored(self, drone_uid=None, start=None, end=None):
+        """
+         Re-score the stored history with the current rules. Only tests whose
+         aggregates are stored (motors and board voltage) can be re-evaluated.
+
+         @param drone_uid - only flights of this drone
+         @param start - only flights at or after this unix timestamp
+         @param end - only flights before this unix timestamp
+
+         @return pd.DataFrame with uid, timestamp, drone_uid and the test results
+        """
+        from database.repository.report_repo import RpRepo
+        from database.repository.motors_repo import MtRepo
+
+        self.maybe_reload()
+        reports = RpRepo().select_df(drone_uid, start, end, columns=["uid", "timestamp", "drone_uid", "vcc_mean", "vcc_std"])
+        motors = MtRepo().select_df(
+            drone_uid, start, end, columns=["timestamp", "m1_avg_pwm", "m2_avg_pwm", "m3_avg_pwm", "m4_avg_pwm"]
+        )
+        history = reports.merge(motors, on="timestamp", how="inner").rename(columns=STORED_AGGREGATES)
+
+        results = []
+        profiles = history["drone_uid"].map(self.profile_for)
+        for profile, flights in history.groupby(profiles, sort=False):
+            scored = self.evaluate(flights, profile)
+            scored.insert(0, "uid", flights["uid"].to_numpy())
+            scored.insert(1, "timestamp", flights["timestamp"].to_numpy())
+            scored.insert(2, "drone_uid", flights["drone_uid"].to_numpy())
+            results.append(scored.dropna(axis=1, how="all"))
+        if not results:
+            return pd.DataFrame(columns=["uid", "timestamp", "drone_uid"])
+        return pd.concat(results, ignore_index=True)
+
+
+##running when not being imported
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Re-score the stored flight history with the current health rules.")
+    parser.add_argument("--rules", default=RULES_FILE, help="rules file")
+    parser.add_argument("--drone", default=None, help="only flights of this drone")
+    parser.add_argument("--write", action="store_true", help="store the new statuses in the report table")
+    args = parser.parse_args()
+
+    rescored = RuleEngine(args.rules).evaluate_stored(args.drone)
+    print(rescored.to_string(index=False))
+    if args.write:
+        from database.repository.report_repo import RpRepo
+
+        columns = {"motors_status": "motor_status", "motors_feedback": "motor_feedback", "vcc_status": "vcc_status"}
+        updates = rescored[["uid"] + [c for c in columns if c in rescored]]
+        RpRepo().update_many(updates.rename(columns=columns).to_dict("records"))
+
+
+############################################################
+## tests
+############################################################
+
+def test_rules_match_builtin_tests():
+    from tests.healthtests import HealthTests
+    from tests.streamtests import _random_flight
+
+    rng = np.random.default_rng(0)
+    engine = RuleEngine()
+    for _ in range(100):
+        frames = _random_flight(rng, rng.integers(20, 2000))
+        builtin = HealthTests(frames["RCOU"], frames["VIBE"], frames["POWR"], frames["CAM"], frames["TRIG"])
+        builtin.motor_test()
+        builtin.vibe_test()
+        builtin.vcc_test()
+        builtin.trig_test()
+        results = engine.evaluate_frames(frames)
+        for test in ["motors", "imu", "vcc", "trig"]:
+            assert results[f"{test}_status"] == getattr(builtin, f"{test}_status"), test
+        if builtin.motors_status != "OK":
+            # the motor to check is the busiest of the unbalanced pair
+            pair = [1, 3] if "frontal" in results["motors_feedback"] else [2, 4]
+            motor = max(pair, key=lambda m: builtin.motors_pwm_list[m - 1])
+            assert results["motors_feedback"].endswith(f"Check motor {motor}.")
+
+
+def test_stored_feedback_keeps_motor():
+    stored = pd.DataFrame(
+        {"m1_avg_pwm": [1500, 1500, 1500], "m2_avg_pwm": [1500, 1560, 1500], "m3_avg_pwm": [1550, 1500, 1500],
+         "m4_avg_pwm": [1500, 1500, 1500], "vcc_mean": [5.0, 5.0, 5.0], "vcc_std": [0.01, 0.01, 0.01]}
+    ).rename(columns=STORED_AGGREGATES)
+    results = RuleEngine().evaluate(stored)
+    assert results["motors_status"].tolist() == ["FAIL", "FAIL", "OK"]
+    assert results["motors_feedback"].tolist() == [
+        "Big difference in frontal motors PWM's avg (50). Check motor 3.",
+        "Big difference in back motors PWM's avg (60). Check motor 2.",
+        "balanced",
+    ]
+
+
+def test_profile_for_drone(path="/tmp/ruleengine_test.json"):
+    import os
+    from tests.healthtests import HealthTests
+    from tests.streamtests import _random_flight
+
+    with open(RULES_FILE, "r") as rules_file:
+        config = json.load(rules_file)
+    config["profiles"]["strict"] = {"rules": [{"name": "motors_front_warn", "value": 1}]}
+    config["drones"] = {"strict-drone": "strict"}
+    with open(path, "w") as rules_file:
+        json.dump(config, rules_file)
+    engine = RuleEngine(path)
+
+    frames = _random_flight(np.random.default_rng(1), 500)
+    frames["RCOU"] = pd.DataFrame({"C1": 1500, "C2": 1500, "C3": 1510, "C4": 1500}, index=frames["RCOU"].index)
+    report = HealthTests(frames["RCOU"], frames["VIBE"], frames["POWR"], frames["CAM"], frames["TRIG"])
+    report.rules_test("strict-drone", engine)
+    assert report.motors_status == "WARN"
+    assert report.motors_feedback == "Small difference between frontal motors PWM (10). Check motor 3."
+    report.rules_test("other-drone", engine)
+    assert (report.motors_status, report.motors_feedback) == ("OK", "balanced")
+    os.remove(path)
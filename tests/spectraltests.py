@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# accelerometer columns of each message usable for the spectrum
+SPECTRAL_AXES = {"IMU": ["AccX", "AccY", "AccZ"]}
+
+
+class VibrationSpectrum:
+    def __init__(self, axes, nperseg=256, overlap=0.5, chunk_windows=512, peaks=3):
+        """
+         Streaming averaged spectrum (Welch's method) of accelerometer axes.
+         Samples are cut into Hann-windowed segments and the FFTs of up to
+         chunk_windows segments are computed in one batched call, so memory
+         stays bounded however long and fast the log is.
+
+         @param axes - columns of the message used (ex.: ["AccX", "AccY", "AccZ"])
+         @param nperseg - samples per FFT segment
+         @param overlap - fraction of overlap between segments
+         @param chunk_windows - segments transformed per batch
+         @param peaks - number of dominant frequencies reported per axis
+        """
+        self.axes = axes
+        self.nperseg = nperseg
+        self.step = max(int(nperseg * (1 - overlap)), 1)
+        self.chunk_windows = chunk_windows
+        self.peaks = peaks
+        self.window = np.hanning(nperseg)
+        self.rate = None
+        self.windows = 0
+        self._power = np.zeros((nperseg // 2 + 1, len(axes)))
+        self._tail = np.empty((0, len(axes)))
+        self._last_time = None
+
+    def _times(self, chunk):
+        if "TimeUS" in chunk:
+            return chunk["TimeUS"].to_numpy(dtype=np.float64) / 1e6
+        if isinstance(chunk.index, pd.DatetimeIndex):
+            return chunk.index.asi8 / 1e9
+        return chunk.index.to_numpy(dtype=np.float64)
+
+    def update(self, chunk):
+        """
+         Add a chunk of samples. The sample rate is estimated from the first
+         chunk; NaN samples are filled with the segment mean (no power).
+
+         @param chunk - pd.DataFrame with the accelerometer columns
+        """
+        if chunk.empty:
+            return
+        if self.rate is None:
+            times = self._times(chunk)
+            steps = np.diff(times)
+            steps = steps[steps > 0]
+            if steps.size == 0:
+                return
+            self.rate = 1.0 / np.median(steps)
+
+        values = np.vstack([self._tail, chunk[self.axes].to_numpy(dtype=np.float64)])
+        count = (values.shape[0] - self.nperseg) // self.step + 1
+        if count <= 0:
+            self._tail = values
+            return
+        segments = sliding_window_view(values, self.nperseg, axis=0)[:: self.step][:count]
+        for i in range(0, count, self.chunk_windows):
+            block = segments[i: i + self.chunk_windows]  # (w, axes, nperseg)
+            mean = np.nanmean(block, axis=-1, keepdims=True)
+            block = np.where(np.isnan(block), mean, block) - mean
+            spectrum = np.fft.rfft(np.nan_to_num(block) * self.window, axis=-1)
+            self._power += (np.abs(spectrum) ** 2).sum(axis=0).T
+        self.windows += count
+        self._tail = values[count * self.step:]
+
+    def density(self):
+        """
+         Averaged power spectral density of each axis.
+
+         @return pd.DataFrame indexed by frequency (Hz), one column per axis
+        """
+        freqs = np.fft.rfftfreq(self.nperseg, 1.0 / (self.rate or 1.0))
+        psd = self._power / max(self.windows, 1) / ((self.rate or 1.0) * (self.window ** 2).sum())
+        psd[1:-1] *= 2  # one-sided
+        return pd.DataFrame(psd, index=pd.Index(freqs, name="freq"), columns=self.axes)
+
+    def dominant(self):
+        """
+         Dominant frequencies of each axis: the highest local maxima of the
+         spectrum, excluding the DC bin.
+
+         @return pd.DataFrame with axis, freq (Hz) and power, strongest first
+        """
+        rows = []
+        if self.windows == 0:
+            return pd.DataFrame(columns=["axis", "freq", "power"])
+        psd = self.density()
+        values = psd.to_numpy()
+        local_max = np.zeros(values.shape, dtype=bool)
+        local_max[1:-1] = (values[1:-1] > values[:-2]) & (values[1:-1] >= values[2:])
+        for j, axis in enumerate(self.axes):
+            candidates = np.flatnonzero(local_max[:, j])
+            for k in candidates[np.argsort(values[candidates, j])[::-1][: self.peaks]]:
+                rows.append((axis, psd.index[k], values[k, j]))
+        return pd.DataFrame(rows, columns=["axis", "freq", "power"])
+
+    def run(self, df, chunksize=50000):
+        """
+         Spectrum of a whole frame, fed in chunks. This is the main method.
+
+         @param df - pd.DataFrame with the accelerometer columns
+         @param chunksize - samples per chunk
+
+         @return dominant frequencies, as in dominant()
+        """
+        for i in range(0, df.shape[0], chunksize):
+            self.update(df.iloc[i: i + chunksize])
+        return self.dominant()
+
+
+def spectral_frame(imu_df=None):
+    """
+     Pick the accelerometer data for the spectrum: the raw IMU samples of
+     the first instance. VIBE is logged too slowly to be used instead.
+
+     @param imu_df - dataframe with IMU data, if logged
+
+     @return tuple (message type, pd.DataFrame), or (None, None)
+    """
+    if imu_df is not None and not imu_df.empty and all(c in imu_df for c in SPECTRAL_AXES["IMU"]):
+        if "I" in imu_df:
+            imu_df = imu_df[imu_df["I"] == imu_df["I"].min()]
+        return "IMU", imu_df
+    return None, None
+
+
+############################################################
+## tests
+############################################################
+
+def test_dominant_frequencies():
+    rng = np.random.default_rng(0)
+    rate = 400.0
+    t = np.arange(0, 120, 1 / rate)
+    df = pd.DataFrame(
+        {
+            "TimeUS": t * 1e6,
+            "AccX": 0.8 * np.sin(2 * np.pi * 87.0 * t) + rng.normal(0, 0.3, t.size),
+            "AccY": 0.5 * np.sin(2 * np.pi * 23.0 * t) + rng.normal(0, 0.3, t.size),
+            "AccZ": -9.8 + 0.4 * np.sin(2 * np.pi * 140.0 * t) + rng.normal(0, 0.3, t.size),
+        }
+    )
+    df.iloc[1000:1010, 1] = np.nan
+    spectrum = VibrationSpectrum(SPECTRAL_AXES["IMU"], nperseg=512, chunk_windows=16)
+    peaks = spectrum.run(df, chunksize=3001)
+    top = peaks.groupby("axis", sort=False).first()["freq"]
+    resolution = rate / 512
+    assert abs(top["AccX"] - 87.0) <= resolution
+    assert abs(top["AccY"] - 23.0) <= resolution
+    assert abs(top["AccZ"] - 140.0) <= resolution
+
+
+def test_chunking_is_exact():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame(rng.normal(size=(10000, 3)), columns=SPECTRAL_AXES["IMU"], index=np.arange(10000) * 0.1)
+    whole = VibrationSpectrum(SPECTRAL_AXES["IMU"], nperseg=64)
+    whole.update(df)
+    chunked = VibrationSpectrum(SPECTRAL_AXES["IMU"], nperseg=64, chunk_windows=7)
+    chunked.run(df, chunksize=333)
+    assert whole.windows == chunked.windows
+    assert np.allclose(whole.density().to_numpy(), chunked.density().to_numpy())
+
+
+def test_spectrum_needs_imu():
+    from tests.healthtests import VIBE_AXES, HealthTests
+
+    rng = np.random.default_rng(2)
+    t = np.arange(0, 30, 1 / 400.0)
+    imu = pd.DataFrame({"TimeUS": t * 1e6, "AccX": np.sin(2 * np.pi * 87.0 * t), "AccY": rng.normal(size=t.size),
+                        "AccZ": rng.normal(size=t.size)})
+    vibe = pd.DataFrame(rng.normal(size=(300, 3)), columns=VIBE_AXES, index=np.arange(300) * 0.1)
+    # VIBE alone is too slow for a spectrum: no feedback
+    report = HealthTests(None, vibe, None, None, None)
+    report.spectral_test()
+    assert report.imu_peaks is None and report.imu_spectrum_feedback == ""
+    report = HealthTests(None, vibe, None, None, None, imu)
+    report.spectral_test()
+    assert report.imu_spectrum_feedback.startswith("Dominant vibration: AccX 8") and report.imu_spectrum_feedback.endswith("(IMU).")
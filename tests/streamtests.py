@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+from tests.healthtests import (
+    MOTOR_CHANNELS,
+    VIBE_AXES,
+    CLIP_AXES,
+    HealthTests,
+    motor_status,
+    vibe_status,
+    vcc_status,
+    trig_status,
+)
+
+
+class RunningStats:
+    def __init__(self, width):
+        """
+         Constant-size NaN-aware accumulator of count, mean, M2 and last
+         row for a group of columns, merged batch by batch (Chan/Welford).
+
+         @param width - number of columns
+        """
+        self.count = np.zeros(width)
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self.last = np.full(width, np.nan)
+
+    def update(self, values):
+        """
+         Merge a batch of samples into the accumulator.
+
+         @param values - array of shape (n, width)
+        """
+        if values.shape[0] == 0:
+            return
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(valid, values, 0.0).sum(axis=0) / count
+            m2 = np.where(valid, (values - mean) ** 2, 0.0).sum(axis=0)
+            total = self.count + count
+            delta = np.nan_to_num(mean) - self.mean
+            weight = np.where(total > 0, count / total, 0.0)
+            self.m2 = self.m2 + np.nan_to_num(m2) + delta * delta * self.count * weight
+        self.mean = self.mean + delta * weight
+        self.count = total
+        self.last = values[-1]
+
+    def result_mean(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count > 0, self.mean, np.nan)
+
+    def result_std(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.sqrt(self.m2 / (self.count - 1))
+
+
+class StreamingHealthTests:
+    def __init__(self):
+        """
+         Initialize the object. It runs the HealthTests checks (motors,
+         vibration, board voltage and camera trigger) over record batches as
+         they are decoded, keeping only constant-size state per signal, and
+         gives the same results as the batch version.
+        """
+        self._rcou = RunningStats(len(MOTOR_CHANNELS))
+        self._vibe = RunningStats(len(VIBE_AXES) + len(CLIP_AXES))
+        self._powr = RunningStats(1)
+        self._counts = {"TRIG": 0, "CAM": 0}
+
+        self.motors_status = "UNKNOWN"
+        self.motors_feedback = ""
+        self.imu_status = "UNKNOWN"
+        self.imu_feedback = ""
+        self.vcc_status = None
+        self.vcc_feedback = ""
+        self.vcc_mean = None
+        self.vcc_std = None
+        self.trig_status = "UNKNOWN"
+        self.trig_feedback = ""
+
+    def update(self, msg_type, batch):
+        """
+         Consume a record batch of one message type.
+
+         @param msg_type - message type of the batch (ex.: "RCOU")
+         @param batch - pd.DataFrame with the decoded messages
+        """
+        if msg_type == "RCOU":
+            self._rcou.update(batch[MOTOR_CHANNELS].to_numpy(dtype=np.float64))
+        elif msg_type == "VIBE":
+            self._vibe.update(batch[VIBE_AXES + CLIP_AXES].to_numpy(dtype=np.float64))
+        elif msg_type == "POWR":
+            self._powr.update(batch[["Vcc"]].to_numpy(dtype=np.float64))
+        elif msg_type in self._counts:
+            self._counts[msg_type] += batch.shape[0]
+
+    def finalize(self):
+        """
+         Compute the statuses from the accumulated state.
+
+         @return self
+        """
+        status, feedback, pwm = motor_status(self._rcou.result_mean()[None, :])
+        self.motors_status = status[0]
+        self.motors_feedback = feedback[0]
+        self.motors_pwm_list = [int(x) for x in pwm[0]]
+
+        vibes = self._vibe.result_mean()[None, :len(VIBE_AXES)]
+        clips = self._vibe.last[None, len(VIBE_AXES):]
+        status, feedback = vibe_status(vibes, clips)
+        self.imu_status = status[0]
+        self.imu_feedback = feedback[0]
+
+        self.vcc_mean = np.round(self._powr.result_mean(), 2)[0]
+        self.vcc_std = np.round(self._powr.result_std(), 2)[0]
+        status, feedback = vcc_status(np.array([self.vcc_mean]), np.array([self.vcc_std]))
+        self.vcc_status = status[0]
+        self.vcc_feedback = feedback[0]
+
+        status, feedback = trig_status(np.array([self._counts["TRIG"]]), np.array([self._counts["CAM"]]))
+        self.trig_status = status[0]
+        self.trig_feedback = feedback[0]
+        return self
+
+    def run(self, batches):
+        """
+         Consume every batch and compute the statuses. This is the main method.
+
+         @param batches - iterable of (msg_type, pd.DataFrame), as given by
+         internal.logstream.iter_batches
+
+         @return self
+        """
+        for msg_type, batch in batches:
+            self.update(msg_type, batch)
+        return self.finalize()
+
+
+############################################################
+## tests
+############################################################
+
+def _random_flight(rng, n):
+    idx = pd.to_datetime(np.arange(n) * 0.1, unit="s")
+    rcou = pd.DataFrame({c: rng.integers(1400, 1400 + rng.integers(1, 120), n) for c in MOTOR_CHANNELS}, index=idx)
+    vibe = pd.DataFrame(
+        {
+            "VibeX": rng.normal(rng.uniform(5, 35), 3, n),
+            "VibeY": rng.normal(10, 3, n),
+            "VibeZ": rng.normal(10, 3, n),
+            "Clip0": np.sort(rng.integers(0, rng.integers(1, 3), n)),
+            "Clip1": 0,
+            "Clip2": 0,
+        },
+        index=idx,
+    )
+    powr = pd.DataFrame({"Vcc": rng.normal(5, rng.uniform(0.001, 0.2), n)}, index=idx)
+    cam = pd.DataFrame({"TimeUS": np.arange(rng.integers(5, 8))})
+    trig = pd.DataFrame({"TimeUS": np.arange(rng.integers(5, 8))})
+    return {"RCOU": rcou, "VIBE": vibe, "POWR": powr, "CAM": cam, "TRIG": trig}
+
+
+def _batches(frames, size):
+    for msg_type, df in frames.items():
+        for i in range(0, df.shape[0], size):
+            yield msg_type, df.iloc[i:i + size]
+
+
+def test_streaming_matches_batch():
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        frames = _random_flight(rng, rng.integers(20, 2000))
+        batch = HealthTests(frames["RCOU"], frames["VIBE"], frames["POWR"], frames["CAM"], frames["TRIG"])
+        batch.motor_test()
+        batch.vibe_test()
+        batch.vcc_test()
+        batch.trig_test()
+        stream = StreamingHealthTests().run(_batches(frames, rng.integers(1, 500)))
+        for attr in ["motors_status", "motors_feedback", "motors_pwm_list", "imu_status", "imu_feedback",
+                     "vcc_status", "vcc_feedback", "vcc_mean", "vcc_std", "trig_status", "trig_feedback"]:
+            assert getattr(stream, attr) == getattr(batch, attr), attr
+
+
+def test_running_stats():
+    rng = np.random.default_rng(1)
+    values = rng.normal(5, 0.05, (1000, 2))
+    values[rng.integers(0, 1000, 50), 1] = np.nan
+    stats = RunningStats(2)
+    for i in range(0, 1000, 37):
+        stats.update(values[i:i + 37])
+    assert np.allclose(stats.result_mean(), np.nanmean(values, axis=0))
+    assert np.allclose(stats.result_std(), np.nanstd(values, axis=0, ddof=1))
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def _seconds(df):
+    """
+     Time of each message in seconds. TimeUS (microseconds since boot) is
+     used when available, since it is finer than the GPS timestamp index.
+
+     @param df - dataframe with TRIG or CAM data
+
+     @return np.ndarray of float64
+    """
+    if "TimeUS" in df:
+        return df["TimeUS"].to_numpy(dtype=np.float64) / 1e6
+    if isinstance(df.index, pd.DatetimeIndex):
+        return df.index.asi8 / 1e9
+    return df.index.to_numpy(dtype=np.float64)
+
+
+def match_photos(trig_times, cam_times, tolerance=0.5):
+    """
+     Pair every camera trigger with its camera feedback by a sorted merge:
+     each feedback is matched backwards to the latest trigger at or before
+     it, within the tolerance (an asof join). When several feedbacks fall on
+     the same trigger the first one is its photo and the others are extra.
+
+     @param trig_times - time of each TRIG message in seconds
+     @param cam_times - time of each CAM message in seconds
+     @param tolerance - maximum feedback latency in seconds
+
+     @return tuple (cam index of each trigger or -1, latency of each trigger
+     in seconds or NaN, indices of the extra feedbacks)
+    """
+    trig_times = np.asarray(trig_times, dtype=np.float64)
+    cam_times = np.asarray(cam_times, dtype=np.float64)
+    cam_for_trig = np.full(trig_times.size, -1, dtype=np.int64)
+    latency = np.full(trig_times.size, np.nan)
+    if trig_times.size == 0 or cam_times.size == 0:
+        return cam_for_trig, latency, np.arange(cam_times.size)
+
+    trig_order = np.argsort(trig_times, kind="stable")
+    cam_order = np.argsort(cam_times, kind="stable")
+    trigs = trig_times[trig_order]
+    cams = cam_times[cam_order]
+
+    pos = np.searchsorted(trigs, cams, side="right") - 1
+    delay = cams - trigs[np.maximum(pos, 0)]
+    matched = (pos >= 0) & (delay <= tolerance)
+    # feedbacks are sorted, so the ones sharing a trigger are consecutive and
+    # only the first of them (the smallest latency) can be its photo
+    matched[1:] &= pos[1:] != pos[:-1]
+
+    cam_for_trig[trig_order[pos[matched]]] = cam_order[matched]
+    latency[trig_order[pos[matched]]] = delay[matched]
+    extra = np.sort(cam_order[~matched])
+    return cam_for_trig, latency, extra
+
+
+def latency_percentiles(latency, percentiles=PERCENTILES):
+    """
+     Percentiles of the feedback latency of the matched photos.
+
+     @param latency - latency of each trigger in seconds (NaN if missing)
+     @param percentiles - percentiles to compute
+
+     @return dict like {"p50": ..., "p90": ...} in milliseconds
+    """
+    latency = latency[~np.isnan(latency)]
+    if latency.size == 0:
+        return {f"p{p}": np.nan for p in percentiles}
+    values = np.percentile(latency * 1e3, percentiles)
+    return {f"p{p}": round(float(v), 1) for p, v in zip(percentiles, values)}
+
+
+def photo_report(trig_df, cam_df, tolerance=0.5):
+    """
+     Per-photo report of a flight: which triggers got a feedback, how late
+     it was, and where the missing photos should have been taken.
+
+     @param trig_df - dataframe with TRIG data (camera trigger)
+     @param cam_df - dataframe with CAM data (camera messages)
+     @param tolerance - maximum feedback latency in seconds
+
+     @return tuple (pd.DataFrame with one row per trigger, indices of the
+     extra feedbacks)
+    """
+    cam_for_trig, latency, extra = match_photos(_seconds(trig_df), _seconds(cam_df), tolerance)
+    report = pd.DataFrame(
+        {
+            "photo": trig_df["Img"].to_numpy() if "Img" in trig_df else np.arange(1, trig_df.shape[0] + 1),
+            "cam_index": cam_for_trig,
+            "latency_ms": latency * 1e3,
+            "missing": cam_for_trig < 0,
+        },
+        index=trig_df.index,
+    )
+    for column in ["Lat", "Lng"]:
+        if column in trig_df:
+            report[column] = trig_df[column].to_numpy()
+    return report, extra
+
+
+def extra_photos(cam_df, extra):
+    """
+     Photo numbers of the extra feedbacks (CAM records without a trigger).
+
+     @param cam_df - dataframe with CAM data (camera messages)
+     @param extra - positions of the extra feedbacks in cam_df
+
+     @return np.ndarray
+    """
+    if "Img" in cam_df:
+        return cam_df["Img"].to_numpy()[extra]
+    return np.asarray(extra) + 1
+
+
+def _listing(values, limit=10):
+    values = [str(v) for v in values]
+    more = f" (+{len(values) - limit} more)" if len(values) > limit else ""
+    return ", ".join(values[:limit]) + more
+
+
+def photo_detail(report, extra_photo_numbers, latency):
+    """
+     Short text for the balloon: the photos to re-fly, the extra ones and
+     the feedback latency.
+
+     @param report - pd.DataFrame from photo_report
+     @param extra_photo_numbers - photo numbers of the extra feedbacks
+     @param latency - dict from latency_percentiles
+
+     @return str
+    """
+    parts = []
+    missing = report["photo"][report["missing"]].tolist()
+    if missing:
+        parts.append(f"Missing photos: {_listing(missing)}.")
+    if len(extra_photo_numbers):
+        parts.append(f"Extra photos: {_listing(extra_photo_numbers)}.")
+    if not np.isnan(latency.get("p50", np.nan)):
+        parts.append(f"Feedback latency p50 {latency['p50']} ms, p95 {latency['p95']} ms.")
+    return " ".join(parts)
+
+
+def write_photo_report(report, extra, cam_df, csv_path):
+    """
+     Write the per-photo report of a flight: one row per trigger (ok or
+     missing) and one per extra feedback, with its position when logged.
+
+     @param report - pd.DataFrame from photo_report
+     @param extra - positions of the extra feedbacks in cam_df
+     @param cam_df - dataframe with CAM data (camera messages)
+     @param csv_path - output file
+    """
+    rows = report.reset_index(drop=True)
+    rows.insert(1, "status", np.where(rows["missing"], "missing", "ok"))
+    extras = pd.DataFrame(
+        {"photo": extra_photos(cam_df, extra), "status": "extra", "cam_index": extra, "latency_ms": np.nan}
+    )
+    for column in ["Lat", "Lng"]:
+        if column in cam_df:
+            extras[column] = cam_df[column].to_numpy()[extra]
+    pd.concat([rows.drop(columns="missing"), extras], ignore_index=True).to_csv(
+        csv_path, index=False, float_format="%.8f"
+    )
+
+
+############################################################
+## tests
+############################################################
+
+def test_match_photos():
+    rng = np.random.default_rng(0)
+    trigs = np.cumsum(rng.uniform(1.5, 2.5, 5000))
+    cams = trigs + rng.uniform(0.02, 0.2, trigs.size)
+    dropped = rng.choice(trigs.size, 40, replace=False)
+    doubled = rng.choice(trigs.size, 10, replace=False)
+    cams = np.r_[np.delete(cams, dropped), cams[doubled] + 0.01]
+    shuffled = rng.permutation(cams.size)
+    cams = cams[shuffled]
+
+    cam_for_trig, latency, extra = match_photos(trigs, cams)
+    assert set(np.flatnonzero(cam_for_trig < 0)) == set(dropped) - set(doubled)
+    assert extra.size == np.isin(doubled, dropped, invert=True).sum()
+    matched = cam_for_trig >= 0
+    assert np.allclose(cams[cam_for_trig[matched]] - trigs[matched], latency[matched])
+    assert np.all((latency[matched] >= 0.02) & (latency[matched] <= 0.2))
+    assert np.unique(cam_for_trig[matched]).size == matched.sum()
+
+
+def test_match_photos_tolerance():
+    cam_for_trig, latency, extra = match_photos([0.0, 2.0, 4.0], [0.1, 2.9, 4.05], tolerance=0.5)
+    assert list(cam_for_trig) == [0, -1, 2]
+    assert list(extra) == [1]
+    cam_for_trig, latency, extra = match_photos([], [1.0])
+    assert cam_for_trig.size == 0 and list(extra) == [0]
+
+
+def test_photo_report_output(path="/tmp/trigmatch_test.csv"):
+    import os
+    from tests.healthtests import HealthTests
+
+    times = np.arange(10) * 2.0
+    trig = pd.DataFrame({"TimeUS": times * 1e6, "Img": np.arange(1, 11), "Lat": -22.0, "Lng": -47.0})
+    cam = pd.DataFrame({"TimeUS": (times + 0.1) * 1e6, "Img": np.arange(1, 11), "Lat": -22.0, "Lng": -47.0})
+    # no trigger logged for photo 4, no feedback for photo 7
+    trig = trig.drop(index=3)
+    cam = cam.drop(index=6)
+
+    report = HealthTests(None, None, None, cam, trig)
+    report.trig_test()
+    assert report.trig_missing == [7] and report.trig_extra == [3]
+    assert report.trig_detail == "Missing photos: 7. Extra photos: 4. Feedback latency p50 100.0 ms, p95 100.0 ms."
+
+    write_photo_report(report.photo_report, np.array(report.trig_extra), cam, path)
+    written = pd.read_csv(path)
+    assert written.loc[written["status"] != "ok", ["photo", "status"]].values.tolist() == [[7, "missing"], [4, "extra"]]
+    assert (written["status"] == "ok").sum() == 8
+    os.remove(path)
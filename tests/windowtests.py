@@ -0,0 +1,336 @@
+import heapq
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from tests.healthtests import MOTOR_CHANNELS, VIBE_AXES, CLIP_AXES, segment_stats
+
+
+def _times(chunk):
+    """
+     Timestamps of a chunk of samples as unix seconds.
+
+     @param chunk - pd.DataFrame indexed by datetime or by unix seconds
+
+     @return np.ndarray of float64
+    """
+    if isinstance(chunk.index, pd.DatetimeIndex):
+        return chunk.index.asi8 / 1e9
+    return chunk.index.to_numpy(dtype=np.float64)
+
+
+def _ffill(values, carry):
+    """
+     Forward fill NaN rows of each column, starting from a carried value.
+
+     @param values - array of shape (n, m)
+     @param carry - array of shape (m,) with the last value before the chunk
+
+     @return filled array of shape (n, m)
+    """
+    values = np.vstack([carry[None, :], values])
+    valid = ~np.isnan(values)
+    index = np.where(valid, np.arange(values.shape[0])[:, None], 0)
+    np.maximum.accumulate(index, axis=0, out=index)
+    return np.take_along_axis(values, index, axis=0)[1:]
+
+
+class SignalWindows:
+    def __init__(self, columns, window, stride):
+        """
+         Streaming windowed statistics of a group of signals. Samples are
+         reduced into stride-long bins (count, mean, M2, max, last) and each
+         window is the Welford/Chan combination of its window/stride bins,
+         so only the last window's bins are ever kept in memory.
+
+         @param columns - columns of the message used by the analysis
+         @param window - window length in seconds
+         @param stride - window step in seconds
+        """
+        self.columns = columns
+        self.stride = stride
+        self.bins = max(int(round(window / stride)), 1)
+        self.origin = None
+        self._pending = None
+        self._history = None
+        self._carry = np.full(len(columns), np.nan)
+
+    def _reduce(self, times, values):
+        """
+         Reduce a chunk of samples into bins.
+
+         @return dict of per-bin arrays keyed by id, count, mean, m2, max and last
+        """
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+        ids = np.floor((times - self.origin) / self.stride).astype(np.int64)
+        offsets = np.r_[0, np.flatnonzero(np.diff(ids)) + 1]
+        stats = segment_stats(values, offsets)
+        m2 = np.where(stats["count"] > 1, stats["std"] ** 2 * (stats["count"] - 1), 0.0)
+        last = _ffill(values, np.full(values.shape[1], np.nan))[np.r_[offsets[1:], ids.size] - 1]
+        return {
+            "id": ids[offsets],
+            "count": stats["count"].astype(np.float64),
+            "mean": np.nan_to_num(stats["mean"]),
+            "m2": np.nan_to_num(m2),
+            "max": stats["max"],
+            "last": last,
+        }
+
+    @staticmethod
+    def _merge(a, b):
+        """
+         Chan's parallel combination of two accumulators of the same bin.
+        """
+        n = a["count"] + b["count"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = b["mean"] - a["mean"]
+            weight = np.where(n > 0, b["count"] / n, 0.0)
+            m2 = a["m2"] + b["m2"] + np.where(n > 0, delta * delta * a["count"] * weight, 0.0)
+        return {
+            "id": a["id"],
+            "count": n,
+            "mean": a["mean"] + delta * weight,
+            "m2": m2,
+            "max": np.fmax(a["max"], b["max"]),
+            "last": np.where(np.isnan(b["last"]), a["last"], b["last"]),
+        }
+
+    def _densify(self, binned):
+        """
+         Insert empty bins for gaps so consecutive bins are one stride apart,
+         and carry the last value of each signal through them.
+        """
+        first = binned["id"][0] if self._history is None else self._history["id"][-1] + 1
+        ids = np.arange(first, binned["id"][-1] + 1)
+        slots = binned["id"] - first
+        m = len(self.columns)
+        dense = {
+            "id": ids,
+            "count": np.zeros((ids.size, m)),
+            "mean": np.zeros((ids.size, m)),
+            "m2": np.zeros((ids.size, m)),
+            "max": np.full((ids.size, m), np.nan),
+            "last": np.full((ids.size, m), np.nan),
+        }
+        for key in ["count", "mean", "m2", "max", "last"]:
+            dense[key][slots] = binned[key]
+        dense["last"] = _ffill(dense["last"], self._carry)
+        self._carry = dense["last"][-1]
+        return dense
+
+    def _windows(self, closed):
+        """
+         Combine the newly closed bins with the kept history into windows.
+
+         @return dict of per-window arrays (start, end, count, mean, std, max, delta)
+        """
+        kept = 0
+        if self._history is not None:
+            kept = self._history["id"].size
+            closed = {k: np.concatenate([self._history[k], closed[k]]) for k in closed}
+        # the bins of a partial window, plus one so every window knows the
+        # counters before it
+        self._history = {k: v[-self.bins:] for k, v in closed.items()}
+        total = closed["id"].size
+        first = max(kept - self.bins + 1, 0)
+        if total - self.bins + 1 <= first:
+            return None
+
+        view = lambda key: sliding_window_view(closed[key], self.bins, axis=0)[first:]
+        count = view("count").sum(axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = (view("count") * view("mean")).sum(axis=-1) / count
+            spread = view("count") * (view("mean") - mean[..., None]) ** 2
+            std = np.sqrt((view("m2").sum(axis=-1) + spread.sum(axis=-1)) / (count - 1))
+        before = np.vstack([np.full((1, len(self.columns)), np.nan), closed["last"][:-1]])
+        before = before[first: total - self.bins + 1]
+        last = closed["last"][first + self.bins - 1:]
+        end_id = closed["id"][first + self.bins - 1:]
+        return {
+            "start": self.origin + (end_id - self.bins + 1) * self.stride,
+            "end": self.origin + (end_id + 1) * self.stride,
+            "count": count,
+            "mean": mean,
+            "std": std,
+            "max": np.where(np.isnan(view("max")), -np.inf, view("max")).max(axis=-1),
+            "delta": last - np.where(np.isnan(before), 0.0, before),
+        }
+
+    def update(self, chunk):
+        """
+         Add a chunk of samples. The last bin stays open, since the next
+         chunk may continue it.
+
+         @param chunk - pd.DataFrame with the message columns
+
+         @return dict of per-window arrays for the windows closed by this chunk
+        """
+        chunk = chunk[self.columns]
+        if chunk.empty:
+            return None
+        times = _times(chunk)
+        if self.origin is None:
+            self.origin = np.floor(np.nanmin(times) / self.stride) * self.stride
+        binned = self._reduce(times, chunk.to_numpy(dtype=np.float64))
+
+        if self._pending is not None:
+            if binned["id"][0] == self._pending["id"][0]:
+                first = SignalWindows._merge(self._pending, {k: v[:1] for k, v in binned.items()})
+                binned = {k: np.concatenate([first[k], v[1:]]) for k, v in binned.items()}
+            else:
+                binned = {k: np.concatenate([self._pending[k], v]) for k, v in binned.items()}
+        self._pending = {k: v[-1:] for k, v in binned.items()}
+        if binned["id"].size == 1:
+            return None
+        return self._windows(self._densify({k: v[:-1] for k, v in binned.items()}))
+
+    def finalize(self):
+        """
+         Close the open bin and return the last windows.
+
+         @return dict of per-window arrays, or None
+        """
+        if self._pending is None:
+            return None
+        pending, self._pending = self._pending, None
+        bins = self.bins
+        if self._history is None or self._history["id"].size + 1 < bins:
+            # shorter than one window: a single window covering all of it
+            self.bins = 1 + (0 if self._history is None else self._history["id"].size)
+        windows = self._windows(self._densify(pending))
+        self.bins = bins
+        return windows
+
+
+class WindowedHealth:
+    signals = {"VIBE": VIBE_AXES + CLIP_AXES, "RCOU": MOTOR_CHANNELS, "POWR": ["Vcc"]}
+
+    def __init__(self, window=20.0, stride=5.0, top=5):
+        """
+         Initialize the object. It finds the worst windows of a flight for
+         vibration, accel clipping, motors imbalance and board voltage, so a
+         short burst is not diluted in whole-flight averages. Data is consumed
+         in chunks with online accumulators.
+
+         @param window - window length in seconds
+         @param stride - window step in seconds
+         @param top - number of worst windows reported per metric
+        """
+        self.window = window
+        self.stride = stride
+        self.top = top
+        self._signals = {
+            msg: SignalWindows(columns, window, stride) for msg, columns in WindowedHealth.signals.items()
+        }
+        self._worst = {metric: [] for metric in ["vibe", "vibe_peak", "clip", "motors", "vcc"]}
+
+    def scores(self, msg_type, windows):
+        """
+         Scores of each window for the metrics of a message type.
+
+         @return dict of metric name -> array of scores
+        """
+        if msg_type == "VIBE":
+            return {
+                "vibe": windows["mean"][:, :3].max(axis=1),
+                "vibe_peak": windows["max"][:, :3].max(axis=1),
+                "clip": windows["delta"][:, 3:].sum(axis=1),
+            }
+        if msg_type == "RCOU":
+            pwm = np.trunc(windows["mean"])
+            return {"motors": np.fmax(np.abs(pwm[:, 0] - pwm[:, 2]), np.abs(pwm[:, 1] - pwm[:, 3]))}
+        return {"vcc": windows["std"][:, 0]}
+
+    def collect(self, msg_type, windows):
+        """
+         Keep the best candidates of each metric. Enough candidates are kept
+         to still find `top` distinct windows after removing overlaps.
+        """
+        if windows is None:
+            return
+        keep = self.top * int(np.ceil(self.window / self.stride))
+        for metric, score in self.scores(msg_type, windows).items():
+            heap = self._worst[metric]
+            valid = np.flatnonzero(~np.isnan(score))
+            # ties go to the latest window, as in the heap's tuple order, so
+            # the result does not depend on how the samples were chunked
+            best = valid[np.lexsort((windows["start"][valid], score[valid]))[::-1][:keep]]
+            for i in best:
+                item = (float(score[i]), float(windows["start"][i]), float(windows["end"][i]))
+                if len(heap) < keep:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+    def update(self, msg_type, chunk):
+        """
+         Feed a chunk of decoded samples of one message type.
+
+         @param msg_type - "VIBE", "RCOU" or "POWR"
+         @param chunk - pd.DataFrame indexed by timestamp
+        """
+        if msg_type in self._signals:
+            self.collect(msg_type, self._signals[msg_type].update(chunk))
+
+    def finalize(self):
+        """
+         Close every signal and report the worst, non-overlapping windows.
+
+         @return dict of metric name -> pd.DataFrame (start, end, score)
+        """
+        for msg_type, signal in self._signals.items():
+            self.collect(msg_type, signal.finalize())
+
+        report = {}
+        for metric, heap in self._worst.items():
+            chosen = []
+            for score, start, end in sorted(heap, reverse=True):
+                if all(end <= s or start >= e for sc, s, e in chosen):
+                    chosen.append((score, start, end))
+                if len(chosen) == self.top:
+                    break
+            df = pd.DataFrame(chosen, columns=["score", "start", "end"])
+            df["start"] = pd.to_datetime(df["start"], unit="s", origin="unix")
+            df["end"] = pd.to_datetime(df["end"], unit="s", origin="unix")
+            report[metric] = df[["start", "end", "score"]]
+        return report
+
+    def run(self, df_dict, chunksize=10000):
+        """
+         Analyse decoded frames of a flight, fed in chunks. This is the main
+         method.
+
+         @param df_dict - dict of DataFrames keyed by message type
+         @param chunksize - samples per chunk
+
+         @return dict of metric name -> pd.DataFrame (start, end, score)
+        """
+        for msg_type in self._signals:
+            if msg_type in df_dict:
+                df = df_dict[msg_type]
+                for i in range(0, df.shape[0], chunksize):
+                    self.update(msg_type, df.iloc[i:i + chunksize])
+        return self.finalize()
+
+
+############################################################
+## tests
+############################################################
+
+def test_chunk_size_invariance():
+    from tests.streamtests import _random_flight
+
+    rng = np.random.default_rng(0)
+    frames = _random_flight(rng, 6000)
+    # a vibration burst and a gap in the log
+    frames["VIBE"].iloc[3000:3150, 0] += 40
+    frames["RCOU"] = frames["RCOU"].drop(frames["RCOU"].index[1000:1400])
+    frames = {msg: frames[msg] for msg in WindowedHealth.signals}
+
+    reference = WindowedHealth(20.0, 5.0).run(frames, chunksize=len(frames["VIBE"]))
+    top = reference["vibe"].iloc[0]
+    assert top["start"] <= frames["VIBE"].index[3000] and top["end"] >= frames["VIBE"].index[3149]
+    for chunksize in [3, 7, 333, 5000]:
+        report = WindowedHealth(20.0, 5.0).run(frames, chunksize=chunksize)
+        for metric, df in reference.items():
+            pd.testing.assert_frame_equal(report[metric], df, check_exact=False, rtol=1e-9)